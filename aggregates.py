@@ -0,0 +1,249 @@
+"""Índice de totales por período calendario (día, semana ISO y mes) y empleado.
+
+Cada turno cerrado suma sus horas en los tres buckets de la fecha de entrada
+(UTC), así que los totales de cualquier período son una búsqueda O(1) y el
+historial nunca se borra: la semana cambia sola en el límite de la semana ISO.
+
+Para los rankings, cada período consultado tiene además una lista ordenada
+[(horas, dni)]. Se arma la primera vez que se pide (no se persiste) y desde
+ahí cada turno cerrado la actualiza: la búsqueda es un bisect, pero sacar y
+reinsertar la fila (list.pop + insort) mueve el resto de la lista, así que la
+actualización es O(n) en empleados del período (un memmove, microsegundos con
+miles de empleados; ver benchmarks/bench_ranking.py). Las consultas sí son
+O(log n + k): top/bottom N y los filtros por horas salen de un recorte de la
+lista, sin ordenar a todos los empleados.
+
+Con SQLite el índice es parcial: en memoria están los períodos en curso
+(semana y mes, con sus días) y hasta MAX_FRIOS buckets de períodos pasados,
+los últimos que se usaron. Los reportes piden los que faltan con
+ShiftTracker.cargar_agregados (la consulta corre en el hilo de persistencia)
+antes de leerlos; un turno que cierra en un período pasado que no está en
+memoria solo se suma en la base.
+
+Claves de bucket:
+- día:    'YYYY-MM-DD'
+- semana: 'YYYY-Www'  (semana ISO, ej. '2026-W42')
+- mes:    'YYYY-MM'
+"""
+import re
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from operator import itemgetter
+
+MAX_FRIOS = 64  # Buckets de períodos pasados en memoria con SQLite (un mes con sus días son 32)
+
+PATRON_DIA = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+PATRON_SEMANA = re.compile(r'^(\d{4})-W(\d{2})$', re.IGNORECASE)
+PATRON_MES = re.compile(r'^(\d{4})-(\d{2})$')
+
+
+def clave_dia(momento):
+    return momento.strftime('%Y-%m-%d')
+
+
+def clave_semana(momento):
+    anio, semana, _ = momento.isocalendar()
+    return f'{anio}-W{semana:02d}'
+
+
+def clave_mes(momento):
+    return momento.strftime('%Y-%m')
+
+
+def parsear_periodo(texto):
+    """Normaliza una clave de período escrita por un usuario. Devuelve None si no es válida"""
+    if not texto:
+        return None
+    try:
+        if PATRON_DIA.match(texto):
+            return clave_dia(date.fromisoformat(texto))
+        match = PATRON_SEMANA.match(texto)
+        if match:
+            date.fromisocalendar(int(match.group(1)), int(match.group(2)), 1)
+            return f'{match.group(1)}-W{match.group(2)}'
+        match = PATRON_MES.match(texto)
+        if match and 1 <= int(match.group(2)) <= 12:
+            return texto
+    except ValueError:
+        return None
+    return None
+
+
+def dias_del_periodo(clave):
+    """Claves de día que forman una semana o un mes (o el propio día)"""
+    match = PATRON_SEMANA.match(clave)
+    if match:
+        lunes = date.fromisocalendar(int(match.group(1)), int(match.group(2)), 1)
+        return [clave_dia(lunes + timedelta(days=i)) for i in range(7)]
+    match = PATRON_MES.match(clave)
+    if match:
+        primero = date(int(match.group(1)), int(match.group(2)), 1)
+        siguiente = date(primero.year + primero.month // 12, primero.month % 12 + 1, 1)
+        return [clave_dia(primero + timedelta(days=i)) for i in range((siguiente - primero).days)]
+    return [clave]
+
+
+def periodos_en_curso(momento):
+    """Claves de la semana ISO y el mes de `momento`, con todos sus días"""
+    semana, mes = clave_semana(momento), clave_mes(momento)
+    return {semana, mes, *dias_del_periodo(semana), *dias_del_periodo(mes)}
+
+
+class AggregateIndex:
+    """Totales incrementales {bucket: {dni: [horas, entradas]}} más el último nombre de cada DNI"""
+
+    def __init__(self):
+        self.buckets = {}
+        self.nombres = {}
+        self._orden = {}  # {bucket: [(horas, dni)] ordenada}, solo de los períodos ya rankeados
+        # Con SQLite: un bucket que no está en memoria no está vacío, está en la base
+        self.parcial = False
+        self._frios = OrderedDict()  # Buckets pasados en memoria, del menos al más usado
+        self._en_carga = {}  # {bucket: [(dni, horas)]} turnos cerrados mientras se lee de la base
+        self._calientes = (None, set())  # (día, periodos_en_curso de ese día)
+
+    def _en_curso(self):
+        hoy = clave_dia(datetime.now(timezone.utc))
+        if self._calientes[0] != hoy:
+            self._calientes = (hoy, periodos_en_curso(datetime.now(timezone.utc)))
+        return self._calientes[1]
+
+    def _filas(self, clave):
+        """{dni: [horas, entradas]} del bucket en memoria (None si no está)"""
+        if clave in self._frios:
+            self._frios.move_to_end(clave)
+        return self.buckets.get(clave)
+
+    def faltantes(self, claves):
+        """Claves que hay que leer de la base antes de consultarlas (ninguna si el índice está completo)"""
+        if not self.parcial:
+            return []
+        return [clave for clave in dict.fromkeys(claves) if clave not in self.buckets]
+
+    def iniciar_carga(self, claves):
+        """Desde acá, los turnos de esos buckets se anotan para sumarlos cuando llegue la lectura"""
+        for clave in claves:
+            self._en_carga[clave] = []
+
+    def completar_carga(self, clave, filas):
+        """Instala un bucket leído de la base (con los turnos cerrados mientras tanto) y descarta los viejos"""
+        for dni, horas in self._en_carga.pop(clave, ()):
+            fila = filas.setdefault(dni, [0.0, 0])
+            fila[0] += horas
+            fila[1] += 1
+        self.buckets[clave] = filas
+        self._orden.pop(clave, None)
+        self.descartar_frios()
+
+    def cancelar_carga(self, claves):
+        for clave in claves:
+            self._en_carga.pop(clave, None)
+
+    def descartar_frios(self):
+        """Pasa a la cola de períodos pasados los que dejaron de estar en curso y deja solo MAX_FRIOS"""
+        if not self.parcial:
+            return
+        en_curso = self._en_curso()
+        for clave in self.buckets:
+            if clave not in en_curso and clave not in self._frios:
+                self._frios[clave] = None
+        while len(self._frios) > MAX_FRIOS:
+            clave, _ = self._frios.popitem(last=False)
+            self.buckets.pop(clave, None)
+            self._orden.pop(clave, None)
+
+    def agregar(self, dni, nombre, entrada, horas):
+        """Suma un turno cerrado en los buckets de día, semana y mes de su entrada"""
+        self.nombres[dni] = nombre
+        for clave in (clave_dia(entrada), clave_semana(entrada), clave_mes(entrada)):
+            filas = self._filas(clave)
+            if filas is None:
+                if self.parcial and clave not in self._en_curso():
+                    # Período pasado fuera de memoria: ya se suma en la base
+                    if clave in self._en_carga:
+                        self._en_carga[clave].append((dni, horas))
+                    continue
+                filas = self.buckets[clave] = {}
+            fila = filas.get(dni)
+            orden = self._orden.get(clave)
+            if fila is None:
+                fila = filas[dni] = [horas, 1]
+            else:
+                if orden is not None:
+                    # O(n): pop e insort desplazan la cola de la lista
+                    orden.pop(bisect_left(orden, (fila[0], dni)))
+                fila[0] += horas
+                fila[1] += 1
+            if orden is not None:
+                insort(orden, (fila[0], dni))
+
+    def total(self, clave, dni):
+        """(horas, entradas) de un empleado en un período"""
+        fila = (self._filas(clave) or {}).get(dni)
+        return (fila[0], fila[1]) if fila else (0.0, 0)
+
+    def periodo(self, clave):
+        """{dni: [horas, entradas]} de todos los empleados con turnos en el período"""
+        return self._filas(clave) or {}
+
+    def ranking(self, clave, cantidad=None, desde_abajo=False, menos_de=None, mas_de=None):
+        """[(dni, horas, entradas)] del período por horas: de mayor a menor, o de menor a mayor con `desde_abajo`.
+
+        `menos_de`/`mas_de` dejan solo a los empleados con menos/más horas que
+        el umbral; `cantidad` corta el resultado (top/bottom N).
+        """
+        orden = self._orden.get(clave)
+        if orden is None:
+            orden = sorted((fila[0], dni) for dni, fila in self.periodo(clave).items())
+            if clave in self.buckets:
+                self._orden[clave] = orden
+        inicio = 0 if mas_de is None else bisect_right(orden, mas_de, key=itemgetter(0))
+        fin = len(orden) if menos_de is None else bisect_left(orden, menos_de, key=itemgetter(0))
+        if inicio >= fin:
+            return []
+        if cantidad is not None:
+            if desde_abajo:
+                fin = min(fin, inicio + cantidad)
+            else:
+                inicio = max(inicio, fin - cantidad)
+        filas = self.buckets[clave]
+        seleccion = orden[inicio:fin] if desde_abajo else reversed(orden[inicio:fin])
+        return [(dni, horas, filas[dni][1]) for horas, dni in seleccion]
+
+    def desglose_diario(self, clave, dni):
+        """[(fecha, horas, entradas)] de los días del período con turnos del empleado"""
+        resultado = []
+        for dia in dias_del_periodo(clave):
+            fila = (self._filas(dia) or {}).get(dni)
+            if fila:
+                resultado.append((dia, fila[0], fila[1]))
+        return resultado
+
+    def limpiar(self):
+        self.buckets.clear()
+        self.nombres.clear()
+        self._orden.clear()
+        # Desde acá lo que hay en memoria es todo: la base puede tener todavía el borrado sin escribir
+        self.parcial = False
+        self._frios.clear()
+        self._en_carga.clear()
+
+    def exportar(self):
+        """Copia serializable (no comparte listas con el índice) de los buckets en memoria"""
+        return {
+            'buckets': {
+                clave: {dni: list(fila) for dni, fila in filas.items()}
+                for clave, filas in self.buckets.items()
+            },
+            'nombres': dict(self.nombres)
+        }
+
+    def cargar(self, data):
+        self.buckets = {
+            clave: {dni: list(fila) for dni, fila in filas.items()}
+            for clave, filas in data.get('buckets', {}).items()
+        }
+        self.nombres = dict(data.get('nombres', {}))
+        self._orden = {}
+        self._frios.clear()
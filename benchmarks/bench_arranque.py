@@ -0,0 +1,104 @@
+"""Benchmark del arranque: snapshot JSON contra snapshot binario.
+
+Arma un año sintético de turnos (el mismo generador de bench_memoria.py),
+lo guarda en los dos formatos y mide lo que hace load_data() antes de que el
+bot pueda responder: leer el snapshot y restaurar el historial. Con JSON se
+parsea todo y se llama a datetime.fromisoformat en cada turno; con el
+binario solo se decodifica la semana actual y el resto queda frío.
+
+Uso (desde la raíz del repo):
+    python benchmarks/bench_arranque.py [empleados] [dias]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from aggregates import AggregateIndex, clave_semana, dias_del_periodo  # noqa: E402
+from bench_memoria import generar_turnos  # noqa: E402
+from registros import HistorialTurnos  # noqa: E402
+from storage import (  # noqa: E402
+    escribir_snapshot, escribir_snapshot_binario, leer_snapshot, leer_snapshot_binario
+)
+
+REPETICIONES = 3
+
+
+def armar_snapshot(empleados, dias):
+    historial = HistorialTurnos()
+    agregados = AggregateIndex()
+    ultima = None
+    for fecha, dni, nombre, entrada, salida in generar_turnos(empleados, dias):
+        historial.agregar(fecha, dni, nombre, entrada, salida)
+        agregados.agregar(dni, nombre, entrada, (salida - entrada).total_seconds() / 3600)
+        ultima = salida
+    data = {
+        'journal_seq': 0,
+        'scan_cursor': None,
+        'mensajes_aplicados': [],
+        'active_shifts': {},
+        'daily_records': historial,
+        'aggregates': agregados.exportar()
+    }
+    return data, len(historial), ultima
+
+
+def cargar_json(path, ultima):
+    """Lo que hace load_data() con un shift_data.json"""
+    data = leer_snapshot(path)
+    historial = HistorialTurnos()
+    historial.cargar(data['daily_records'])
+    AggregateIndex().cargar(data['aggregates'])
+    return historial
+
+
+def cargar_binario(path, ultima):
+    """Lo que hace load_data() con un shift_data.snap"""
+    data = leer_snapshot_binario(path)
+    historial = data['daily_records']
+    historial.precargar(dias_del_periodo(clave_semana(ultima)))
+    AggregateIndex().cargar(data['aggregates'])
+    return historial
+
+
+def medir(nombre, cargar, path, ultima):
+    mejor = float('inf')
+    for _ in range(REPETICIONES):
+        inicio = time.perf_counter()
+        historial = cargar(path, ultima)
+        mejor = min(mejor, time.perf_counter() - inicio)
+    print(f"   {nombre:<10} {os.path.getsize(path) / 1024 / 1024:>7.1f} MiB en disco  arranque {mejor * 1000:>8.1f} ms")
+    return historial, mejor
+
+
+def main():
+    empleados = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    dias = int(sys.argv[2]) if len(sys.argv) > 2 else 365
+    data, cantidad, ultima = armar_snapshot(empleados, dias)
+    print(f"📊 {cantidad:,} turnos ({empleados} empleados, {dias} días):")
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        path_json = os.path.join(carpeta, 'shift_data.json')
+        path_bin = os.path.join(carpeta, 'shift_data.snap')
+        escribir_snapshot(data, path_json)
+        escribir_snapshot_binario(data, path_bin)
+
+        desde_json, tiempo_json = medir('JSON', cargar_json, path_json, ultima)
+        desde_bin, tiempo_bin = medir('binario', cargar_binario, path_bin, ultima)
+        print(f"   Arranque {tiempo_json / tiempo_bin:.1f}x más rápido")
+
+        # Primer reporte que toca un día frío: se decodifica una sola vez
+        fecha_fria = next(iter(desde_bin.fechas()))
+        inicio = time.perf_counter()
+        desde_bin.dia(fecha_fria)
+        print(f"   Primer acceso a un día frío: {(time.perf_counter() - inicio) * 1000:.2f} ms")
+
+        correcto = desde_bin.exportar() == desde_json.exportar()
+    print("✅ Mismos turnos en ambos formatos" if correcto else "❌ Los formatos no coinciden")
+    sys.exit(0 if correcto else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Benchmark del autocompletado de DNI/nombre de los comandos de barra.
+
+Carga un directorio sintético de empleados y mide buscar() con consultas
+típicas (principio del DNI, solo números, final del DNI, parte del nombre)
+contra el límite de 1 ms por búsqueda.
+
+Uso (desde la raíz del repo):
+    python benchmarks/bench_autocompletar.py [empleados]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from directorio import DirectorioEmpleados  # noqa: E402
+
+REPETICIONES = 2000
+LIMITE_MS = 1.0
+NOMBRES = ('Juan', 'Ana', 'José', 'María', 'Lucía', 'Martín', 'Sofía', 'Diego')
+APELLIDOS = ('Pérez', 'Gómez', 'Fernández', 'López', 'Díaz', 'Romero', 'Sosa', 'Núñez')
+CONSULTAS = ('L', 'LCR3', '35', '355', '534', 'jo', 'maria', 'fern', 'PDA10646', 'zzz')
+
+
+def generar_empleados(cantidad, semilla=42):
+    azar = random.Random(semilla)
+    return {
+        f"{azar.choice(('LCR', 'PDA', 'ABC'))}{azar.randrange(100_000):05d}":
+            f"{azar.choice(NOMBRES)} {azar.choice(APELLIDOS)}"
+        for _ in range(cantidad)
+    }
+
+
+def main():
+    cantidad = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    empleados = generar_empleados(cantidad)
+    directorio = DirectorioEmpleados()
+    inicio = time.perf_counter()
+    directorio.cargar(empleados)
+    print(f"📊 {len(directorio):,} empleados (índice armado en {(time.perf_counter() - inicio) * 1000:.1f} ms):")
+
+    peor = 0.0
+    for consulta in CONSULTAS:
+        inicio = time.perf_counter()
+        for _ in range(REPETICIONES):
+            resultados = directorio.buscar(consulta)
+        promedio_ms = (time.perf_counter() - inicio) * 1000 / REPETICIONES
+        peor = max(peor, promedio_ms)
+        print(f"   {consulta!r:<12} {len(resultados):>3} resultados  {promedio_ms * 1000:>7.1f} µs")
+
+    correcto = peor < LIMITE_MS
+    print(f"✅ Peor búsqueda: {peor * 1000:.1f} µs" if correcto else f"❌ Peor búsqueda: {peor:.2f} ms")
+    sys.exit(0 if correcto else 1)
+
+
+if __name__ == '__main__':
+    main()
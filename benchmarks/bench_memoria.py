@@ -0,0 +1,109 @@
+"""Benchmark de memoria del historial de turnos.
+
+Carga un año sintético de turnos para varios cientos de empleados con el
+formato anterior (defaultdict de listas de dicts con dos datetime, un float y
+el nombre) y con registros.HistorialTurnos (columnas compactas por día), y
+compara la memoria de cada uno medida con tracemalloc.
+
+Uso (desde la raíz del repo):
+    python benchmarks/bench_memoria.py [empleados] [dias]
+"""
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from registros import HistorialTurnos  # noqa: E402
+
+
+def generar_turnos(empleados, dias, semilla=42):
+    """(fecha, dni, nombre, entrada, salida) de 1 a 3 turnos por día hábil de cada empleado.
+
+    Los momentos tienen precisión de milisegundos, como message.created_at.
+    """
+    azar = random.Random(semilla)
+    inicio = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    personal = [(f'LCR{10000 + i:05d}', f'Empleado Numero {i}') for i in range(empleados)]
+    for dia in range(dias):
+        base = inicio + timedelta(days=dia)
+        fecha = base.strftime('%Y-%m-%d')
+        for dni, nombre in personal:
+            if azar.random() < 0.3:
+                continue  # Franco
+            momento = base + timedelta(milliseconds=azar.randint(6, 10) * 3_600_000)
+            for _ in range(azar.randint(1, 3)):
+                salida = momento + timedelta(milliseconds=azar.randint(3_600_000, 4 * 3_600_000))
+                # Cada turno llega de un mensaje distinto: strings nuevos, como en on_message
+                yield fecha, dni[:3] + dni[3:], nombre[:1] + nombre[1:], momento, salida
+                momento = salida + timedelta(milliseconds=azar.randint(600_000, 3_600_000))
+
+
+def cargar_anterior(turnos):
+    daily_records = defaultdict(lambda: defaultdict(list))
+    for fecha, dni, nombre, entrada, salida in turnos:
+        daily_records[fecha][dni].append({
+            'entrada': entrada,
+            'salida': salida,
+            'horas': (salida - entrada).total_seconds() / 3600,
+            'nombre': nombre
+        })
+    return daily_records
+
+
+def cargar_compacto(turnos):
+    historial = HistorialTurnos()
+    for fecha, dni, nombre, entrada, salida in turnos:
+        historial.agregar(fecha, dni, nombre, entrada, salida)
+    return historial
+
+
+def medir(nombre, cargar, turnos):
+    """Memoria retenida por la estructura (los turnos de entrada ya están en memoria)"""
+    gc.collect()
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    estructura = cargar(turnos)
+    duracion = time.perf_counter() - inicio
+    gc.collect()
+    memoria, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"   {nombre:<22} {memoria / 1024 / 1024:>8.1f} MiB  "
+          f"{memoria / len(turnos):>7.1f} bytes/turno  carga {duracion:.2f}s")
+    return estructura, memoria
+
+
+def verificar(anterior, compacto):
+    """El formato compacto devuelve los mismos turnos (a precisión de milisegundos)"""
+    for fecha, records in anterior.items():
+        dia = compacto.dia(fecha)
+        for dni, turnos in records.items():
+            for original, turno in zip(turnos, dia[dni], strict=True):
+                if (original['entrada'] != turno['entrada'] or original['salida'] != turno['salida']
+                        or abs(original['horas'] - turno['horas']) > 1e-9 or original['nombre'] != turno['nombre']):
+                    return False
+    return True
+
+
+def main():
+    empleados = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    dias = int(sys.argv[2]) if len(sys.argv) > 2 else 365
+    turnos = list(generar_turnos(empleados, dias))
+    print(f"📊 {len(turnos):,} turnos ({empleados} empleados, {dias} días):")
+
+    anterior, memoria_anterior = medir('anterior (dicts)', cargar_anterior, turnos)
+    compacto, memoria_compacto = medir('HistorialTurnos', cargar_compacto, turnos)
+    print(f"   Reducción: {memoria_anterior / memoria_compacto:.1f}x")
+
+    correcto = verificar(anterior, compacto)
+    print("✅ Mismos turnos en ambos formatos" if correcto else "❌ Los formatos no coinciden")
+    sys.exit(0 if correcto else 1)
+
+
+if __name__ == '__main__':
+    main()
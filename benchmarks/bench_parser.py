@@ -0,0 +1,87 @@
+"""Benchmark del parser de mensajes de ServicioAPP.
+
+Verifica el parser contra corpus_servicio.jsonl y mide el throughput del
+método anterior (dos re.search con patrones inline por mensaje) frente a
+servicio_parser.parsear_mensaje y parsear_lote.
+
+Uso (desde la raíz del repo):
+    python benchmarks/bench_parser.py [cantidad_de_mensajes]
+"""
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from servicio_parser import parsear_lote, parsear_mensaje  # noqa: E402
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus_servicio.jsonl')
+
+
+def cargar_corpus():
+    with open(CORPUS, 'r', encoding='utf-8') as f:
+        return [json.loads(linea) for linea in f if linea.strip()]
+
+
+def parsear_anterior(contenido):
+    """Implementación previa de on_message/escanear_historial"""
+    patron_entrada = r'\*?\*?\[([A-Z]{3}\d{5})\]\s+([^\*]+?)\*?\*?\s+ha entrado en servicio'
+    patron_salida = r'\*?\*?\[([A-Z]{3}\d{5})\]\s+([^\*]+?)\*?\*?\s+ha salido de servicio'
+    match_entrada = re.search(patron_entrada, contenido, re.IGNORECASE)
+    match_salida = re.search(patron_salida, contenido, re.IGNORECASE)
+    if match_entrada:
+        return ('entrada', match_entrada.group(1).upper(), match_entrada.group(2).strip())
+    if match_salida:
+        return ('salida', match_salida.group(1).upper(), match_salida.group(2).strip())
+    return None
+
+
+def verificar(casos):
+    errores = 0
+    for caso in casos:
+        evento = parsear_mensaje(caso['contenido'])
+        obtenido = list(evento) if evento else None
+        if obtenido != caso['esperado']:
+            errores += 1
+            print(f"❌ {caso['contenido']!r}: esperado {caso['esperado']}, obtenido {obtenido}")
+    lote = parsear_lote([caso['contenido'] for caso in casos])
+    if lote != [parsear_mensaje(caso['contenido']) for caso in casos]:
+        errores += 1
+        print("❌ parsear_lote no coincide con parsear_mensaje")
+    return errores
+
+
+def medir(nombre, funcion, mensajes):
+    inicio = time.perf_counter()
+    funcion(mensajes)
+    duracion = time.perf_counter() - inicio
+    print(f"   {nombre:<28} {len(mensajes) / duracion:>12,.0f} mensajes/s")
+
+
+def main():
+    cantidad = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    casos = cargar_corpus()
+    errores = verificar(casos)
+    print(f"✅ Corpus: {len(casos) - errores}/{len(casos)} casos correctos")
+
+    contenidos = [caso['contenido'] for caso in casos]
+    eventos = [caso['contenido'] for caso in casos if caso['esperado']]
+    escenarios = {
+        # Mensajes de ServicioAPP (casi todos son eventos)
+        'solo eventos': (eventos * (cantidad // len(eventos) + 1))[:cantidad],
+        # Tráfico mezclado como el que ve on_message antes de filtrar
+        'corpus completo': (contenidos * (cantidad // len(contenidos) + 1))[:cantidad],
+    }
+    for escenario, mensajes in escenarios.items():
+        print(f"📊 {escenario} ({len(mensajes):,} mensajes):")
+        medir('anterior (2 x re.search)', lambda ms: [parsear_anterior(m) for m in ms], mensajes)
+        medir('parsear_mensaje', lambda ms: [parsear_mensaje(m) for m in ms], mensajes)
+        medir('parsear_lote', parsear_lote, mensajes)
+
+    sys.exit(1 if errores else 0)
+
+
+if __name__ == '__main__':
+    main()
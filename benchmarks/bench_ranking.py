@@ -0,0 +1,66 @@
+"""Benchmark de !ranking sobre el índice ordenado de agregados.
+
+Carga un mes sintético de turnos, arma el ranking de la semana y después mide
+el costo de mantenerlo (cada turno cerrado) y de consultarlo (top/bottom N y
+filtros por horas) contra ordenar todos los totales en cada consulta.
+
+Uso (desde la raíz del repo):
+    python benchmarks/bench_ranking.py [empleados]
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from aggregates import AggregateIndex, clave_semana  # noqa: E402
+
+REPETICIONES = 2000
+INICIO = datetime(2026, 10, 1, tzinfo=timezone.utc)
+
+
+def cargar(agregados, empleados, azar):
+    for dia in range(31):
+        for i in range(empleados):
+            entrada = INICIO + timedelta(days=dia, hours=azar.choice((6, 14, 22)))
+            agregados.agregar(f'LCR{i:05d}', f'Empleado {i}', entrada, azar.uniform(6, 9))
+
+
+def medir(funcion):
+    inicio = time.perf_counter()
+    for _ in range(REPETICIONES):
+        funcion()
+    return (time.perf_counter() - inicio) * 1e6 / REPETICIONES
+
+
+def main():
+    empleados = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    azar = random.Random(42)
+    agregados = AggregateIndex()
+    cargar(agregados, empleados, azar)
+    semana = clave_semana(INICIO + timedelta(days=14))
+    inicio = time.perf_counter()
+    agregados.ranking(semana)
+    print(f"📊 {empleados:,} empleados, semana {semana} (índice armado en {(time.perf_counter() - inicio) * 1000:.1f} ms):")
+
+    def turno():
+        entrada = INICIO + timedelta(days=14, hours=azar.randrange(24))
+        agregados.agregar(f'LCR{azar.randrange(empleados):05d}', 'Empleado', entrada, azar.uniform(0.1, 1))
+
+    def ordenar_todo():
+        return sorted(agregados.periodo(semana).items(), key=lambda x: x[1][0], reverse=True)[:10]
+
+    for nombre, funcion in (
+        ("turno cerrado", turno),
+        ("top 10", lambda: agregados.ranking(semana, 10)),
+        ("bottom 10", lambda: agregados.ranking(semana, 10, desde_abajo=True)),
+        ("menos de 45h", lambda: agregados.ranking(semana, menos_de=45.0)),
+        ("sort completo", ordenar_todo),
+    ):
+        print(f"   {nombre:<15} {medir(funcion):>9.1f} µs")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Verificación de consistencia de los backends de persistencia.
+
+Corre escenarios de eventos fuera de orden contra JSON (snapshot + journal) y
+SQLite, reinicia el tracker desde disco (load_data) y compara el estado con el
+que quedó en memoria. Sale con código 1 si algún backend no coincide.
+
+Uso (desde la raíz del repo):
+    python benchmarks/consistencia.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import storage  # noqa: E402
+from aggregates import clave_mes  # noqa: E402
+from tracker import ShiftTracker  # noqa: E402
+
+DISCORD_EPOCH_MS = 1420070400000
+
+
+def snowflake(momento, secuencia=0):
+    return ((int(momento.timestamp() * 1000) - DISCORD_EPOCH_MS) << 22) | secuencia
+
+
+def backends(carpeta):
+    datos = os.path.join(carpeta, 'shift_data')
+    return {
+        'json': lambda: storage.JsonStorage(storage.ShiftJournal(f'{datos}.journal'), f'{datos}.json'),
+        'sqlite': lambda: storage.SqliteStorage(f'{datos}.db'),
+    }
+
+
+def estado(tracker, mes):
+    return (
+        {dni: info['entrada'] for dni, info in tracker.active_shifts.items()},
+        {dni: (round(horas, 6), entradas) for dni, (horas, entradas) in tracker.agregados.periodo(mes).items()},
+    )
+
+
+def entrada_atrasada(tracker):
+    """Entrada en vivo a las 10:00; un escaneo trae después una entrada a las 08:00 y su salida a las 09:00"""
+    dia = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1)
+    vivo, vieja, salida = dia.replace(hour=10), dia.replace(hour=8), dia.replace(hour=9)
+    tracker.registrar_entrada('LCR00001', 'Ana', vivo, snowflake(vivo))
+    tracker.registrar_entrada('LCR00001', 'Ana', vieja, snowflake(vieja))
+    tracker.registrar_salida('LCR00001', 'Ana', salida, snowflake(salida))
+    return clave_mes(dia), {'LCR00001': vivo}, {'LCR00001': (1.0, 1)}
+
+
+def atrasada_tras_snapshot(tracker):
+    """Como entrada_atrasada, pero con un snapshot entre la entrada atrasada y su salida"""
+    dia = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1)
+    vivo, vieja, salida = dia.replace(hour=10), dia.replace(hour=8), dia.replace(hour=9)
+    tracker.registrar_entrada('LCR00003', 'Caro', vivo, snowflake(vivo))
+    tracker.registrar_entrada('LCR00003', 'Caro', vieja, snowflake(vieja))
+    tracker.compactar()
+    tracker.registrar_salida('LCR00003', 'Caro', salida, snowflake(salida))
+    return clave_mes(dia), {'LCR00003': vivo}, {'LCR00003': (1.0, 1)}
+
+
+def reescaneo_fuera_de_retencion(tracker):
+    """Turno de hace 80 días escaneado, purga del índice de duplicados y segundo escaneo: no se suma nunca"""
+    entrada = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(days=80)
+    salida = entrada + timedelta(hours=8)
+    for _ in range(2):
+        tracker.registrar_entrada('LCR00002', 'Beto', entrada, snowflake(entrada))
+        tracker.registrar_salida('LCR00002', 'Beto', salida, snowflake(salida))
+        tracker.purgar_mensajes_aplicados()
+    return clave_mes(entrada), {}, {}
+
+
+ESCENARIOS = (entrada_atrasada, atrasada_tras_snapshot, reescaneo_fuera_de_retencion)
+
+
+def main():
+    fallos = 0
+    for escenario in ESCENARIOS:
+        for nombre, crear in backends(tempfile.mkdtemp(prefix='consistencia_')).items():
+            tracker = ShiftTracker(crear())
+            mes, activos, totales = escenario(tracker)
+            en_memoria = estado(tracker, mes)
+            tracker.storage.close()
+
+            reiniciado = ShiftTracker(crear())
+            reiniciado.load_data()
+            asyncio.run(reiniciado.cargar_agregados([mes]))  # Con SQLite un mes pasado se lee de la base
+            en_disco = estado(reiniciado, mes)
+            reiniciado.storage.close()
+
+            correcto = en_memoria == en_disco == (activos, totales)
+            fallos += not correcto
+            print(f"{'✅' if correcto else '❌'} {escenario.__name__} [{nombre}]"
+                  + ('' if correcto else f"\n   esperado {(activos, totales)}\n   memoria  {en_memoria}\n   disco    {en_disco}"))
+    sys.exit(1 if fallos else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+"""Replay de mensajes de Servicio: prueba de carga del camino de ingesta.
+
+Reproduce un día sintético de cambios de turno (ráfagas a las 06, 14 y 22 hs)
+o un stream grabado en JSONL ({"id", "created_at", "content"} por línea) y mide
+eventos por segundo, latencia p50/p99 del handler y memoria.
+
+Modos:
+- por defecto: cada mensaje entra por bot.on_message con un cliente falso
+  (canales locales, sin conexión a Discord), con writer de persistencia y
+  notificador corriendo en el mismo loop, como en producción
+- --nucleo: solo el parser y tracker.py (cola de ingesta, tracker, persistencia
+  y totales), sin importar discord.py
+
+Con --concurrencia N se despachan N mensajes a la vez, cada uno en su tarea
+como hace discord.py en una ráfaga: el escritor único los aplica en lotes.
+
+Uso (desde la raíz del repo):
+    python benchmarks/replay.py [--empleados 10000] [--nucleo] [--concurrencia 1]
+                                [--archivo stream.jsonl] [--guardar stream.jsonl] [--tracemalloc]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+DISCORD_EPOCH_MS = 1420070400000
+CANAL_SERVICIO = 1001
+CANAL_COMANDOS = 1002
+AUTOR_SERVICIO = 2001
+CAMBIOS_DE_TURNO = (6, 14, 22)
+PROPORCION_RUIDO = 0.05  # Mensajes del canal que no son entradas/salidas
+RETENCION_DEDUPE_DIAS = 60  # La del bot por defecto; un stream grabado más viejo la estira
+
+
+def generar_mensajes(empleados, semilla=42):
+    """(id, created_at, contenido) de un día de turnos de 8 hs, en orden de llegada.
+
+    Cada empleado entra cerca de un cambio de turno (06, 14 o 22 hs, ± 10 min)
+    y sale unas 8 hs después; los del turno noche salen al día siguiente. El
+    día es ayer: los mensajes quedan dentro de la retención de duplicados.
+    """
+    azar = random.Random(semilla)
+    dia = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1)
+    mensajes = []
+    for i in range(empleados):
+        dni, nombre = f'LCR{10000 + i:05d}', f'Empleado Numero {i}'
+        entrada = dia + timedelta(hours=CAMBIOS_DE_TURNO[i % 3], milliseconds=azar.randint(-600_000, 600_000))
+        salida = entrada + timedelta(milliseconds=azar.randint(7 * 3_600_000, 9 * 3_600_000))
+        mensajes.append((entrada, f'**[{dni}] {nombre}** ha entrado en servicio'))
+        mensajes.append((salida, f'**[{dni}] {nombre}** ha salido de servicio'))
+        if azar.random() < PROPORCION_RUIDO * 2:
+            mensajes.append((entrada, 'Recordatorio: completar el parte diario'))
+    mensajes.sort(key=lambda mensaje: mensaje[0])
+    # Snowflakes como los de Discord: timestamp en los bits altos, secuencia en los bajos
+    return [
+        (((int(momento.timestamp() * 1000) - DISCORD_EPOCH_MS) << 22) | (n & 0xFFF), momento, contenido)
+        for n, (momento, contenido) in enumerate(mensajes)
+    ]
+
+
+def leer_mensajes(path):
+    mensajes = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for linea in f:
+            if linea.strip():
+                item = json.loads(linea)
+                mensajes.append((int(item['id']), datetime.fromisoformat(item['created_at']), item['content']))
+    return mensajes
+
+
+def retencion_dedupe(mensajes):
+    """Días de retención de duplicados que cubren el mensaje más viejo (los anteriores se ignorarían)"""
+    mas_viejo = min((momento for _, momento, _ in mensajes), default=datetime.now(timezone.utc))
+    return max(RETENCION_DEDUPE_DIAS, (datetime.now(timezone.utc) - mas_viejo).days + 1)
+
+
+def guardar_mensajes(mensajes, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        for message_id, momento, contenido in mensajes:
+            f.write(json.dumps(
+                {'id': message_id, 'created_at': momento.isoformat(), 'content': contenido}, ensure_ascii=False
+            ) + '\n')
+
+
+def percentil(valores, p):
+    """valores ya ordenados"""
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+def memoria_maxima_mib():
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 1024 / 1024 if sys.platform == 'darwin' else maxrss / 1024  # bytes en macOS, KiB en Linux
+
+
+async def despachar(mensajes, manejar, concurrencia):
+    """Cada mensaje en su tarea, de a `concurrencia` a la vez; devuelve (latencias, duración)"""
+    latencias = []
+
+    async def medir(mensaje):
+        inicio = time.perf_counter()
+        await manejar(mensaje)
+        latencias.append(time.perf_counter() - inicio)
+
+    inicio = time.perf_counter()
+    for i in range(0, len(mensajes), concurrencia):
+        await asyncio.gather(*(medir(mensaje) for mensaje in mensajes[i:i + concurrencia]))
+    return latencias, time.perf_counter() - inicio
+
+
+async def replay_nucleo(mensajes, carpeta, concurrencia):
+    """Solo el núcleo de ingesta: mismo parser, escritor único, tracker y persistencia que el bot"""
+    import storage
+    from servicio_parser import parsear_mensaje
+    from tracker import ColaIngesta, ShiftTracker
+
+    datos = os.path.join(carpeta, 'shift_data')
+    tracker = ShiftTracker(
+        storage.JsonStorage(storage.ShiftJournal(f'{datos}.journal'), f'{datos}.json'),
+        retencion_dedupe_dias=retencion_dedupe(mensajes)
+    )
+    tracker.writer = storage.PersistenceWriter(tracker.storage, tracker.snapshot_data)
+    tracker.writer.start()
+    ingesta = ColaIngesta(tracker)
+    ingesta.start()
+
+    async def manejar(mensaje):
+        message_id, momento, contenido = mensaje
+        evento = parsear_mensaje(contenido)
+        if evento:
+            await ingesta.aplicar(evento, momento, message_id)
+
+    latencias, duracion = await despachar(mensajes, manejar, concurrencia)
+
+    await ingesta.close()
+    await tracker.writer.close()
+    tracker.writer = None
+    tracker.storage.close()
+    assert 'discord' not in sys.modules, "el núcleo de ingesta no debe importar discord.py"
+    return tracker, latencias, duracion
+
+
+class CanalFalso:
+    """Canal local: cuenta lo que el notificador enviaría a Discord"""
+
+    def __init__(self, id):
+        self.id = id
+        self.name = f'canal-{id}'
+        self.enviados = 0
+
+    async def send(self, *args, **kwargs):
+        self.enviados += 1
+
+    def __str__(self):
+        return self.name
+
+
+class AutorFalso:
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+
+
+class MensajeFalso:
+    __slots__ = ('id', 'created_at', 'content', 'channel', 'author')
+
+    def __init__(self, id, created_at, content, channel, author):
+        self.id = id
+        self.created_at = created_at
+        self.content = content
+        self.channel = channel
+        self.author = author
+
+
+async def replay_bot(mensajes, carpeta, concurrencia):
+    """Cada mensaje entra por bot.on_message, con el cliente de Discord reemplazado por canales locales"""
+    os.environ['GUILDS_CONFIG'] = json.dumps([{
+        'guild_id': 1,
+        'canal_servicio': CANAL_SERVICIO,
+        'canal_comandos': CANAL_COMANDOS,
+        'autor_servicio_id': AUTOR_SERVICIO,
+        'datos': os.path.join(carpeta, 'shift_data')
+    }])
+    os.environ['DEDUPE_RETENTION_DAYS'] = str(retencion_dedupe(mensajes))
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')  # Un log por evento taparía la medición
+    import bot
+    from notificador import Presupuesto
+
+    canales = {CANAL_SERVICIO: CanalFalso(CANAL_SERVICIO), CANAL_COMANDOS: CanalFalso(CANAL_COMANDOS)}
+    bot.bot.get_channel = canales.get
+    bot.configurar_servidores()
+    servidor = bot.servidores[0]
+    servidor.iniciar()  # Carga los datos antes de arrancar la ingesta
+    # El canal falso no tiene límite de envíos: el presupuesto real haría esperar el cierre
+    servidor.notificador.presupuesto = Presupuesto(capacidad=10 ** 9, periodo=1.0)
+
+    canal, autor = canales[CANAL_SERVICIO], AutorFalso(AUTOR_SERVICIO, 'Servicio')
+
+    async def manejar(mensaje):
+        await bot.on_message(MensajeFalso(*mensaje, canal, autor))
+
+    latencias, duracion = await despachar(mensajes, manejar, concurrencia)
+
+    await servidor.cerrar()
+    print(f"   Notificaciones enviadas: {canales[CANAL_COMANDOS].enviados:,}")
+    return servidor.tracker, latencias, duracion
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--empleados', type=int, default=10_000)
+    parser.add_argument('--archivo', help="stream grabado en JSONL en lugar del sintético")
+    parser.add_argument('--guardar', help="guarda el stream sintético en JSONL y sale")
+    parser.add_argument('--nucleo', action='store_true', help="solo tracker.py, sin discord.py")
+    parser.add_argument('--concurrencia', type=int, default=1, help="mensajes despachados a la vez")
+    parser.add_argument('--tracemalloc', action='store_true', help="memoria de Python con tracemalloc (más lento)")
+    args = parser.parse_args()
+
+    mensajes = leer_mensajes(args.archivo) if args.archivo else generar_mensajes(args.empleados)
+    if args.guardar:
+        guardar_mensajes(mensajes, args.guardar)
+        print(f"💾 {len(mensajes):,} mensajes guardados en {args.guardar}")
+        return
+
+    modo = 'núcleo' if args.nucleo else 'on_message'
+    print(f"📊 Replay de {len(mensajes):,} mensajes ({modo}, concurrencia {args.concurrencia}):")
+    memoria_inicial = memoria_maxima_mib()
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        replay = replay_nucleo if args.nucleo else replay_bot
+        tracker, latencias, duracion = asyncio.run(replay(mensajes, carpeta, args.concurrencia))
+        en_disco = tracker.storage.tamano_bytes()
+
+    latencias.sort()
+    print(f"   {len(mensajes) / duracion:>10,.0f} eventos/s  ({duracion:.2f}s en total)")
+    print(f"   p50 {percentil(latencias, 0.50) * 1e6:>8.1f} µs   p99 {percentil(latencias, 0.99) * 1e6:>8.1f} µs   "
+          f"máx {latencias[-1] * 1000:.2f} ms")
+    print(f"   Turnos cerrados: {len(tracker.daily_records):,}  activos: {len(tracker.active_shifts):,}  "
+          f"en disco: {en_disco / 1024 / 1024:.1f} MiB")
+    if args.tracemalloc:
+        actual, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"   Memoria (tracemalloc): {actual / 1024 / 1024:.1f} MiB al final, pico {pico / 1024 / 1024:.1f} MiB")
+    memoria_final = memoria_maxima_mib()
+    if memoria_final is not None:
+        print(f"   Memoria máxima del proceso: {memoria_final:.1f} MiB (+{memoria_final - memoria_inicial:.1f} MiB)")
+
+
+if __name__ == '__main__':
+    main()
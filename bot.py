@@ -1,181 +1,432 @@
 import discord
+from discord import app_commands
 from discord.ext import commands, tasks
+from array import array
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timedelta, timezone
+import asyncio
+import contextlib
+import io
 import json
-import re
+import math
 import os
-from collections import defaultdict
+import shutil
+import signal
+import tempfile
+import time
+import logging
+
+import escaneo
+import exportar
+import graficos
+import logs
+import metrics
+import perfil
+import storage
+from aggregates import clave_dia, clave_mes, clave_semana, dias_del_periodo, parsear_periodo
+from notificador import Notificador
+from registros import a_ms
+from reportes import Reporte, ReportCache, enviar_reporte, responder_reporte
+from servicio_parser import ENTRADA, parsear_lote, parsear_mensaje
+from tracker import ColaIngesta, ShiftTracker
 
 # ============ CONFIGURACIÓN ============
-# Token del bot
+# Logging (LOG_LEVEL, LOG_FORMAT, LOG_DEBUG_SAMPLE)
+logs.configurar_logging()
+log = logging.getLogger('horarios')
+
+# Token del bot (solo hace falta para conectarse: benchmarks/replay.py importa este módulo sin él)
 TOKEN = os.getenv('DISCORD_TOKEN')
-if not TOKEN:
-    raise ValueError("❌ ERROR CRÍTICO: No se encontró DISCORD_TOKEN en las variables de entorno")
 
-# IDs de los canales - con valores por defecto
+# IDs de los canales - con valores por defecto (configuración de un solo servidor)
 CANAL_SERVICIOAPP_STR = os.getenv('CANAL_SERVICIOAPP_ID', '1448835558410289183')
 CANAL_COMANDOS_STR = os.getenv('CANAL_COMANDOS_ID', '1448858691670376468')
 
 try:
     CANAL_SERVICIOAPP = int(CANAL_SERVICIOAPP_STR)
     CANAL_COMANDOS = int(CANAL_COMANDOS_STR)
-    print(f"✅ Configuración cargada:")
-    print(f"   - Canal ServicioAPP ID: {CANAL_SERVICIOAPP}")
-    print(f"   - Canal Comandos ID: {CANAL_COMANDOS}")
+    log.info("✅ Configuración cargada: canal ServicioAPP ID=%s, canal Comandos ID=%s",
+             CANAL_SERVICIOAPP, CANAL_COMANDOS)
 except (ValueError, TypeError) as e:
     raise ValueError(f"❌ Error al convertir IDs de canales a números: {e}")
 
+# Canales o hilos de Servicio adicionales (IDs separados por coma), p. ej. uno por sector
+CANALES_SERVICIO_EXTRA = [int(x) for x in os.getenv('CANALES_SERVICIO_EXTRA', '').split(',') if x.strip()]
+
+# ID de usuario del bot ServicioAPP. Sin él se compara por nombre ('Servicio'), que cualquiera puede imitar
+SERVICIO_AUTOR_ID = int(os.environ['SERVICIO_AUTOR_ID']) if os.getenv('SERVICIO_AUTOR_ID') else None
+# Varios servidores: JSON (o ruta a un archivo JSON) con una lista de
+# {"guild_id", "canal_servicio", "canal_comandos", "autor_servicio_id", "datos", "canales_servicio_extra"}
+# Si está definido reemplaza a CANAL_SERVICIOAPP_ID / CANAL_COMANDOS_ID / SERVICIO_AUTOR_ID / CANALES_SERVICIO_EXTRA
+GUILDS_CONFIG = os.getenv('GUILDS_CONFIG')
+
+# Backend de almacenamiento: 'json' (por defecto) o 'sqlite'
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'json')
+# Persistencia JSON: 'journal' (una línea por evento + snapshot periódico) o 'snapshot' (reescribe todo)
+PERSISTENCE_MODE = os.getenv('PERSISTENCE_MODE', 'journal')
+COMPACTACION_MINUTOS = int(os.getenv('JOURNAL_COMPACT_MINUTES', '15'))
+# Formato del snapshot: 'binario' (por defecto, arranque rápido) o 'json' (legible)
+SNAPSHOT_FORMAT = os.getenv('SNAPSHOT_FORMAT', 'binario')
+# Ventana para agrupar ráfagas de cambios en una sola escritura
+VENTANA_ESCRITURA = float(os.getenv('PERSISTENCE_COALESCE_SECONDS', '1.0'))
+# Mensajes por lote en !escanear (el cursor se guarda después de cada lote)
+TAMANO_LOTE_ESCANEO = int(os.getenv('SCAN_CHUNK_SIZE', '100'))
+# Canales de Servicio leídos a la vez en !escanear y al recuperar huecos
+CONCURRENCIA_ESCANEO = int(os.getenv('SCAN_CONCURRENCY', '3'))
+# Segundos mínimos entre ediciones del mensaje de progreso de !escanear
+INTERVALO_PROGRESO_ESCANEO = 5.0
+# Días que se recuerdan los IDs de mensajes aplicados (los mensajes anteriores se ignoran: !escanear no llega más atrás)
+RETENCION_DEDUPE_DIAS = int(os.getenv('DEDUPE_RETENTION_DAYS', '60'))
+# Días de historial que quedan en memoria/snapshot; los anteriores pasan al archivo mensual (0 = nunca)
+RETENCION_HISTORIAL_DIAS = int(os.getenv('HOT_RETENTION_DAYS', '90'))
+# Puerto del servidor HTTP de salud y métricas (Railway define PORT)
+PUERTO_HTTP = int(os.getenv('PORT', '8080'))
+# Notificaciones de entradas/salidas: 'auto' (agrupa ráfagas), 'evento' (una por evento) o 'resumen'
+NOTIFY_MODE = os.getenv('NOTIFY_MODE', 'auto')
+NOTIFY_VENTANA = float(os.getenv('NOTIFY_WINDOW_SECONDS', '2.0'))
+# Registrar los comandos de barra (/hoy, /semana...) al iniciar: '0' si se registran a mano
+SYNC_SLASH_COMMANDS = os.getenv('SYNC_SLASH_COMMANDS', '1') != '0'
+# Perfilar (CPU y memoria) los primeros N segundos después de conectarse, incluida la carga de datos (0 = no)
+PERFIL_AL_INICIAR = int(os.getenv('PROFILE_ON_START_SECONDS', '0'))
+
 intents = discord.Intents.default()
 intents.message_content = True
 intents.messages = True
 
-bot = commands.Bot(command_prefix='!', intents=intents)
-
-# Almacenamiento de datos
-class ShiftTracker:
-    def __init__(self):
-        self.active_shifts = {}  # {dni: {'nombre': str, 'entrada': datetime}}
-        self.daily_records = defaultdict(lambda: defaultdict(list))  # {fecha: {dni: [turnos]}}
-        self.weekly_stats = defaultdict(lambda: {
-            'total_horas': 0,
-            'total_entradas': 0,
-            'nombre': '',
-            'daily_hours': defaultdict(float),
-            'daily_entries': defaultdict(int)
-        })
-    
-    def save_data(self):
-        """Guarda los datos en un archivo JSON"""
-        data = {
-            'active_shifts': {
-                dni: {
-                    'nombre': info['nombre'],
-                    'entrada': info['entrada'].isoformat()
-                } for dni, info in self.active_shifts.items()
-            },
-            'daily_records': {
-                fecha: {
-                    dni: [
-                        {
-                            'entrada': turno['entrada'].isoformat(),
-                            'salida': turno['salida'].isoformat() if turno['salida'] else None,
-                            'horas': turno['horas']
-                        } for turno in turnos
-                    ] for dni, turnos in records.items()
-                } for fecha, records in self.daily_records.items()
-            },
-            'weekly_stats': dict(self.weekly_stats)
-        }
-        with open('shift_data.json', 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-    
-    def load_data(self):
-        """Carga los datos desde el archivo JSON"""
-        try:
-            with open('shift_data.json', 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                
-            # Restaurar turnos activos
-            for dni, info in data.get('active_shifts', {}).items():
-                self.active_shifts[dni] = {
-                    'nombre': info['nombre'],
-                    'entrada': datetime.fromisoformat(info['entrada'])
-                }
-            
-            # Restaurar registros diarios
-            for fecha, records in data.get('daily_records', {}).items():
-                for dni, turnos in records.items():
-                    self.daily_records[fecha][dni] = [
-                        {
-                            'entrada': datetime.fromisoformat(turno['entrada']),
-                            'salida': datetime.fromisoformat(turno['salida']) if turno['salida'] else None,
-                            'horas': turno['horas'],
-                            'nombre': turno.get('nombre', '')
-                        } for turno in turnos
-                    ]
-            
-            # Restaurar estadísticas semanales
-            self.weekly_stats = defaultdict(lambda: {
-                'total_horas': 0,
-                'total_entradas': 0,
-                'nombre': '',
-                'daily_hours': defaultdict(float),
-                'daily_entries': defaultdict(int)
-            }, data.get('weekly_stats', {}))
-        except FileNotFoundError:
-            pass
-    
-    def registrar_entrada(self, dni, nombre):
-        """Registra la entrada de un empleado"""
-        ahora = datetime.now(timezone.utc)
-        self.active_shifts[dni] = {
-            'nombre': nombre,
-            'entrada': ahora
-        }
-        self.save_data()
-        return ahora
-    
-    def registrar_salida(self, dni, nombre):
-        """Registra la salida de un empleado y calcula las horas"""
-        if dni not in self.active_shifts:
-            return None
-        
-        entrada = self.active_shifts[dni]['entrada']
-        salida = datetime.now(timezone.utc)
-        horas_trabajadas = (salida - entrada).total_seconds() / 3600
-        
-        # Guardar en registros diarios
-        fecha_str = entrada.strftime('%Y-%m-%d')
-        self.daily_records[fecha_str][dni].append({
-            'entrada': entrada,
-            'salida': salida,
-            'horas': horas_trabajadas,
-            'nombre': nombre
-        })
+class HorariosBot(commands.Bot):
+    async def setup_hook(self):
+        if PERFIL_AL_INICIAR:
+            _perfilar_inicio()
+        # Carga los datos y arranca la persistencia y la ingesta de cada servidor antes de
+        # conectarse al gateway: ningún mensaje se aplica antes de load_data
+        for servidor in servidores:
+            servidor.iniciar()
         
-        # Actualizar estadísticas semanales
-        self.weekly_stats[dni]['nombre'] = nombre
-        self.weekly_stats[dni]['total_horas'] += horas_trabajadas
-        self.weekly_stats[dni]['total_entradas'] += 1
-        self.weekly_stats[dni]['daily_hours'][fecha_str] += horas_trabajadas
-        self.weekly_stats[dni]['daily_entries'][fecha_str] += 1
+        if SYNC_SLASH_COMMANDS:
+            await self.sincronizar_comandos()
         
-        # Remover del turno activo
-        del self.active_shifts[dni]
-        self.save_data()
+        # Salud y métricas en el mismo loop
+        self.http_runner = await metrics.iniciar_servidor_http(PUERTO_HTTP, estado_salud)
+        self.lag_task = asyncio.create_task(metrics.medir_lag_event_loop())
         
-        return {
-            'entrada': entrada,
-            'salida': salida,
-            'horas': horas_trabajadas
-        }
+        # Railway detiene el contenedor con SIGTERM: cerrar ordenadamente hace el flush final
+        self.cierre_task = None
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, self._cerrar_por_senal)
+        except NotImplementedError:
+            pass  # Windows: sin señales en el event loop
+    
+    def _cerrar_por_senal(self):
+        if self.cierre_task is None:
+            log.info("🛑 SIGTERM recibido: cerrando el bot")
+            self.cierre_task = asyncio.create_task(self.close())
+    
+    async def sincronizar_comandos(self):
+        """Registra los comandos de barra en cada servidor configurado (al instante) o, sin guild_id, globales"""
+        guilds = [discord.Object(id=servidor.guild_id) for servidor in servidores if servidor.guild_id]
+        try:
+            for guild in guilds:
+                self.tree.copy_global_to(guild=guild)
+                await self.tree.sync(guild=guild)
+            if not guilds:
+                await self.tree.sync()
+        except discord.HTTPException as e:
+            log.warning("⚠️ No se pudieron registrar los comandos de barra: %s", e)
+    
+    async def close(self):
+        if getattr(self, 'lag_task', None):
+            self.lag_task.cancel()
+        if getattr(self, 'http_runner', None):
+            await self.http_runner.cleanup()
+        # Flush final antes de desconectar para no perder eventos encolados
+        for servidor in servidores:
+            await servidor.cerrar()
+        graficos.cerrar()
+        await super().close()
+
+bot = HorariosBot(command_prefix='!', intents=intents)
+
+def estado_salud():
+    """Estado para el healthcheck: conectado al gateway y listo"""
+    conectado = bot.is_ready() and not bot.is_closed()
+    latencia = bot.latency
+    return {
+        'estado': 'ok' if conectado else 'desconectado',
+        'conectado': conectado,
+        'latencia_gateway_ms': round(latencia * 1000, 1) if math.isfinite(latencia) else None,
+        'servidores': len(servidores),
+        'turnos_activos': sum(len(servidor.tracker.active_shifts) for servidor in servidores)
+    }
+
+def _nombre_servidor(servidor):
+    return str(servidor.guild_id or servidor.canal_servicio)
+
+metrics.Gauge(
+    'horarios_gateway_latencia_segundos', 'Latencia del heartbeat del gateway de Discord',
+    funcion=lambda: bot.latency if math.isfinite(bot.latency) else float('nan')
+)
+metrics.Gauge(
+    'horarios_gateway_conectado', '1 si el bot está conectado al gateway',
+    funcion=lambda: 1 if bot.is_ready() and not bot.is_closed() else 0
+)
+metrics.Gauge(
+    'horarios_turnos_activos', 'Empleados actualmente en servicio', 'servidor',
+    funcion=lambda: {_nombre_servidor(s): len(s.tracker.active_shifts) for s in servidores}
+)
+metrics.Gauge(
+    'horarios_notificaciones_en_cola', 'Notificaciones esperando ser enviadas', 'servidor',
+    funcion=lambda: {_nombre_servidor(s): len(s.notificador.pendientes) for s in servidores}
+)
+metrics.Gauge(
+    'horarios_ingesta_en_cola', 'Comandos esperando al escritor único del tracker', 'servidor',
+    funcion=lambda: {_nombre_servidor(s): len(s.ingesta) for s in servidores}
+)
+metrics.Gauge(
+    'horarios_persistencia_bytes', 'Tamaño en disco de los datos persistidos', 'servidor',
+    funcion=lambda: {_nombre_servidor(s): s.tracker.storage.tamano_bytes() for s in servidores}
+)
+
+def crear_storage(datos='shift_data'):
+    """Crea el backend configurado en STORAGE_BACKEND con archivos '<datos>.snap/.json/.journal/.db'"""
+    if STORAGE_BACKEND == 'sqlite':
+        backend = storage.SqliteStorage(f'{datos}.db')
+        if backend.vacia() and (os.path.exists(f'{datos}.json') or os.path.exists(f'{datos}.snap')):
+            # Migración única desde el snapshot + journal
+            storage.migrar_json_a_sqlite(
+                storage.JsonStorage(storage.ShiftJournal(f'{datos}.journal'), f'{datos}.json'),
+                backend
+            )
+            log.info("✅ Datos de %s.json migrados a %s.db", datos, datos)
+        return backend
+    journal = storage.ShiftJournal(f'{datos}.journal') if PERSISTENCE_MODE == 'journal' else None
+    return storage.JsonStorage(journal, snapshot_path=f'{datos}.json', formato=SNAPSHOT_FORMAT)
+
+class Servidor:
+    """Un servidor (guild) atendido por el bot: sus canales, el autor de Servicio y su ShiftTracker"""
+    
+    def __init__(self, guild_id, canal_servicio, canal_comandos, autor_servicio_id=None, datos='shift_data',
+                 canales_extra=()):
+        self.guild_id = guild_id
+        self.canal_servicio = canal_servicio
+        # Todos los canales donde publica ServicioAPP: el principal primero
+        self.canales_servicio = (canal_servicio, *(canal for canal in canales_extra if canal != canal_servicio))
+        self.canal_comandos = canal_comandos
+        self.autor_servicio_id = autor_servicio_id
+        # Cada servidor tiene su propia partición de datos: nunca se mezclan
+        self.tracker = ShiftTracker(
+            crear_storage(datos),
+            retencion_dedupe_dias=RETENCION_DEDUPE_DIAS,
+            retencion_historial_dias=RETENCION_HISTORIAL_DIAS
+        )
+        # Único escritor del tracker: eventos en vivo, escaneos y tareas periódicas pasan por acá
+        self.ingesta = ColaIngesta(self.tracker)
+        self.reportes = ReportCache()  # Reportes ya armados, válidos mientras no cambie su versión del tracker
+        self.graficos = ReportCache(maximo=16)  # PNGs de !grafico (más pesados: se guardan menos)
+        # Entradas/salidas hacia el canal de comandos, enviadas en segundo plano
+        self.notificador = Notificador(
+            lambda: bot.get_channel(self.canal_comandos), modo=NOTIFY_MODE, ventana=NOTIFY_VENTANA
+        )
+        self.datos_cargados = False
+        self.recuperando = False  # Hay un _recuperar_hueco en curso (on_ready y on_resumed pueden solaparse)
+    
+    def iniciar(self):
+        """Carga los datos guardados y arranca el writer, la cola de ingesta y el notificador en el loop actual.
+
+        En ese orden: un evento aplicado antes de load_data quedaría en memoria,
+        pero load_data pisaría su journal_seq y su ID en el índice de duplicados.
+        """
+        tracker = self.tracker
+        if not self.datos_cargados:
+            tracker.load_data()
+            self.datos_cargados = True
+        tracker.writer = storage.PersistenceWriter(
+            tracker.storage,
+            tracker.snapshot_data,
+            ventana=VENTANA_ESCRITURA
+        )
+        tracker.writer.start()
+        self.ingesta.start()
+        self.notificador.start()
+    
+    async def cerrar(self):
+        """Aplica los eventos encolados, envía las notificaciones pendientes, escribe y cierra el almacenamiento"""
+        await self.ingesta.close()
+        await self.notificador.close()
+        tracker = self.tracker
+        if tracker.writer:
+            await tracker.writer.close()
+            tracker.writer = None
+        tracker.storage.close()
+    
+    def es_autor_servicio(self, autor):
+        """True si el mensaje lo publicó el bot ServicioAPP"""
+        if self.autor_servicio_id is not None:
+            return autor.id == self.autor_servicio_id
+        return autor.name == 'Servicio'
+
+def cargar_servidores():
+    """Lee GUILDS_CONFIG o, si no está, arma un único servidor con las variables de siempre"""
+    if not GUILDS_CONFIG:
+        return [Servidor(None, CANAL_SERVICIOAPP, CANAL_COMANDOS, SERVICIO_AUTOR_ID,
+                         canales_extra=CANALES_SERVICIO_EXTRA)]
+    
+    if os.path.exists(GUILDS_CONFIG):
+        with open(GUILDS_CONFIG, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    else:
+        config = json.loads(GUILDS_CONFIG)
+    return [
+        Servidor(
+            int(item['guild_id']),
+            int(item['canal_servicio']),
+            int(item['canal_comandos']),
+            int(item['autor_servicio_id']) if item.get('autor_servicio_id') else None,
+            item.get('datos', f"shift_data_{item['guild_id']}"),
+            [int(canal) for canal in item.get('canales_servicio_extra', ())]
+        ) for item in config
+    ]
+
+def armar_rutas(servidores):
+    """Tabla de ruteo: ID de canal -> Servidor"""
+    rutas = {}
+    for servidor in servidores:
+        for canal in servidor.canales_servicio:
+            rutas[canal] = servidor
+        rutas[servidor.canal_comandos] = servidor
+        if servidor.autor_servicio_id is None:
+            log.warning("⚠️ Servidor %s sin autor_servicio_id: se reconoce a ServicioAPP por nombre",
+                        servidor.guild_id or servidor.canal_servicio)
+    return rutas
+
+# Se llenan en configurar_servidores(), al arrancar: importar bot.py no abre ningún
+# almacenamiento (el proceso de gráficos lo vuelve a importar como __mp_main__)
+servidores = []
+# Los mensajes de cualquier canal fuera de la tabla se descartan en O(1)
+RUTAS = {}
+
+def configurar_servidores():
+    """Crea los servidores con su almacenamiento y arma la tabla de rutas (una vez, antes de bot.run)"""
+    servidores[:] = cargar_servidores()
+    RUTAS.clear()
+    RUTAS.update(armar_rutas(servidores))
 
-tracker = ShiftTracker()
+def _servidor(ctx):
+    """Servidor al que pertenece el canal de comandos donde se invocó el comando"""
+    return RUTAS[ctx.channel.id]
 
 @bot.event
 async def on_ready():
-    print(f'✅ {bot.user} está conectado!')
-    print(f'   - ID del bot: {bot.user.id}')
-    print(f'   - Servidores conectados: {len(bot.guilds)}')
+    log.info("✅ %s está conectado! (ID del bot: %s, servidores conectados: %d)",
+             bot.user, bot.user.id, len(bot.guilds))
     
-    tracker.load_data()
-    weekly_reset.start()
+    # on_ready se repite en cada reconexión (los datos ya se cargaron en setup_hook)
+    if not compactar_journal.is_running():
+        compactar_journal.start()
     
-    # Verificar que los canales existen
-    canal_servicio = bot.get_channel(CANAL_SERVICIOAPP)
-    canal_comandos = bot.get_channel(CANAL_COMANDOS)
+    for servidor in servidores:
+        await _verificar_canales(servidor)
+        # Lo publicado mientras el bot estuvo caído o desconectado
+        await _recuperar_hueco(servidor)
+
+def _perfilar_inicio():
+    """Abre la ventana de PROFILE_ON_START_SECONDS y manda el informe a los canales de comandos al cerrarla"""
+    try:
+        sesion = perfil.iniciar(motivo='inicio')
+    except (RuntimeError, ValueError) as e:
+        log.warning("⚠️ No se pudo perfilar el inicio: %s", e)
+        return
+    
+    async def enviar():
+        path = await perfil.completar(sesion, min(PERFIL_AL_INICIAR, perfil.MAX_SEGUNDOS))
+        try:
+            for servidor in servidores:
+                canal = bot.get_channel(servidor.canal_comandos)
+                if canal:
+                    await canal.send(
+                        f"🔬 Perfil de los primeros {PERFIL_AL_INICIAR}s del bot",
+                        file=discord.File(path, filename=os.path.basename(path))
+                    )
+        finally:
+            shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+    
+    bot.perfil_inicio = asyncio.create_task(enviar())  # Referencia: que no lo junte el recolector
+
+@bot.event
+async def on_resumed():
+    # Al reanudar la sesión el gateway reenvía lo perdido; si algo faltó, se lee desde el último ID
+    for servidor in servidores:
+        await _recuperar_hueco(servidor)
+
+async def _recuperar_hueco(servidor):
+    """Aplica los mensajes de Servicio publicados después del último mensaje procesado.
+    
+    Solo se leen los mensajes posteriores a tracker.ultimo_mensaje, así el costo
+    depende del tamaño del hueco y no del historial del canal. Pasan por el mismo
+    camino que !escanear; los que ya llegaron en vivo se ignoran por su ID.
+    """
+    ultimo = servidor.tracker.ultimo_mensaje
+    canales, _ = _canales_servicio(servidor)
+    if ultimo is None or not canales or servidor.recuperando:
+        return
+    servidor.recuperando = True
+    conteo = {'revisados': 0, 'entradas': 0, 'salidas': 0}
+    lote = []
+    try:
+        async with _historial_servicio(servidor, canales, discord.Object(id=ultimo)) as mensajes:
+            async for message in mensajes:
+                lote.append(message)
+                if len(lote) >= TAMANO_LOTE_ESCANEO:
+                    await _aplicar_historicos(servidor, lote, conteo)
+                    lote = []
+        if lote:
+            await _aplicar_historicos(servidor, lote, conteo)
+    except Exception as e:
+        # Lo aplicado hasta acá queda; el próximo intento sigue desde el nuevo último mensaje
+        log.exception("❌ Error al recuperar los mensajes de %s: %s", _nombre_servidor(servidor), e)
+    finally:
+        servidor.recuperando = False
+    
+    metrics.MENSAJES_RECUPERADOS.inc(conteo['revisados'])
+    if conteo['revisados']:
+        log.info("🔁 Hueco recuperado en %s: %d mensajes revisados | 📥 %d entradas | 📤 %d salidas",
+                 _nombre_servidor(servidor), conteo['revisados'], conteo['entradas'], conteo['salidas'])
+
+def _historial_servicio(servidor, canales, despues):
+    """Mensajes de los canales de Servicio posteriores a `despues`, en orden; se cierra al salir del bloque"""
+    return contextlib.aclosing(escaneo.historial(
+        canales, despues, CONCURRENCIA_ESCANEO, lambda message: servidor.es_autor_servicio(message.author)
+    ))
+
+def _canales_servicio(servidor):
+    """(canales de Servicio accesibles, IDs de los que no se encontraron)"""
+    canales, faltantes = [], []
+    for canal_id in servidor.canales_servicio:
+        canal = bot.get_channel(canal_id)
+        if canal is None:
+            faltantes.append(canal_id)
+        else:
+            canales.append(canal)
+    return canales, faltantes
+
+async def _verificar_canales(servidor):
+    """Verifica que los canales de un servidor existen y anuncia el inicio en el de comandos"""
+    canal_servicio = bot.get_channel(servidor.canal_servicio)
+    canal_comandos = bot.get_channel(servidor.canal_comandos)
     
     if canal_servicio:
-        print(f'✅ Canal Servicio encontrado: {canal_servicio.name} (ID: {canal_servicio.id})')
+        log.info("✅ Canal Servicio encontrado: %s (ID: %s)", canal_servicio.name, canal_servicio.id)
     else:
-        print(f'⚠️ No se pudo encontrar el canal Servicio (ID: {CANAL_SERVICIOAPP})')
-        print(f'   Verifica que el bot tenga acceso al canal y que el ID sea correcto')
+        log.warning("⚠️ No se pudo encontrar el canal Servicio (ID: %s). "
+                    "Verifica que el bot tenga acceso al canal y que el ID sea correcto", servidor.canal_servicio)
+    for canal_id in servidor.canales_servicio[1:]:
+        if bot.get_channel(canal_id) is None:
+            log.warning("⚠️ No se pudo encontrar el canal Servicio adicional (ID: %s)", canal_id)
     
     if canal_comandos:
-        print(f'✅ Canal de comandos encontrado: {canal_comandos.name} (ID: {canal_comandos.id})')
+        log.info("✅ Canal de comandos encontrado: %s (ID: %s)", canal_comandos.name, canal_comandos.id)
     else:
-        print(f'⚠️ No se pudo encontrar el canal de comandos (ID: {CANAL_COMANDOS})')
-        print(f'   Verifica que el bot tenga acceso al canal y que el ID sea correcto')
+        log.warning("⚠️ No se pudo encontrar el canal de comandos (ID: %s). "
+                    "Verifica que el bot tenga acceso al canal y que el ID sea correcto", servidor.canal_comandos)
     
     # Enviar mensaje de inicio al canal de comandos
     if canal_comandos:
@@ -185,375 +436,775 @@ async def on_ready():
                 description="El bot está listo para registrar entradas y salidas.",
                 color=discord.Color.green()
             )
-            embed.add_field(name="Comandos Disponibles", value="`!hoy` `!semana` `!activos` `!escanear` `!limpiar_datos`", inline=False)
+            embed.add_field(
+                name="Comandos Disponibles",
+                value="`!hoy` `!semana` `!mes` `!rango` `!activos` `!ranking` `!grafico` `!escanear` "
+                      "`!exportar` `!limpiar_datos` `!perfil`\n"
+                      "También como comandos de barra: `/hoy` `/semana` `/mes` `/rango` `/activos` `/ranking`",
+                inline=False
+            )
             await canal_comandos.send(embed=embed)
-            print(f'✅ Mensaje de inicio enviado al canal de comandos')
+            log.info("✅ Mensaje de inicio enviado al canal de comandos")
         except Exception as e:
-            print(f'⚠️ No se pudo enviar mensaje al canal de comandos: {e}')
+            log.warning("⚠️ No se pudo enviar mensaje al canal de comandos: %s", e)
 
 @bot.event
 async def on_message(message):
+    metrics.MENSAJES_VISTOS.inc()
+    inicio = time.perf_counter()
+    try:
+        await _procesar_mensaje(message)
+    finally:
+        metrics.ON_MESSAGE_SEGUNDOS.observe(time.perf_counter() - inicio)
+
+@bot.before_invoke
+async def _antes_de_comando(ctx):
+    ctx.inicio_comando = time.perf_counter()
+
+@bot.after_invoke
+async def _despues_de_comando(ctx):
+    # Se llama también si el comando falla: el histograma incluye los errores
+    metrics.COMANDO_SEGUNDOS.observe(time.perf_counter() - ctx.inicio_comando, f'!{ctx.command.qualified_name}')
+
+async def _procesar_mensaje(message):
+    # Ruteo por canal: cualquier canal que no sea de un servidor configurado se descarta acá
+    servidor = RUTAS.get(message.channel.id)
+    if servidor is None:
+        return
+    
     # Ignorar mensajes del propio bot
     if message.author == bot.user:
         return
     
-    # DEBUG: Log de todos los mensajes que ve el bot
-    print(f"📨 Mensaje detectado:")
-    print(f"   - Autor: {message.author.name} (ID: {message.author.id})")
-    print(f"   - Canal: {message.channel.name} (ID: {message.channel.id})")
-    print(f"   - Contenido: {message.content[:100]}")
-    
-    # Solo procesar mensajes del bot ServicioAPP en el canal específico
-    if message.author.name == 'Servicio' and message.channel.id == CANAL_SERVICIOAPP:
-        print(f"✅ Mensaje de Servicio detectado en el canal correcto")
-        # Obtener el canal de comandos para enviar las notificaciones
-        canal_comandos = bot.get_channel(CANAL_COMANDOS)
-        
-        if not canal_comandos:
-            print(f"⚠️ No se pudo encontrar el canal de comandos")
-            return
-        
-        print(f"🔍 Procesando mensaje de Servicio:")
-        print(f"   Contenido completo: '{message.content}'")
+    # DEBUG muestreado: es el log de mayor volumen
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("📨 Mensaje detectado: autor=%s (%s) canal=%s (%s) contenido=%.100s",
+                  message.author.name, message.author.id, message.channel, message.channel.id,
+                  message.content, extra={'muestreo': True})
+    
+    # Solo procesar mensajes del bot ServicioAPP en el canal de Servicio del servidor
+    if message.channel.id in servidor.canales_servicio and servidor.es_autor_servicio(message.author):
+        log.debug("🔍 Procesando mensaje de Servicio %s: %r", message.id, message.content)
         
-        # Patrón para extraer DNI y nombre
         # Formato: **[ABC12345] Nombre Apellido** ha entrado/salido en servicio
-        # El ** puede o no estar presente
-        patron_entrada = r'\*?\*?\[([A-Z]{3}\d{5})\]\s+([^\*]+?)\*?\*?\s+ha entrado en servicio'
-        patron_salida = r'\*?\*?\[([A-Z]{3}\d{5})\]\s+([^\*]+?)\*?\*?\s+ha salido de servicio'
-        
-        match_entrada = re.search(patron_entrada, message.content, re.IGNORECASE)
-        match_salida = re.search(patron_salida, message.content, re.IGNORECASE)
+        evento = parsear_mensaje(message.content)
         
-        if not match_entrada and not match_salida:
-            print(f"❌ No se encontró patrón de entrada/salida en el mensaje")
-            print(f"   Patrón esperado: **[XXX12345] Nombre** ha entrado/salido en servicio")
+        if not evento:
+            log.info("❌ Mensaje %s de Servicio sin patrón de entrada/salida "
+                     "(esperado: **[XXX12345] Nombre** ha entrado/salido en servicio)", message.id)
             return
         
-        if match_entrada:
-            dni = match_entrada.group(1).upper()  # Normalizar a mayúsculas
-            nombre = match_entrada.group(2).strip()
-            
-            print(f"✅ ENTRADA detectada: DNI={dni}, Nombre={nombre}")
-            entrada = tracker.registrar_entrada(dni, nombre)
-            
-            embed = discord.Embed(
-                title="✅ Entrada Registrada",
-                color=discord.Color.green(),
-                timestamp=entrada
-            )
-            embed.add_field(name="DNI", value=dni, inline=True)
-            embed.add_field(name="Nombre", value=nombre, inline=True)
-            embed.add_field(name="Hora", value=entrada.strftime('%H:%M:%S'), inline=True)
-            
-            await canal_comandos.send(embed=embed)
+        dni, nombre = evento.dni, evento.nombre
+        # El momento es el del mensaje, no el de su llegada: una ráfaga o una demora del
+        # gateway no cambia las horas, y el escritor único ordena los eventos por él
+        resultado = await servidor.ingesta.aplicar(evento, message.created_at, message.id)
+        
+        # Las notificaciones se encolan: el envío (y cualquier 429) no frena este handler
+        if evento.tipo == ENTRADA:
+            entrada = resultado
+            if not entrada:
+                log.info("↩️ Mensaje %s ya aplicado, se ignora", message.id)
+                return
+            log.info("✅ ENTRADA: DNI=%s, Nombre=%s", dni, nombre,
+                     extra={'campos': {'evento': 'entrada', 'dni': dni, 'message_id': message.id}})
+            servidor.notificador.notificar_entrada(dni, nombre, entrada)
         
-        elif match_salida:
-            dni = match_salida.group(1).upper()  # Normalizar a mayúsculas
-            nombre = match_salida.group(2).strip()
-            
-            print(f"✅ SALIDA detectada: DNI={dni}, Nombre={nombre}")
-            turno = tracker.registrar_salida(dni, nombre)
-            
+        else:
+            turno = resultado
             if turno:
-                embed = discord.Embed(
-                    title="🔴 Salida Registrada",
-                    color=discord.Color.red(),
-                    timestamp=turno['salida']
-                )
-                embed.add_field(name="DNI", value=dni, inline=True)
-                embed.add_field(name="Nombre", value=nombre, inline=True)
-                embed.add_field(name="Entrada", value=turno['entrada'].strftime('%H:%M:%S'), inline=True)
-                embed.add_field(name="Salida", value=turno['salida'].strftime('%H:%M:%S'), inline=True)
-                embed.add_field(name="Horas trabajadas", value=f"{turno['horas']:.2f}h", inline=True)
-                
-                await canal_comandos.send(embed=embed)
+                log.info("✅ SALIDA: DNI=%s, Nombre=%s, %.2fh", dni, nombre, turno['horas'],
+                         extra={'campos': {'evento': 'salida', 'dni': dni, 'message_id': message.id}})
+                servidor.notificador.notificar_salida(dni, nombre, turno)
     
     # Procesar comandos solo en el canal de comandos
-    if message.channel.id == CANAL_COMANDOS:
+    if message.channel.id == servidor.canal_comandos:
         await bot.process_commands(message)
 
-@bot.command(name='hoy')
-async def reporte_diario(ctx, dni=None):
-    """Muestra el reporte de horas del día actual"""
-    # Usar timezone UTC para consistencia
-    fecha_hoy = datetime.now(timezone.utc).strftime('%Y-%m-%d')
-    
+def _tiempo_en_curso(entrada):
+    """Valor de campo que se calcula al mostrar la página (el turno sigue corriendo)"""
+    return lambda ahora: f"⏱️ {(ahora - entrada).total_seconds() / 3600:.2f}h (en curso)"
+
+async def _armar_reporte_diario(tracker, fecha_hoy, dni):
+    await tracker.cargar_agregados([fecha_hoy])
     if dni:
-        # Reporte individual - El DNI puede venir con o sin prefijo
-        # Ej: LCR35534, PDA10646, o solo 35534
-        records = tracker.daily_records[fecha_hoy].get(dni, [])
+        # Reporte individual (el DNI ya viene resuelto: LCR35534, PDA10646, o solo 35534)
+        records = (await tracker.turnos_del_dia(fecha_hoy, dni)).get(dni, [])
         
         if not records and dni not in tracker.active_shifts:
-            await ctx.send(f"No hay registros para el DNI {dni} hoy.")
-            return
+            return f"No hay registros para el DNI {dni} hoy."
         
         nombre = records[0]['nombre'] if records else tracker.active_shifts[dni]['nombre']
-        total_horas = sum(r['horas'] for r in records)
-        entradas = len(records)
-        
-        embed = discord.Embed(
-            title=f"📊 Reporte Diario - {nombre}",
-            description=f"DNI: {dni}\nFecha: {fecha_hoy}",
-            color=discord.Color.blue()
-        )
+        total_horas, entradas = tracker.agregados.total(fecha_hoy, dni)
         
+        filas = []
         for i, turno in enumerate(records, 1):
             entrada_str = turno['entrada'].strftime('%H:%M:%S')
             salida_str = turno['salida'].strftime('%H:%M:%S') if turno['salida'] else 'En curso'
-            embed.add_field(
-                name=f"Turno {i}",
-                value=f"🕐 {entrada_str} → {salida_str}\n⏱️ {turno['horas']:.2f}h",
-                inline=False
-            )
+            filas.append((f"Turno {i}", f"🕐 {entrada_str} → {salida_str}\n⏱️ {turno['horas']:.2f}h"))
         
         # Verificar si está en turno activo
         if dni in tracker.active_shifts:
             entrada_activa = tracker.active_shifts[dni]['entrada']
-            tiempo_actual = (datetime.now(timezone.utc) - entrada_activa).total_seconds() / 3600
-            embed.add_field(
-                name="🟢 Turno Actual (En curso)",
-                value=f"🕐 {entrada_activa.strftime('%H:%M:%S')} → Ahora\n⏱️ {tiempo_actual:.2f}h",
-                inline=False
-            )
-        
-        embed.add_field(name="Total de Horas", value=f"{total_horas:.2f}h", inline=True)
-        embed.add_field(name="Veces Entró", value=str(entradas), inline=True)
+            filas.append((
+                "🟢 Turno Actual (En curso)",
+                lambda ahora: f"🕐 {entrada_activa.strftime('%H:%M:%S')} → Ahora\n"
+                              f"⏱️ {(ahora - entrada_activa).total_seconds() / 3600:.2f}h"
+            ))
         
-        await ctx.send(embed=embed)
-    else:
-        # Reporte general
-        embed = discord.Embed(
-            title="📊 Reporte Diario - Todos los Empleados",
-            description=f"Fecha: {fecha_hoy}",
-            color=discord.Color.blue()
+        return Reporte(
+            f"📊 Reporte Diario - {nombre}", discord.Color.blue(), filas,
+            descripcion=f"DNI: {dni}\nFecha: {fecha_hoy}",
+            totales=(("Total de Horas", f"{total_horas:.2f}h"), ("Veces Entró", str(entradas)))
         )
-        
-        records = tracker.daily_records[fecha_hoy]
-        if not records and not tracker.active_shifts:
-            await ctx.send("No hay registros para hoy.")
-            return
-        
-        # Empleados con registros
-        for dni, turnos in sorted(records.items()):
-            if turnos:
-                nombre = turnos[0]['nombre']
-                total_horas = sum(t['horas'] for t in turnos)
-                entradas = len(turnos)
-                embed.add_field(
-                    name=f"{nombre} [{dni}]",
-                    value=f"⏱️ {total_horas:.2f}h | 🔄 {entradas} entradas",
-                    inline=False
-                )
-        
-        # Empleados actualmente en servicio
-        if tracker.active_shifts:
-            embed.add_field(name="━━━━━━━━━━━━━━━", value="**🟢 Actualmente en Servicio:**", inline=False)
-            for dni, info in tracker.active_shifts.items():
-                tiempo = (datetime.now(timezone.utc) - info['entrada']).total_seconds() / 3600
-                embed.add_field(
-                    name=f"{info['nombre']} [{dni}]",
-                    value=f"⏱️ {tiempo:.2f}h (en curso)",
-                    inline=False
-                )
-        
-        await ctx.send(embed=embed)
+    
+    # Reporte general
+    totales = tracker.agregados.periodo(fecha_hoy)
+    if not totales and not tracker.active_shifts:
+        return "No hay registros para hoy."
+    
+    # Empleados con registros (totales del bucket del día, sin recorrer turnos)
+    filas = [
+        (f"{tracker.agregados.nombres.get(dni, dni)} [{dni}]", f"⏱️ {total_horas:.2f}h | 🔄 {entradas} entradas")
+        for dni, (total_horas, entradas) in sorted(totales.items())
+    ]
+    
+    # Empleados actualmente en servicio
+    if tracker.active_shifts:
+        filas.append(("━━━━━━━━━━━━━━━", "**🟢 Actualmente en Servicio:**"))
+        filas.extend(
+            (f"{info['nombre']} [{dni}]", _tiempo_en_curso(info['entrada']))
+            for dni, info in tracker.active_shifts.items()
+        )
+    
+    return Reporte(
+        "📊 Reporte Diario - Todos los Empleados", discord.Color.blue(), filas,
+        descripcion=f"Fecha: {fecha_hoy}"
+    )
 
-@bot.command(name='semana')
-async def reporte_semanal(ctx, dni=None):
-    """Muestra el reporte de horas de la semana"""
+def _resolver_dni(servidor, dni):
+    """DNI completo a partir de lo que escribió el usuario (con o sin prefijo, o solo el final)"""
+    return servidor.tracker.directorio.resolver(dni) if dni else None
+
+async def _reporte_hoy(servidor, dni):
+    dni = _resolver_dni(servidor, dni)
+    # Usar timezone UTC para consistencia
+    fecha_hoy = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+    return await servidor.reportes.obtener(
+        ('hoy', fecha_hoy, dni), servidor.tracker.version,
+        lambda: _armar_reporte_diario(servidor.tracker, fecha_hoy, dni)
+    )
+
+@bot.command(name='hoy')
+async def reporte_diario(ctx, dni=None):
+    """Muestra el reporte de horas del día actual"""
+    await enviar_reporte(ctx, await _reporte_hoy(_servidor(ctx), dni))
+
+async def _armar_reporte_periodo(tracker, clave, titulo, vacio, color, dni):
+    """Reporte de un período (semana ISO o mes) a partir del índice de agregados"""
+    # Con SQLite los períodos pasados se leen de la base (fuera del event loop) antes de usarlos
+    await tracker.cargar_agregados([clave, *dias_del_periodo(clave)] if dni else [clave])
     if dni:
-        # El DNI puede venir en cualquier formato
-        stats = tracker.weekly_stats.get(dni)
-        
-        if not stats or stats['total_horas'] == 0:
-            await ctx.send(f"No hay registros para el DNI {dni} esta semana.")
-            return
-        
-        embed = discord.Embed(
-            title=f"📈 Reporte Semanal - {stats['nombre']}",
-            description=f"DNI: {dni}",
-            color=discord.Color.purple()
-        )
+        total_horas, total_entradas = tracker.agregados.total(clave, dni)
+        if total_entradas == 0:
+            return f"No hay registros para el DNI {dni} {vacio}."
         
         # Desglose por día
-        for fecha, horas in sorted(stats['daily_hours'].items()):
-            entradas = stats['daily_entries'][fecha]
-            embed.add_field(
-                name=fecha,
-                value=f"⏱️ {horas:.2f}h | 🔄 {entradas} entradas",
-                inline=False
-            )
-        
-        embed.add_field(name="━━━━━━━━━━━━━━━", value="**Totales de la Semana:**", inline=False)
-        embed.add_field(name="Total Horas", value=f"{stats['total_horas']:.2f}h", inline=True)
-        embed.add_field(name="Total Entradas", value=str(stats['total_entradas']), inline=True)
-        
-        await ctx.send(embed=embed)
+        filas = [
+            (fecha, f"⏱️ {horas:.2f}h | 🔄 {entradas} entradas")
+            for fecha, horas, entradas in tracker.agregados.desglose_diario(clave, dni)
+        ]
+        return Reporte(
+            f"{titulo} - {tracker.agregados.nombres.get(dni, dni)}", color, filas,
+            descripcion=f"DNI: {dni}\nPeríodo: {clave}",
+            totales=(("Total Horas", f"{total_horas:.2f}h"), ("Total Entradas", str(total_entradas)))
+        )
+    
+    # Reporte general del período
+    totales = tracker.agregados.periodo(clave)
+    if not totales:
+        return f"No hay registros {vacio}."
+    
+    # Por horas trabajadas, del índice ordenado del período (sin ordenar a todos en cada reporte)
+    filas = [
+        (f"{tracker.agregados.nombres.get(dni, dni)} [{dni}]", f"⏱️ {horas:.2f}h | 🔄 {entradas} entradas")
+        for dni, horas, entradas in tracker.agregados.ranking(clave)
+    ]
+    return Reporte(f"{titulo} - Todos los Empleados", color, filas, descripcion=f"Período: {clave}")
+
+async def _reporte_periodo(servidor, clave, titulo, vacio, color, dni=None):
+    dni = _resolver_dni(servidor, dni)
+    return await servidor.reportes.obtener(
+        ('periodo', clave, dni), servidor.tracker.version_turnos,
+        lambda: _armar_reporte_periodo(servidor.tracker, clave, titulo, vacio, color, dni)
+    )
+
+def _argumentos_periodo(dni, periodo):
+    """Permite `!semana 2026-W41` sin DNI: si el primer argumento es un período, no es un DNI"""
+    if dni and periodo is None and parsear_periodo(dni):
+        return None, dni
+    return dni, periodo
+
+async def _reporte_semana(servidor, dni, semana):
+    if semana:
+        clave = parsear_periodo(semana)
+        if not clave or 'W' not in clave:
+            return "❌ Semana inválida. Usá el formato ISO: `2026-W42`"
+        vacio = f"en la semana {clave}"
     else:
-        # Reporte general semanal
-        embed = discord.Embed(
-            title="📈 Reporte Semanal - Todos los Empleados",
-            color=discord.Color.purple()
+        clave = clave_semana(datetime.now(timezone.utc))
+        vacio = "esta semana"
+    return await _reporte_periodo(servidor, clave, "📈 Reporte Semanal", vacio, discord.Color.purple(), dni)
+
+async def _reporte_mes(servidor, dni, mes):
+    if mes:
+        clave = parsear_periodo(mes)
+        if not clave or len(clave) != 7:
+            return "❌ Mes inválido. Usá el formato `2026-10`"
+        vacio = f"en el mes {clave}"
+    else:
+        clave = clave_mes(datetime.now(timezone.utc))
+        vacio = "este mes"
+    return await _reporte_periodo(servidor, clave, "🗓️ Reporte Mensual", vacio, discord.Color.dark_teal(), dni)
+
+@bot.command(name='semana')
+async def reporte_semanal(ctx, dni=None, semana=None):
+    """Muestra el reporte de horas de la semana ISO actual o de una pasada (YYYY-Www)"""
+    await enviar_reporte(ctx, await _reporte_semana(_servidor(ctx), *_argumentos_periodo(dni, semana)))
+
+@bot.command(name='mes')
+async def reporte_mensual(ctx, dni=None, mes=None):
+    """Muestra el reporte de horas del mes actual o de uno pasado (YYYY-MM)"""
+    await enviar_reporte(ctx, await _reporte_mes(_servidor(ctx), *_argumentos_periodo(dni, mes)))
+
+async def _armar_reporte_rango(tracker, desde, hasta, dni):
+    """Totales de un rango de fechas a partir de los turnos (memoria + archivo mensual)"""
+    registros = await tracker.turnos(desde, hasta, dni)
+    if dni:
+        filas = []
+        total_horas = total_entradas = 0
+        for fecha in sorted(registros):
+            turnos = registros[fecha].get(dni, [])
+            horas = sum(turno['horas'] for turno in turnos)
+            total_horas += horas
+            total_entradas += len(turnos)
+            filas.append((fecha, f"⏱️ {horas:.2f}h | 🔄 {len(turnos)} entradas"))
+        if not filas:
+            return f"No hay registros para el DNI {dni} entre {desde} y {hasta}."
+        nombre = tracker.agregados.nombres.get(dni, dni)
+        return Reporte(
+            f"📅 Reporte por Rango - {nombre}", discord.Color.gold(), filas,
+            descripcion=f"DNI: {dni}\nDesde {desde} hasta {hasta}",
+            totales=(
+                ("Total Horas", f"{total_horas:.2f}h"),
+                ("Total Entradas", str(total_entradas)),
+                ("Días Trabajados", str(len(filas)))
+            )
         )
-        
-        if not tracker.weekly_stats:
-            await ctx.send("No hay registros para esta semana.")
-            return
-        
-        # Ordenar por horas trabajadas
-        sorted_stats = sorted(
-            tracker.weekly_stats.items(),
-            key=lambda x: x[1]['total_horas'],
-            reverse=True
+    
+    totales = {}  # {dni: [horas, entradas, días, nombre]}
+    for records in registros.values():
+        for dni_turno, turnos in records.items():
+            fila = totales.setdefault(dni_turno, [0.0, 0, 0, turnos[-1]['nombre']])
+            fila[0] += sum(turno['horas'] for turno in turnos)
+            fila[1] += len(turnos)
+            fila[2] += 1
+    if not totales:
+        return f"No hay registros entre {desde} y {hasta}."
+    
+    filas = [
+        (f"{nombre} [{dni_turno}]", f"⏱️ {horas:.2f}h | 🔄 {entradas} entradas | 📆 {dias} días")
+        for dni_turno, (horas, entradas, dias, nombre) in sorted(totales.items(), key=lambda x: x[1][0], reverse=True)
+    ]
+    return Reporte(
+        "📅 Reporte por Rango - Todos los Empleados", discord.Color.gold(), filas,
+        descripcion=f"Desde {desde} hasta {hasta}",
+        totales=(("Total Horas", f"{sum(fila[0] for fila in totales.values()):.2f}h"),)
+    )
+
+async def _reporte_rango(servidor, desde, hasta, dni):
+    fechas = [parsear_periodo(desde), parsear_periodo(hasta)]
+    if not all(fecha and len(fecha) == 10 for fecha in fechas):
+        return "❌ Uso: `!rango <desde> <hasta> [dni]` con fechas `2026-09-01`"
+    desde, hasta = sorted(fechas)
+    dni = _resolver_dni(servidor, dni)
+    return await servidor.reportes.obtener(
+        ('rango', desde, hasta, dni), servidor.tracker.version_turnos,
+        lambda: _armar_reporte_rango(servidor.tracker, desde, hasta, dni)
+    )
+
+@bot.command(name='rango')
+async def reporte_rango(ctx, desde=None, hasta=None, dni=None):
+    """Muestra las horas entre dos fechas (YYYY-MM-DD), incluidos los meses archivados"""
+    await enviar_reporte(ctx, await _reporte_rango(_servidor(ctx), desde, hasta, dni))
+
+async def _armar_reporte_activos(tracker):
+    if not tracker.active_shifts:
+        return "No hay empleados en servicio actualmente."
+    
+    filas = [
+        (
+            f"{info['nombre']} [{dni}]",
+            lambda ahora, entrada=info['entrada']: (
+                f"🕐 Entrada: {entrada.strftime('%H:%M:%S')}\n"
+                f"⏱️ Tiempo: {(ahora - entrada).total_seconds() / 3600:.2f}h"
+            )
         )
-        
-        for dni, stats in sorted_stats:
-            if stats['total_horas'] > 0:
-                embed.add_field(
-                    name=f"{stats['nombre']} [{dni}]",
-                    value=f"⏱️ {stats['total_horas']:.2f}h | 🔄 {stats['total_entradas']} entradas",
-                    inline=False
-                )
-        
-        await ctx.send(embed=embed)
+        for dni, info in sorted(tracker.active_shifts.items(), key=lambda x: x[1]['entrada'])
+    ]
+    return Reporte("🟢 Empleados en Servicio", discord.Color.green(), filas)
+
+async def _reporte_activos(servidor):
+    return await servidor.reportes.obtener(
+        ('activos',), servidor.tracker.version, lambda: _armar_reporte_activos(servidor.tracker)
+    )
 
 @bot.command(name='activos')
 async def empleados_activos(ctx):
     """Muestra los empleados actualmente en servicio"""
-    if not tracker.active_shifts:
-        await ctx.send("No hay empleados en servicio actualmente.")
-        return
+    await enviar_reporte(ctx, await _reporte_activos(_servidor(ctx)))
+
+RANKING_CANTIDAD = 10  # Top/bottom N por defecto cuando no hay filtro de horas
+
+def _clave_periodo(periodo):
+    """Clave de bucket para 'hoy', 'semana', 'mes' o un día/semana/mes escrito (por defecto, la semana actual).
     
-    embed = discord.Embed(
-        title="🟢 Empleados en Servicio",
-        color=discord.Color.green()
+    La usan !ranking y !grafico.
+    """
+    ahora = datetime.now(timezone.utc)
+    actuales = {'hoy': clave_dia, 'semana': clave_semana, 'mes': clave_mes}
+    if not periodo or periodo.lower() in actuales:
+        return actuales[(periodo or 'semana').lower()](ahora)
+    return parsear_periodo(periodo)
+
+def _sin_turnos(tracker, clave, menos_de, mas_de):
+    """[(dni, 0.0, 0)] de los empleados conocidos sin turnos en el período, si 0h cumple los filtros"""
+    if menos_de is None or menos_de <= 0 or (mas_de is not None and mas_de >= 0):
+        return []
+    periodo = tracker.agregados.periodo(clave)
+    return [(dni, 0.0, 0) for dni in sorted(tracker.directorio.nombres) if dni not in periodo]
+
+async def _armar_reporte_ranking(tracker, clave, desde_abajo, cantidad, menos_de, mas_de):
+    await tracker.cargar_agregados([clave])
+    # Con `<horas` también cuentan los que no trabajaron nada: no están en los buckets del período
+    ceros = _sin_turnos(tracker, clave, menos_de, mas_de)
+    filas = tracker.agregados.ranking(clave, None if ceros else cantidad, desde_abajo, menos_de, mas_de)
+    if ceros:
+        filas = (ceros + filas if desde_abajo else filas + ceros[::-1])[:cantidad]
+    filtros = []
+    if menos_de is not None:
+        filtros.append(f"menos de {menos_de:g}h")
+    if mas_de is not None:
+        filtros.append(f"más de {mas_de:g}h")
+    if not filas:
+        return f"No hay empleados con turnos en {clave}" + (f" con {' y '.join(filtros)}." if filtros else ".")
+    
+    filtros.insert(0, "de menos a más horas" if desde_abajo else "de más a menos horas")
+    titulo = f"🏆 Ranking {'Bottom' if desde_abajo else 'Top'}{f' {cantidad}' if cantidad else ''} - {clave}"
+    nombres = tracker.agregados.nombres
+    filas = [
+        (f"{posicion}. {nombres.get(dni) or tracker.directorio.nombres.get(dni, dni)} [{dni}]",
+         f"⏱️ {horas:.2f}h | 🔄 {entradas} entradas")
+        for posicion, (dni, horas, entradas) in enumerate(filas, 1)
+    ]
+    alcance = ("Incluye a los empleados sin turnos en el período (0h)" if ceros
+               else "Solo empleados con turnos en el período")
+    return Reporte(
+        titulo, discord.Color.gold(), filas,
+        descripcion=f"Período: {clave} ({', '.join(filtros)})\n{alcance}"
     )
+
+async def _reporte_ranking(servidor, periodo=None, desde_abajo=False, cantidad=None, menos_de=None, mas_de=None):
+    clave = _clave_periodo(periodo)
+    if not clave:
+        return "❌ Período inválido. Usá `hoy`, `semana`, `mes`, `2026-10-17`, `2026-W42` o `2026-10`"
+    if cantidad is None and menos_de is None and mas_de is None:
+        cantidad = RANKING_CANTIDAD
+    return await servidor.reportes.obtener(
+        ('ranking', clave, desde_abajo, cantidad, menos_de, mas_de), servidor.tracker.version_turnos,
+        lambda: _armar_reporte_ranking(servidor.tracker, clave, desde_abajo, cantidad, menos_de, mas_de)
+    )
+
+def _horas_umbral(texto):
+    """'40', '37.5h' o '37,5' -> float, o None"""
+    try:
+        return float(texto.lower().removesuffix('h').replace(',', '.'))
+    except ValueError:
+        return None
+
+@bot.command(name='ranking')
+async def ranking(ctx, *opciones):
+    """Ranking de horas de un período: `!ranking [hoy|semana|mes|período] [top|bottom] [N] [<horas] [>horas]`
+
+    Ejemplos: `!ranking mes top 10`, `!ranking semana <40` (quiénes no llegan a 40h).
+    Sin filtro de horas muestra los 10 primeros; con filtro, todos los que lo cumplen.
+    """
+    uso = "❌ Uso: `!ranking [hoy|semana|mes|2026-W42|2026-10] [top|bottom] [N] [<horas] [>horas]`"
+    argumentos = {}
+    for opcion in opciones:
+        valor = opcion.lower()
+        if valor in ('top', 'bottom'):
+            argumentos['desde_abajo'] = valor == 'bottom'
+        elif valor.isdigit():
+            if int(valor) < 1:
+                await ctx.send(uso)  # `!ranking 0` no es "sin límite": N va de 1 en adelante
+                return
+            argumentos['cantidad'] = int(valor)
+        elif valor[:1] in '<>' and _horas_umbral(valor[1:]) is not None:
+            argumentos['menos_de' if valor[0] == '<' else 'mas_de'] = _horas_umbral(valor[1:])
+        elif 'periodo' not in argumentos:
+            argumentos['periodo'] = opcion
+        else:
+            await ctx.send(uso)
+            return
+    await enviar_reporte(ctx, await _reporte_ranking(_servidor(ctx), **argumentos))
+
+def _extracto_horas(tracker, clave):
+    """Horas por día de los empleados con más horas del período (de los buckets diarios, sin leer turnos)"""
+    agregados = tracker.agregados
+    empleados = agregados.ranking(clave, graficos.MAX_EMPLEADOS)
+    if not empleados:
+        return None
+    dias = dias_del_periodo(clave)
+    total = len(agregados.periodo(clave))
+    return {
+        'titulo': f"Horas por día - {clave}" + (f" (top {len(empleados)} de {total})" if total > len(empleados) else ''),
+        'dias': dias,
+        'filas': [
+            (f"{agregados.nombres.get(dni, dni)[:25]} [{dni}]", [agregados.total(dia, dni)[0] for dia in dias])
+            for dni, _, _ in empleados
+        ]
+    }
+
+def _intervalos(filas):
+    """(entradas_ms, salidas_ms) de las filas de exportación, en arrays compactos para pasar al proceso"""
+    entradas, salidas = array('q'), array('q')
+    for _, _, _, entrada_ms, salida_ms in filas:
+        entradas.append(entrada_ms)
+        salidas.append(salida_ms)
+    return entradas, salidas
+
+async def _extracto_cobertura(tracker, clave):
+    """Intervalos de los turnos del período (más los que siguen en curso) hasta ahora"""
+    dias = dias_del_periodo(clave)
+    inicio = datetime.fromisoformat(dias[0]).replace(tzinfo=timezone.utc)
+    ahora = datetime.now(timezone.utc)
+    if inicio > ahora:
+        return None
+    horas = min(len(dias) * 24, math.ceil((ahora - inicio).total_seconds() / 3600))
+    if tracker.writer:
+        await tracker.writer.flush()  # Con SQLite, que se lea lo último que se escribió
+    # Desde el día anterior: un turno noche que empezó antes cubre las primeras horas del período
+    desde = (inicio - timedelta(days=1)).strftime('%Y-%m-%d')
+    entradas, salidas = await asyncio.to_thread(_intervalos, tracker.filas_exportacion(desde, dias[-1]))
+    for info in tracker.active_shifts.values():
+        entradas.append(a_ms(info['entrada']))
+        salidas.append(a_ms(ahora))
+    if not entradas:
+        return None
+    return {
+        'titulo': f"Personas en servicio por hora - {clave}",
+        'inicio_ms': a_ms(inicio),
+        'horas': horas,
+        'horas_periodo': len(dias) * 24,
+        'entradas': entradas,
+        'salidas': salidas
+    }
+
+async def _armar_grafico(tracker, tipo, clave):
+    if tipo == graficos.HORAS:
+        await tracker.cargar_agregados([clave, *dias_del_periodo(clave)])
+        extracto = _extracto_horas(tracker, clave)
+    else:
+        extracto = await _extracto_cobertura(tracker, clave)
+    if extracto is None:
+        return f"No hay turnos en {clave}."
+    return await graficos.renderizar(tipo, extracto)
+
+@bot.command(name='grafico')
+async def grafico(ctx, tipo='horas', periodo=None):
+    """Gráfico PNG del período: `!grafico [horas|cobertura] [hoy|semana|mes|período]`
     
-    for dni, info in tracker.active_shifts.items():
-        tiempo = datetime.now(timezone.utc) - info['entrada']
-        horas = tiempo.total_seconds() / 3600
-        embed.add_field(
-            name=f"{info['nombre']} [{dni}]",
-            value=f"🕐 Entrada: {info['entrada'].strftime('%H:%M:%S')}\n⏱️ Tiempo: {horas:.2f}h",
-            inline=False
+    `horas` es un mapa de calor de horas por día de cada empleado y `cobertura`
+    cuántas personas hubo en servicio en cada hora. Se dibuja en un proceso
+    aparte y queda guardado hasta que cambien los turnos.
+    """
+    if tipo.lower() not in graficos.TIPOS and periodo is None:
+        tipo, periodo = graficos.HORAS, tipo  # `!grafico mes`
+    tipo = tipo.lower()
+    clave = _clave_periodo(periodo)
+    if tipo not in graficos.TIPOS or not clave:
+        await ctx.send("❌ Uso: `!grafico [horas|cobertura] [hoy|semana|mes|2026-W42|2026-10]`")
+        return
+    if not graficos.disponible():
+        await ctx.send("❌ Los gráficos necesitan matplotlib, que no está instalado (`pip install matplotlib`)")
+        return
+    
+    servidor = _servidor(ctx)
+    tracker = servidor.tracker
+    clave_cache = ('grafico', tipo, clave)
+    if tipo == graficos.COBERTURA and clave_dia(datetime.now(timezone.utc)) in dias_del_periodo(clave):
+        # El período en curso cambia con la hora (turnos activos), no solo con tracker.version
+        clave_cache += (datetime.now(timezone.utc).strftime('%Y-%m-%dT%H'),)
+    
+    # El de horas solo cambia con turnos cerrados; el de cobertura también con los activos
+    version = tracker.version_turnos if tipo == graficos.HORAS else tracker.version
+    estado = await ctx.send("⏳ Generando gráfico...")
+    try:
+        imagen = await servidor.graficos.obtener(
+            clave_cache, version, lambda: _armar_grafico(tracker, tipo, clave)
         )
+    except BrokenProcessPool:
+        # graficos.renderizar ya lo registró y el próximo pedido arranca un proceso nuevo
+        await estado.edit(content="❌ El proceso de gráficos se cayó; probá de nuevo en un momento")
+        return
+    except Exception as e:
+        log.exception("❌ Error al generar el gráfico %s de %s: %s", tipo, clave, e)
+        await estado.edit(content="❌ No se pudo generar el gráfico")
+        return
+    if isinstance(imagen, str):
+        await estado.edit(content=imagen)
+        return
+    await ctx.send(
+        f"📊 {'Horas por día' if tipo == graficos.HORAS else 'Cobertura por hora'} - {clave}",
+        file=discord.File(io.BytesIO(imagen), filename=f"{tipo}_{clave}.png")
+    )
+    await estado.delete()
+
+# ============ COMANDOS DE BARRA ============
+# Los mismos reportes como /hoy, /semana, /mes, /rango, /activos y /ranking. La respuesta se
+# difiere enseguida: Discord da 3 segundos para responder una interacción y un
+# reporte sin caché (o un rango con meses archivados) puede tardar más.
+
+async def _servidor_interaccion(interaction):
+    """Servidor del canal de comandos donde se usó el comando de barra (difiere la respuesta), o None"""
+    servidor = RUTAS.get(interaction.channel_id)
+    if servidor is None or interaction.channel_id != servidor.canal_comandos:
+        await interaction.response.send_message("❌ Usá los comandos en el canal de comandos del bot", ephemeral=True)
+        return None
+    interaction.extras['inicio'] = time.perf_counter()
+    await interaction.response.defer(thinking=True)
+    return servidor
+
+def _medir_comando_barra(interaction):
+    inicio = interaction.extras.get('inicio')
+    if inicio is not None and interaction.command:
+        metrics.COMANDO_SEGUNDOS.observe(time.perf_counter() - inicio, f'/{interaction.command.name}')
+
+@bot.event
+async def on_app_command_completion(interaction, command):
+    _medir_comando_barra(interaction)
+
+@bot.tree.error
+async def _error_comando_barra(interaction, error):
+    log.error("❌ Error en /%s: %s", interaction.command.name if interaction.command else '?', error,
+              exc_info=error)
+    _medir_comando_barra(interaction)
+    mensaje = "❌ No se pudo armar el reporte"
+    if interaction.response.is_done():
+        await interaction.followup.send(mensaje, ephemeral=True)
+    else:
+        await interaction.response.send_message(mensaje, ephemeral=True)
+
+async def _autocompletar_dni(interaction, actual):
+    """Empleados cuyo DNI empieza o termina con lo escrito, o con alguna palabra del nombre que empieza así"""
+    servidor = RUTAS.get(interaction.channel_id)
+    if servidor is None:
+        return []
+    return [
+        app_commands.Choice(name=f"{nombre} [{dni}]"[:100], value=dni)
+        for dni, nombre in servidor.tracker.directorio.buscar(actual)
+    ]
+
+@bot.tree.command(name='hoy', description="Horas del día actual")
+@app_commands.describe(dni="DNI o nombre del empleado (todos si se omite)")
+@app_commands.autocomplete(dni=_autocompletar_dni)
+async def barra_hoy(interaction: discord.Interaction, dni: str = None):
+    servidor = await _servidor_interaccion(interaction)
+    if servidor:
+        await responder_reporte(interaction, await _reporte_hoy(servidor, dni))
+
+@bot.tree.command(name='semana', description="Horas de la semana ISO actual o de una pasada")
+@app_commands.describe(dni="DNI o nombre del empleado (todos si se omite)", semana="Semana ISO, ej. 2026-W42")
+@app_commands.autocomplete(dni=_autocompletar_dni)
+async def barra_semana(interaction: discord.Interaction, dni: str = None, semana: str = None):
+    servidor = await _servidor_interaccion(interaction)
+    if servidor:
+        await responder_reporte(interaction, await _reporte_semana(servidor, dni, semana))
+
+@bot.tree.command(name='mes', description="Horas del mes actual o de uno pasado")
+@app_commands.describe(dni="DNI o nombre del empleado (todos si se omite)", mes="Mes, ej. 2026-10")
+@app_commands.autocomplete(dni=_autocompletar_dni)
+async def barra_mes(interaction: discord.Interaction, dni: str = None, mes: str = None):
+    servidor = await _servidor_interaccion(interaction)
+    if servidor:
+        await responder_reporte(interaction, await _reporte_mes(servidor, dni, mes))
+
+@bot.tree.command(name='rango', description="Horas entre dos fechas, incluidos los meses archivados")
+@app_commands.describe(
+    desde="Fecha inicial, ej. 2026-09-01", hasta="Fecha final, ej. 2026-09-30",
+    dni="DNI o nombre del empleado (todos si se omite)"
+)
+@app_commands.autocomplete(dni=_autocompletar_dni)
+async def barra_rango(interaction: discord.Interaction, desde: str, hasta: str, dni: str = None):
+    servidor = await _servidor_interaccion(interaction)
+    if servidor:
+        await responder_reporte(interaction, await _reporte_rango(servidor, desde, hasta, dni))
+
+@bot.tree.command(name='activos', description="Empleados actualmente en servicio")
+async def barra_activos(interaction: discord.Interaction):
+    servidor = await _servidor_interaccion(interaction)
+    if servidor:
+        await responder_reporte(interaction, await _reporte_activos(servidor))
+
+@bot.tree.command(name='ranking', description="Empleados ordenados por horas en un período")
+@app_commands.describe(
+    periodo="hoy, semana, mes o un período: 2026-10-17, 2026-W42, 2026-10 (por defecto, esta semana)",
+    orden="top: los de más horas; bottom: los de menos",
+    cantidad=f"Cuántos mostrar (por defecto {RANKING_CANTIDAD} si no hay filtro de horas)",
+    menos_de="Solo los que tienen menos horas que esto", mas_de="Solo los que tienen más horas que esto"
+)
+@app_commands.choices(orden=[
+    app_commands.Choice(name="top", value='top'), app_commands.Choice(name="bottom", value='bottom')
+])
+async def barra_ranking(interaction: discord.Interaction, periodo: str = None, orden: str = 'top',
+                        cantidad: app_commands.Range[int, 1, 1000] = None,
+                        menos_de: float = None, mas_de: float = None):
+    servidor = await _servidor_interaccion(interaction)
+    if servidor:
+        await responder_reporte(interaction, await _reporte_ranking(
+            servidor, periodo, orden == 'bottom', cantidad, menos_de, mas_de
+        ))
+
+async def _aplicar_historicos(servidor, mensajes, conteo):
+    """Aplica mensajes históricos (en orden cronológico) y suma revisados/entradas/salidas en `conteo`"""
+    servicio = [message for message in mensajes if servidor.es_autor_servicio(message.author)]
+    pares = [
+        (message, evento) for message, evento in zip(servicio, parsear_lote([m.content for m in servicio]))
+        if evento
+    ]
+    # Un solo comando para el escritor: el lote se aplica entero, sin intercalarse con eventos
+    # en vivo, y se persiste una vez. Los mensajes ya aplicados se ignoran por su ID
+    resultados = await servidor.ingesta.aplicar_lote(
+        (evento, message.created_at, message.id) for message, evento in pares
+    )
     
-    await ctx.send(embed=embed)
+    for (message, evento), resultado in zip(pares, resultados):
+        if not resultado:
+            continue
+        if evento.tipo == ENTRADA:
+            conteo['entradas'] += 1
+            log.debug("📥 Entrada histórica: %s (%s) - %s", evento.nombre, evento.dni, message.created_at,
+                      extra={'muestreo': True})
+        else:
+            conteo['salidas'] += 1
+            log.debug("📤 Salida histórica: %s (%s) - %.2fh", evento.nombre, evento.dni, resultado['horas'],
+                      extra={'muestreo': True})
+    
+    conteo['revisados'] += len(mensajes)
+
+async def _aplicar_lote_historial(servidor, mensajes, cursor):
+    """Aplica un lote de !escanear y avanza el cursor"""
+    await _aplicar_historicos(servidor, mensajes, cursor)
+    cursor['ultimo_id'] = mensajes[-1].id
+    # El cursor se persiste después de los eventos del lote: al reanudar no se repite nada
+    await servidor.ingesta.ejecutar(servidor.tracker.guardar_cursor_escaneo, cursor)
 
 @bot.command(name='escanear')
 @commands.has_permissions(administrator=True)
-async def escanear_historial(ctx, cantidad: int = 100):
-    """Escanea mensajes históricos para registrar entradas/salidas (solo admins)"""
+async def escanear_historial(ctx, *opciones):
+    """Escanea el historial de los canales de Servicio: `!escanear [7d] [nuevo]` (solo admins).
     
-    if cantidad > 1000:
-        await ctx.send("⚠️ Por seguridad, máximo 1000 mensajes. Usa: `!escanear 1000`")
-        return
-    
-    await ctx.send(f"🔍 Escaneando los últimos {cantidad} mensajes del canal de Servicio...")
+    Recorre los mensajes del más antiguo al más reciente en lotes, aplicando los
+    eventos a medida que llegan; con varios canales se leen en paralelo y se
+    mezclan por fecha (ver escaneo.py). Si un escaneo anterior quedó interrumpido
+    lo reanuda desde el último mensaje procesado (`!escanear 7d nuevo` empieza de cero).
+    Los días no pueden pasar la retención del índice de duplicados: más atrás
+    los mensajes se ignoran.
+    """
+    dias, modo = 7, 'reanudar'
+    for opcion in opciones:
+        opcion = opcion.lower()
+        if opcion in ('nuevo', 'reanudar'):
+            modo = opcion
+        elif opcion.endswith('d') and opcion[:-1].isdigit() and 1 <= int(opcion[:-1]) <= RETENCION_DEDUPE_DIAS:
+            dias = int(opcion[:-1])
+        else:
+            # Antes `!escanear 1000` era una cantidad de mensajes: un número suelto no se toma como días
+            await ctx.send(
+                f"❌ Uso: `!escanear [Nd] [nuevo|reanudar]`, con N días entre 1 y {RETENCION_DEDUPE_DIAS} "
+                f"(por ejemplo `!escanear 7d`)"
+            )
+            return
     
-    # Obtener el canal de ServicioAPP
-    canal_servicio = bot.get_channel(CANAL_SERVICIOAPP)
+    servidor = _servidor(ctx)
+    tracker = servidor.tracker
+    # Obtener los canales de ServicioAPP
+    canales, faltantes = _canales_servicio(servidor)
     
-    if not canal_servicio:
-        await ctx.send(f"❌ No se pudo acceder al canal de Servicio (ID: {CANAL_SERVICIOAPP})")
+    if faltantes:
+        await ctx.send(f"❌ No se pudo acceder al canal de Servicio (ID: {', '.join(map(str, faltantes))})")
         return
+    ids_canales = sorted(canal.id for canal in canales)
     
-    # Contadores
-    entradas_encontradas = 0
-    salidas_encontradas = 0
-    procesados = 0
-    mensajes_temp = []
+    cursor = tracker.scan_cursor
+    # Los cursores de antes de los canales adicionales guardan un solo 'canal'
+    if cursor and cursor.get('canales', [cursor.get('canal')]) == ids_canales and modo != 'nuevo':
+        punto_inicio = discord.Object(id=cursor['ultimo_id'])
+        estado = await ctx.send(
+            f"🔄 Reanudando escaneo interrumpido ({cursor['revisados']} mensajes ya revisados)..."
+        )
+    else:
+        desde = datetime.now(timezone.utc) - timedelta(days=dias)
+        cursor = {
+            'canales': ids_canales,
+            'desde': desde.isoformat(),
+            'ultimo_id': None,
+            'revisados': 0,
+            'entradas': 0,
+            'salidas': 0
+        }
+        punto_inicio = desde
+        estado = await ctx.send(
+            f"🔍 Escaneando los mensajes de los últimos {dias} días "
+            f"{'del canal' if len(canales) == 1 else f'de los {len(canales)} canales'} de Servicio..."
+        )
     
+    lote = []
+    ultimo_progreso = time.monotonic()
     try:
-        # Obtener mensajes históricos y guardarlos en una lista
-        await ctx.send("📥 Descargando mensajes...")
-        async for message in canal_servicio.history(limit=cantidad):
-            if message.author.name == 'Servicio':
-                mensajes_temp.append(message)
-        
-        # Invertir para procesar del más antiguo al más reciente
-        mensajes_temp.reverse()
-        
-        await ctx.send(f"🔄 Procesando {len(mensajes_temp)} mensajes en orden cronológico...")
-        
-        # Procesar mensajes en orden cronológico (del más antiguo al más reciente)
-        for message in mensajes_temp:
-            
-            procesados += 1
-            
-            # Patrones para detectar entrada/salida
-            # Formato: **[ABC12345] Nombre Apellido** ha entrado/salido en servicio
-            patron_entrada = r'\*?\*?\[([A-Z]{3}\d{5})\]\s+([^\*]+?)\*?\*?\s+ha entrado en servicio'
-            patron_salida = r'\*?\*?\[([A-Z]{3}\d{5})\]\s+([^\*]+?)\*?\*?\s+ha salido de servicio'
-            
-            match_entrada = re.search(patron_entrada, message.content, re.IGNORECASE)
-            match_salida = re.search(patron_salida, message.content, re.IGNORECASE)
-            
-            if match_entrada:
-                dni = match_entrada.group(1).upper()
-                nombre = match_entrada.group(2).strip()
-                
-                # Usar la fecha del mensaje histórico (ya viene con timezone UTC)
-                entrada_time = message.created_at
-                
-                # Registrar en el sistema con la fecha correcta
-                fecha_str = entrada_time.strftime('%Y-%m-%d')
-                
-                # Solo registrar si es de esta semana (comparar con datetime timezone-aware)
-                ahora_utc = datetime.now(timezone.utc)
-                if entrada_time >= ahora_utc - timedelta(days=7):
-                    # Verificar si ya no está registrado para evitar duplicados
-                    if dni not in [d for d in tracker.daily_records[fecha_str].keys()]:
-                        tracker.active_shifts[dni] = {
-                            'nombre': nombre,
-                            'entrada': entrada_time
-                        }
-                        entradas_encontradas += 1
-                        print(f"📥 Entrada histórica: {nombre} ({dni}) - {entrada_time}")
-            
-            elif match_salida:
-                dni = match_salida.group(1).upper()
-                nombre = match_salida.group(2).strip()
-                
-                if dni in tracker.active_shifts:
-                    entrada = tracker.active_shifts[dni]['entrada']
-                    salida = message.created_at
-                    horas = (salida - entrada).total_seconds() / 3600
-                    
-                    fecha_str = entrada.strftime('%Y-%m-%d')
-                    
-                    tracker.daily_records[fecha_str][dni].append({
-                        'entrada': entrada,
-                        'salida': salida,
-                        'horas': horas,
-                        'nombre': nombre
-                    })
-                    
-                    tracker.weekly_stats[dni]['nombre'] = nombre
-                    tracker.weekly_stats[dni]['total_horas'] += horas
-                    tracker.weekly_stats[dni]['total_entradas'] += 1
-                    tracker.weekly_stats[dni]['daily_hours'][fecha_str] += horas
-                    tracker.weekly_stats[dni]['daily_entries'][fecha_str] += 1
-                    
-                    del tracker.active_shifts[dni]
-                    salidas_encontradas += 1
-                    print(f"📤 Salida histórica: {nombre} ({dni}) - {horas:.2f}h")
+        # Del más antiguo al más reciente: los eventos se aplican a medida que llegan
+        async with _historial_servicio(servidor, canales, punto_inicio) as mensajes:
+            async for message in mensajes:
+                lote.append(message)
+                if len(lote) >= TAMANO_LOTE_ESCANEO:
+                    await _aplicar_lote_historial(servidor, lote, cursor)
+                    lote = []
+                    # Editar en cada lote gasta el rate limit de Discord que comparte la lectura del historial
+                    if time.monotonic() - ultimo_progreso >= INTERVALO_PROGRESO_ESCANEO:
+                        ultimo_progreso = time.monotonic()
+                        await estado.edit(content=(
+                            f"🔄 Escaneando... {cursor['revisados']} mensajes revisados | "
+                            f"📥 {cursor['entradas']} entradas | 📤 {cursor['salidas']} salidas"
+                        ))
+        if lote:
+            await _aplicar_lote_historial(servidor, lote, cursor)
         
-        # Guardar datos
-        tracker.save_data()
+        # Escaneo completo: ya no hay nada que reanudar
+        await servidor.ingesta.ejecutar(tracker.guardar_cursor_escaneo, None)
+        await servidor.ingesta.ejecutar(tracker.save_data)
+        await estado.edit(content=f"✅ Escaneo completado: {cursor['revisados']} mensajes revisados")
         
         # Reporte
         embed = discord.Embed(
             title="✅ Escaneo Completado",
             color=discord.Color.green()
         )
-        embed.add_field(name="Mensajes revisados", value=str(procesados), inline=True)
-        embed.add_field(name="Entradas encontradas", value=str(entradas_encontradas), inline=True)
-        embed.add_field(name="Salidas encontradas", value=str(salidas_encontradas), inline=True)
+        embed.add_field(name="Mensajes revisados", value=str(cursor['revisados']), inline=True)
+        embed.add_field(name="Entradas encontradas", value=str(cursor['entradas']), inline=True)
+        embed.add_field(name="Salidas encontradas", value=str(cursor['salidas']), inline=True)
         embed.add_field(
             name="ℹ️ Nota", 
-            value="Solo se registraron eventos de los últimos 7 días para mantener coherencia con las estadísticas semanales.",
+            value=f"Se procesaron los eventos desde {cursor['desde'][:10]}.",
             inline=False
         )
         
@@ -562,25 +1213,75 @@ async def escanear_historial(ctx, cantidad: int = 100):
     except discord.Forbidden:
         await ctx.send("❌ No tengo permisos para leer el historial del canal de Servicio")
     except Exception as e:
-        await ctx.send(f"❌ Error al escanear: {str(e)}")
-        print(f"Error en escanear_historial: {e}")
+        await ctx.send(f"❌ Error al escanear: {str(e)}\nUsa `!escanear` para reanudar desde el último lote guardado.")
+        log.exception("Error en escanear_historial: %s", e)
 
-@bot.command(name='reset_semana')
+@bot.command(name='exportar')
 @commands.has_permissions(administrator=True)
-async def reset_semanal(ctx):
-    """Resetea las estadísticas semanales (solo administradores)"""
-    tracker.weekly_stats.clear()
-    tracker.save_data()
-    await ctx.send("✅ Estadísticas semanales reseteadas.")
+async def exportar_turnos(ctx, desde=None, hasta=None, *opciones):
+    """Exporta los turnos de un rango como archivo CSV o JSONL (solo administradores)"""
+    uso = "❌ Uso: `!exportar <desde> <hasta> [dni] [csv|jsonl] [gz]` con fechas `2026-09-01`"
+    fechas = [parsear_periodo(desde), parsear_periodo(hasta)]
+    if not all(fecha and len(fecha) == 10 for fecha in fechas):
+        await ctx.send(uso)
+        return
+    desde, hasta = sorted(fechas)
+    servidor = _servidor(ctx)
+    
+    # Opciones en cualquier orden: formato, 'gz' para forzar la compresión y un DNI (con números).
+    # Cualquier otra cosa es un error: un formato mal escrito no se toma como DNI
+    formato, dni = 'csv', None
+    comprimir = (datetime.fromisoformat(hasta) - datetime.fromisoformat(desde)).days + 1 > exportar.DIAS_GZIP
+    for opcion in opciones:
+        if opcion.lower() in exportar.FORMATOS:
+            formato = opcion.lower()
+        elif opcion.lower() == 'gz':
+            comprimir = True
+        elif dni is None and opcion.isalnum() and any(caracter.isdigit() for caracter in opcion):
+            dni = _resolver_dni(servidor, opcion)
+        else:
+            await ctx.send(f"❌ Opción desconocida: `{opcion}`\n{uso}")
+            return
+    
+    tracker = servidor.tracker
+    if tracker.writer:
+        await tracker.writer.flush()  # Con SQLite, que la exportación vea lo último que se escribió
+    filas = tracker.filas_exportacion(desde, hasta, dni)
+    nombre = exportar.nombre_archivo(desde, hasta, dni, formato, comprimir)
+    carpeta = tempfile.mkdtemp(prefix='exportar_')
+    path = os.path.join(carpeta, nombre)
+    try:
+        estado = await ctx.send(f"⏳ Exportando turnos del {desde} al {hasta}...")
+        # Se escribe de a lotes en un hilo: on_message sigue atendiendo entradas y salidas
+        cantidad = await asyncio.to_thread(exportar.escribir, filas, path, formato, comprimir)
+        if cantidad == 0:
+            await estado.edit(content=f"No hay turnos entre {desde} y {hasta}.")
+            return
+        
+        limite = ctx.guild.filesize_limit if ctx.guild else discord.utils.DEFAULT_FILE_SIZE_LIMIT_BYTES
+        tamano = os.path.getsize(path)
+        if tamano > limite:
+            await estado.edit(content=(
+                f"❌ El archivo ({tamano / 1024 / 1024:.1f} MB) supera el límite de Discord "
+                f"({limite / 1024 / 1024:.0f} MB). Probá con un rango más corto o con `gz`."
+            ))
+            return
+        await ctx.send(
+            f"📤 {cantidad} turnos exportados ({desde} → {hasta}{f', DNI {dni}' if dni else ''})",
+            file=discord.File(path, filename=nombre)
+        )
+        await estado.delete()
+        log.info("📤 Exportación de %d turnos (%s, %s a %s) pedida por %s",
+                 cantidad, nombre, desde, hasta, ctx.author)
+    finally:
+        shutil.rmtree(carpeta, ignore_errors=True)
 
 @bot.command(name='limpiar_datos')
 @commands.has_permissions(administrator=True)
 async def limpiar_datos(ctx):
     """Limpia TODOS los datos (solo administradores) - Útil antes de reescanear"""
-    tracker.active_shifts.clear()
-    tracker.daily_records.clear()
-    tracker.weekly_stats.clear()
-    tracker.save_data()
+    servidor = _servidor(ctx)
+    await servidor.ingesta.ejecutar(servidor.tracker.limpiar)
     
     embed = discord.Embed(
         title="🗑️ Datos Limpiados",
@@ -589,24 +1290,65 @@ async def limpiar_datos(ctx):
     )
     await ctx.send(embed=embed)
 
-@tasks.loop(hours=168)  # 7 días
-async def weekly_reset():
-    """Resetea automáticamente las estadísticas cada semana"""
-    tracker.weekly_stats.clear()
-    tracker.save_data()
+@bot.command(name='perfil')
+@commands.has_permissions(administrator=True)
+async def perfilar(ctx, segundos: int = 60, modo: str = 'todo'):
+    """Perfila el bot durante N segundos y adjunta el informe (solo administradores).
+    
+    `!perfil 120 cpu` solo mide CPU (cProfile), `memoria` solo asignaciones
+    (tracemalloc) y `todo` ambas. Los tiempos por handler y por comando van
+    siempre. Mientras dura la ventana el bot anda algo más lento.
+    """
+    modo = modo.lower()
+    if modo not in ('todo', 'cpu', 'memoria'):
+        await ctx.send("❌ Uso: `!perfil [segundos] [todo|cpu|memoria]`")
+        return
+    segundos = max(1, min(segundos, perfil.MAX_SEGUNDOS))
+    try:
+        sesion = perfil.iniciar(cpu=modo != 'memoria', memoria=modo != 'cpu', motivo=f'!perfil {modo}')
+    except (RuntimeError, ValueError) as e:
+        await ctx.send(f"❌ No se pudo iniciar el perfilado: {e}")
+        return
+    
+    estado = await ctx.send(f"🔬 Perfilando durante {segundos}s ({modo})...")
+    path = await perfil.completar(sesion, segundos)
+    try:
+        await ctx.send(
+            f"🔬 Perfil de {segundos}s ({modo}) pedido por {ctx.author}",
+            file=discord.File(path, filename=os.path.basename(path))
+        )
+        await estado.delete()
+    finally:
+        shutil.rmtree(os.path.dirname(path), ignore_errors=True)
 
-print("🚀 Iniciando bot...")
-print(f"   Token configurado: {'✅ Sí' if TOKEN else '❌ No'}")
-print(f"   Longitud del token: {len(TOKEN) if TOKEN else 0} caracteres")
+@tasks.loop(minutes=COMPACTACION_MINUTOS)
+async def compactar_journal():
+    """Archiva los días viejos, escribe un snapshot periódico, vacía el journal y purga el índice de duplicados"""
+    for servidor in servidores:
+        # Por el escritor único: archivar quita días del historial y no puede cruzarse con una salida
+        try:
+            await servidor.ingesta.ejecutar(servidor.tracker.archivar)
+        except Exception:
+            # Sin archivar, los días siguen en memoria y en el snapshot: no se pierde nada
+            log.exception("❌ Error al archivar los días viejos de %s", _nombre_servidor(servidor))
+        await servidor.ingesta.ejecutar(servidor.tracker.compactar)
 
-try:
-    bot.run(TOKEN)
-except discord.LoginFailure:
-    print("❌ ERROR DE LOGIN:")
-    print("   1. Verifica que el token sea correcto")
-    print("   2. Regenera el token en Discord Developer Portal")
-    print("   3. Actualiza la variable DISCORD_TOKEN en Railway")
-    raise
-except Exception as e:
-    print(f"❌ ERROR INESPERADO: {e}")
-    raise
\ No newline at end of file
+if __name__ == '__main__':
+    if not TOKEN:
+        raise ValueError("❌ ERROR CRÍTICO: No se encontró DISCORD_TOKEN en las variables de entorno")
+    
+    log.info("🚀 Iniciando bot... (token configurado: %s, %d caracteres)",
+             '✅ Sí' if TOKEN else '❌ No', len(TOKEN) if TOKEN else 0)
+    configurar_servidores()
+
+    try:
+        # log_handler=None: los logs de discord.py pasan por la configuración de logs.py
+        bot.run(TOKEN, log_handler=None)
+    except discord.LoginFailure:
+        log.critical("❌ ERROR DE LOGIN: 1. Verifica que el token sea correcto "
+                     "2. Regenera el token en Discord Developer Portal "
+                     "3. Actualiza la variable DISCORD_TOKEN en Railway")
+        raise
+    except Exception as e:
+        log.critical("❌ ERROR INESPERADO: %s", e)
+        raise
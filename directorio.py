@@ -0,0 +1,113 @@
+"""Índice de empleados conocidos para buscar por DNI o nombre a medio escribir.
+
+Lo usan el autocompletado de los comandos de barra y la resolución de DNIs
+parciales en los comandos con prefijo (`!hoy 35534` -> LCR35534). Cada clave
+(DNI, su parte numérica y cada palabra del nombre) se guarda en una lista
+ordenada: una búsqueda por prefijo es un bisect más el recorrido de las
+coincidencias. Para buscar por el final del DNI (`534`) hay una segunda lista
+con los DNIs invertidos. Con miles de empleados una búsqueda tarda microsegundos.
+"""
+import unicodedata
+from bisect import bisect_left, insort
+from itertools import chain, islice
+
+MAX_RESULTADOS = 25  # Límite de opciones de un autocompletado de Discord
+
+
+def normalizar(texto):
+    """Minúsculas y sin tildes: 'José' y 'jose' son la misma clave"""
+    texto = unicodedata.normalize('NFKD', texto.casefold())
+    return ''.join(c for c in texto if not unicodedata.combining(c))
+
+
+def _claves(dni, nombre):
+    dni_normalizado = normalizar(dni)
+    claves = {dni_normalizado, dni_normalizado.lstrip('abcdefghijklmnopqrstuvwxyz')}
+    nombre = normalizar(nombre)
+    claves.add(nombre)
+    claves.update(nombre.split())
+    claves.discard('')
+    return claves
+
+
+def _prefijos(lista, consulta):
+    """DNIs de las claves de `lista` que empiezan con `consulta`"""
+    i = bisect_left(lista, (consulta,))
+    while i < len(lista) and lista[i][0].startswith(consulta):
+        yield lista[i][1]
+        i += 1
+
+
+class DirectorioEmpleados:
+    """DNI -> nombre de todos los empleados vistos, con búsqueda por prefijo y sufijo"""
+
+    def __init__(self):
+        self.nombres = {}
+        self._claves = []  # [(clave, dni)] ordenada
+        self._sufijos = []  # [(dni invertido, dni)] ordenada
+
+    def __len__(self):
+        return len(self.nombres)
+
+    def agregar(self, dni, nombre):
+        """Registra un empleado (o su nombre nuevo). Devuelve False si ya se conocía igual"""
+        anterior = self.nombres.get(dni)
+        if anterior == nombre:
+            return False
+        if anterior is None:
+            insort(self._sufijos, (normalizar(dni)[::-1], dni))
+        else:
+            for clave in _claves(dni, anterior):
+                self._claves.pop(bisect_left(self._claves, (clave, dni)))
+        self.nombres[dni] = nombre
+        for clave in _claves(dni, nombre):
+            insort(self._claves, (clave, dni))
+        return True
+
+    def cargar(self, nombres):
+        """Carga {dni: nombre} de una vez (al iniciar), ordenando al final"""
+        for dni, nombre in nombres.items():
+            if dni not in self.nombres:
+                self._sufijos.append((normalizar(dni)[::-1], dni))
+            self.nombres[dni] = nombre
+        self._claves = sorted(
+            {(clave, dni) for dni, nombre in self.nombres.items() for clave in _claves(dni, nombre)}
+        )
+        self._sufijos.sort()
+
+    def buscar(self, texto, limite=MAX_RESULTADOS):
+        """[(dni, nombre)] que empiezan (DNI o alguna palabra del nombre) o terminan (DNI) con `texto`"""
+        consulta = normalizar(texto.strip())
+        if not consulta:
+            return list(islice(self.nombres.items(), limite))
+        encontrados = {}  # dict: sin repetir y en orden de relevancia
+        for dni in _prefijos(self._claves, consulta):
+            encontrados[dni] = None
+            if len(encontrados) >= limite:
+                break
+        if len(encontrados) < limite:
+            for dni in _prefijos(self._sufijos, consulta[::-1]):
+                encontrados[dni] = None
+                if len(encontrados) >= limite:
+                    break
+        return [(dni, self.nombres[dni]) for dni in encontrados]
+
+    def resolver(self, texto):
+        """DNI completo para lo que escribió el usuario: el exacto o la única coincidencia por DNI"""
+        dni = texto.strip().upper()
+        if dni in self.nombres:
+            return dni
+        consulta = normalizar(dni)
+        # Solo coincidencias por DNI (con o sin las letras), no por nombre; con dos ya es ambiguo
+        candidatos = set()
+        for candidato in chain(_prefijos(self._claves, consulta), _prefijos(self._sufijos, consulta[::-1])):
+            if consulta in normalizar(candidato):
+                candidatos.add(candidato)
+                if len(candidatos) > 1:
+                    return dni
+        return candidatos.pop() if candidatos else dni
+
+    def clear(self):
+        self.nombres.clear()
+        self._claves.clear()
+        self._sufijos.clear()
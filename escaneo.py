@@ -0,0 +1,148 @@
+"""Lectura del historial de los canales de Servicio para !escanear y la recuperación de huecos.
+
+Con un solo canal los mensajes se leen y aplican a medida que llegan. Con
+varios (un canal o hilo por sector), cada uno se lee en su propia tarea, con a
+lo sumo SCAN_CONCURRENCY pedidos de página a la vez, y se mezclan por
+created_at con un k-way merge sobre un heap a medida que llegan: una entrada
+publicada en un canal y su salida en otro se aplican en orden, y los lotes se
+aplican (y el cursor avanza) sin esperar a que termine ningún canal. Los
+lectores van por delante a lo sumo una página, y descartan lo que no es de
+Servicio antes de guardarlo. Si Discord limita (429) o falla (5xx), todos los
+lectores esperan el mismo backoff y siguen desde la última página leída.
+"""
+import asyncio
+import heapq
+import logging
+import time
+
+import discord
+
+log = logging.getLogger('horarios.escaneo')
+
+MENSAJES_POR_PAGINA = 100  # Lo que trae discord.py en cada pedido de historial
+REINTENTOS = 5
+
+
+class BackoffCompartido:
+    """Pausa común a todos los lectores de un escaneo: un 429 o un 5xx frena a todos"""
+
+    def __init__(self, base=1.0, maximo=60.0):
+        self.base = base
+        self.maximo = maximo
+        self.fallos = 0
+        self._hasta = 0.0
+
+    async def esperar(self):
+        demora = self._hasta - time.monotonic()
+        if demora > 0:
+            await asyncio.sleep(demora)
+
+    def fallo(self, espera=None):
+        """Registra un fallo y devuelve cuánto hay que esperar (Retry-After o exponencial)"""
+        self.fallos += 1
+        demora = espera or min(self.maximo, self.base * 2 ** (self.fallos - 1))
+        self._hasta = max(self._hasta, time.monotonic() + demora)
+        return demora
+
+    def exito(self):
+        self.fallos = 0
+
+
+def _reintentable(error):
+    return error.status == 429 or error.status >= 500
+
+
+_FIN = object()  # Un lector terminó su canal
+
+
+async def leer_canal(canal, despues, semaforo, backoff, cola, filtro=None):
+    """Pone en `cola` los mensajes de un canal posteriores a `despues`, del más antiguo al más reciente.
+
+    Lee de a una página: el semáforo acota los pedidos al mismo tiempo (no los
+    canales) y la cola llena frena al lector hasta que la mezcla lo alcance.
+    Los mensajes que no pasan `filtro` se descartan antes de encolarse.
+    """
+    desde = despues
+    intentos = 0
+    try:
+        while True:
+            await backoff.esperar()
+            try:
+                async with semaforo:
+                    pagina = [
+                        message async for message in
+                        canal.history(limit=MENSAJES_POR_PAGINA, after=desde, oldest_first=True)
+                    ]
+            except discord.HTTPException as e:
+                if not _reintentable(e) or intentos >= REINTENTOS:
+                    raise
+                intentos += 1
+                demora = backoff.fallo(getattr(e, 'retry_after', None))
+                log.warning("⚠️ Error %s al leer el historial de %s: reintento en %.1fs", e.status, canal, demora)
+                continue
+            intentos = 0
+            backoff.exito()
+            for message in pagina:
+                if filtro is None or filtro(message):
+                    await cola.put(message)
+            if len(pagina) < MENSAJES_POR_PAGINA:
+                break
+            desde = discord.Object(id=pagina[-1].id)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        await cola.put(e)  # La mezcla la relanza: un canal sin permisos corta el escaneo
+        return
+    await cola.put(_FIN)
+
+
+async def _siguiente(cabezas, indice, cola):
+    """Agrega al heap el próximo mensaje del canal `indice` (nada si ya terminó)"""
+    item = await cola.get()
+    if item is _FIN:
+        return
+    if isinstance(item, Exception):
+        raise item
+    heapq.heappush(cabezas, (item.created_at, item.id, indice, item))
+
+
+async def historial_combinado(canales, despues, concurrencia=3, filtro=None):
+    """Mensajes de todos los canales posteriores a `despues`, mezclados por created_at a medida que llegan.
+
+    Cada canal tiene su lector y una cola de a lo sumo una página; el heap
+    guarda la cabeza de cada cola y se entrega siempre la más antigua. En
+    memoria hay, como mucho, una página por canal.
+    """
+    semaforo = asyncio.Semaphore(concurrencia)
+    backoff = BackoffCompartido()
+    colas = [asyncio.Queue(MENSAJES_POR_PAGINA) for _ in canales]
+    tareas = [
+        asyncio.create_task(leer_canal(canal, despues, semaforo, backoff, cola, filtro))
+        for canal, cola in zip(canales, colas)
+    ]
+    entregados = 0
+    try:
+        cabezas = []
+        for indice, cola in enumerate(colas):
+            await _siguiente(cabezas, indice, cola)
+        while cabezas:
+            _, _, indice, message = heapq.heappop(cabezas)
+            yield message
+            entregados += 1
+            await _siguiente(cabezas, indice, colas[indice])
+    finally:
+        # Al terminar, fallar o cortar el escaneo no quedan lectores sueltos
+        for tarea in tareas:
+            tarea.cancel()
+    log.info("📚 Historial de %d canales mezclado: %d mensajes", len(canales), entregados)
+
+
+def historial(canales, despues, concurrencia=3, filtro=None):
+    """Iterador async de los mensajes en orden cronológico: un canal se recorre tal cual, varios se mezclan.
+
+    Con un solo canal `filtro` no se aplica (los mensajes se filtran al aplicarlos).
+    Usarlo con contextlib.aclosing para que los lectores se cancelen si el escaneo se corta.
+    """
+    if len(canales) == 1:
+        return canales[0].history(limit=None, after=despues, oldest_first=True)
+    return historial_combinado(canales, despues, concurrencia, filtro)
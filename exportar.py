@@ -0,0 +1,61 @@
+"""Exportación de turnos a CSV o JSONL (opcionalmente con gzip) para !exportar.
+
+Las filas llegan de un iterador (ShiftTracker.filas_exportacion) y se escriben
+de a lotes en un hilo aparte: la memoria no depende del largo del rango y el
+event loop sigue procesando entradas y salidas mientras tanto.
+"""
+import csv
+import gzip
+import json
+from itertools import islice
+
+from registros import desde_ms
+
+FORMATOS = ('csv', 'jsonl')
+COLUMNAS = ('fecha', 'dni', 'nombre', 'entrada', 'salida', 'horas')
+TAMANO_LOTE = 1000
+# Rangos de más días que esto se comprimen con gzip
+DIAS_GZIP = 31
+
+
+def nombre_archivo(desde, hasta, dni, formato, comprimir):
+    partes = ['turnos', desde, hasta] + ([dni] if dni else [])
+    return '_'.join(partes) + f'.{formato}' + ('.gz' if comprimir else '')
+
+
+def _registro(fila):
+    fecha, dni, nombre, entrada_ms, salida_ms = fila
+    return (
+        fecha, dni, nombre,
+        desde_ms(entrada_ms).isoformat(),
+        desde_ms(salida_ms).isoformat(),
+        round((salida_ms - entrada_ms) / 3_600_000, 4)
+    )
+
+
+def escribir(filas, path, formato='csv', comprimir=False):
+    """Escribe las filas (fecha, dni, nombre, entrada_ms, salida_ms) y devuelve cuántas se exportaron"""
+    if comprimir:
+        f = gzip.open(path, 'wt', encoding='utf-8', newline='')
+    else:
+        f = open(path, 'w', encoding='utf-8', newline='')
+
+    cantidad = 0
+    with f:
+        escritor = csv.writer(f) if formato == 'csv' else None
+        if escritor:
+            escritor.writerow(COLUMNAS)
+        filas = iter(filas)
+        while True:
+            lote = [_registro(fila) for fila in islice(filas, TAMANO_LOTE)]
+            if not lote:
+                break
+            if escritor:
+                escritor.writerows(lote)
+            else:
+                f.write(''.join(
+                    json.dumps(dict(zip(COLUMNAS, registro)), ensure_ascii=False) + '\n'
+                    for registro in lote
+                ))
+            cantidad += len(lote)
+    return cantidad
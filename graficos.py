@@ -0,0 +1,135 @@
+"""Gráficos PNG para !grafico: mapa de calor de horas por día y cobertura por hora.
+
+El bot arma un extracto chico con lo justo para dibujar (listas de horas por
+día, o los intervalos de los turnos en dos arrays de milisegundos) y el
+renderizado corre en un proceso aparte: matplotlib tarda cientos de
+milisegundos por imagen y en el event loop frenaría el gateway. El proceso se
+crea con 'spawn', así no hereda los hilos ni el estado del bot. 'spawn' vuelve
+a importar el módulo principal (bot.py) como __mp_main__: por eso bot.py no
+abre almacenamientos al importarse (eso pasa en configurar_servidores(), bajo
+`if __name__ == '__main__'`) y el hijo solo define comandos y configura logs.
+
+matplotlib está en requirements.txt; si falta en una instalación local,
+!grafico avisa y el resto del bot funciona igual.
+"""
+import asyncio
+import importlib.util
+import io
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+
+log = logging.getLogger('horarios.graficos')
+
+HORAS = 'horas'
+COBERTURA = 'cobertura'
+TIPOS = (HORAS, COBERTURA)
+MAX_EMPLEADOS = 40  # Filas del mapa de calor: más no se leen
+PROCESOS = 1
+HORA_MS = 3_600_000
+
+_pool = None
+
+
+def disponible():
+    """True si matplotlib está instalado (se importa recién en el proceso que dibuja)"""
+    return importlib.util.find_spec('matplotlib') is not None
+
+
+def _obtener_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=PROCESOS, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def cerrar():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def renderizar(tipo, extracto):
+    """PNG (bytes) del gráfico, dibujado en el proceso de gráficos"""
+    global _pool
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_obtener_pool(), _dibujar, tipo, extracto)
+    except BrokenProcessPool:
+        # El proceso murió (memoria, señal): el próximo pedido arranca uno nuevo
+        log.error("❌ El proceso de gráficos terminó inesperadamente; se reinicia en el próximo pedido")
+        _pool = None
+        raise
+
+
+def cobertura_por_hora(inicio_ms, horas, entradas, salidas):
+    """Personas en servicio en promedio durante cada hora desde inicio_ms (turnos recortados a la ventana)"""
+    ocupacion = [0.0] * horas
+    fin_ms = inicio_ms + horas * HORA_MS
+    for entrada, salida in zip(entradas, salidas):
+        entrada, salida = max(entrada, inicio_ms), min(salida, fin_ms)
+        while entrada < salida:
+            hora = (entrada - inicio_ms) // HORA_MS
+            corte = min(salida, inicio_ms + (hora + 1) * HORA_MS)
+            ocupacion[hora] += (corte - entrada) / HORA_MS
+            entrada = corte
+    return ocupacion
+
+
+# ============ EN EL PROCESO DE GRÁFICOS ============
+
+def _dibujar(tipo, extracto):
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib.figure import Figure
+
+    figura = _dibujar_horas(Figure, extracto) if tipo == HORAS else _dibujar_cobertura(Figure, extracto)
+    salida = io.BytesIO()
+    figura.savefig(salida, format='png', dpi=110)
+    return salida.getvalue()
+
+
+def _dibujar_horas(Figure, extracto):
+    """Mapa de calor: una fila por empleado, una columna por día, color = horas trabajadas"""
+    dias, filas = extracto['dias'], extracto['filas']
+    figura = Figure(figsize=(max(6.0, 1.5 + 0.32 * len(dias)), max(2.5, 1.2 + 0.3 * len(filas))),
+                    layout='constrained')
+    eje = figura.subplots()
+    imagen = eje.imshow([horas for _, horas in filas], cmap='YlGn', aspect='auto', vmin=0)
+    eje.set_xticks(range(len(dias)), [dia[8:] for dia in dias], fontsize=8)
+    eje.set_yticks(range(len(filas)), [etiqueta for etiqueta, _ in filas], fontsize=8)
+    if len(dias) <= 7:
+        for y, (_, horas) in enumerate(filas):
+            for x, valor in enumerate(horas):
+                if valor:
+                    eje.text(x, y, f'{valor:.1f}', ha='center', va='center', fontsize=7)
+    eje.set_xlabel(f"Día ({dias[0]} a {dias[-1]})")
+    eje.set_title(extracto['titulo'])
+    figura.colorbar(imagen, ax=eje, label='Horas')
+    return figura
+
+
+def _dibujar_cobertura(Figure, extracto):
+    """Línea de tiempo: personas en servicio (promedio de cada hora) a lo largo del período"""
+    ocupacion = cobertura_por_hora(extracto['inicio_ms'], extracto['horas'], extracto['entradas'], extracto['salidas'])
+    inicio = datetime.fromtimestamp(extracto['inicio_ms'] / 1000, tz=timezone.utc)
+    total = extracto['horas_periodo']  # El eje muestra el período entero aunque los datos lleguen hasta ahora
+    figura = Figure(figsize=(min(16.0, max(8.0, total / 24)), 3.5), layout='constrained')
+    eje = figura.subplots()
+    # Con where='post' el último valor necesita un punto más para dibujar su hora
+    x, y = range(len(ocupacion) + 1), ocupacion + ocupacion[-1:]
+    eje.fill_between(x, y, step='post', alpha=0.6)
+    eje.step(x, y, where='post', linewidth=0.8)
+    marcas = list(range(0, total + 1, 3 if total <= 24 else 24 if total <= 24 * 16 else 24 * 7))
+    eje.set_xticks(marcas, [
+        (inicio + timedelta(hours=h)).strftime('%H:%M' if total <= 24 else '%d/%m') for h in marcas
+    ], fontsize=8)
+    eje.set_xlim(0, total)
+    eje.set_ylim(bottom=0)
+    eje.set_ylabel('En servicio')
+    eje.grid(axis='y', alpha=0.3)
+    eje.set_title(extracto['titulo'])
+    return figura
@@ -0,0 +1,90 @@
+"""Logging del bot: niveles configurables, handlers no bloqueantes y formato JSON opcional.
+
+Variables de entorno:
+- LOG_LEVEL: DEBUG, INFO (por defecto), WARNING, ERROR
+- LOG_FORMAT: 'texto' (por defecto) o 'json' (una línea JSON por registro)
+- LOG_DEBUG_SAMPLE: deja pasar 1 de cada N registros DEBUG de alto volumen (por defecto 1 = todos)
+
+Los handlers reales (stdout) corren en un hilo aparte detrás de una cola, así
+que loguear desde el event loop solo cuesta encolar el registro.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+FORMATO_TEXTO = '%(asctime)s %(levelname)-7s %(name)s: %(message)s'
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por registro (los campos de extra={'campos': {...}} se agregan al objeto)"""
+
+    def format(self, record):
+        data = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'nivel': record.levelname,
+            'logger': record.name,
+            'mensaje': record.getMessage()
+        }
+        campos = getattr(record, 'campos', None)
+        if campos:
+            data.update(campos)
+        if record.exc_info:
+            data['excepcion'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class MuestreoFilter(logging.Filter):
+    """Deja pasar 1 de cada N registros DEBUG marcados con extra={'muestreo': True}"""
+
+    def __init__(self, cada):
+        super().__init__()
+        self.cada = max(1, cada)
+        self._contador = 0
+
+    def filter(self, record):
+        if self.cada == 1 or record.levelno > logging.DEBUG or not getattr(record, 'muestreo', False):
+            return True
+        self._contador += 1
+        return self._contador % self.cada == 1
+
+
+def configurar_logging(nivel=None, formato=None, muestreo=None):
+    """Configura el logger raíz (también recibe los logs de discord.py)"""
+    global _listener
+    nivel = (nivel or os.getenv('LOG_LEVEL', 'INFO')).upper()
+    formato = formato or os.getenv('LOG_FORMAT', 'texto')
+    muestreo = muestreo or int(os.getenv('LOG_DEBUG_SAMPLE', '1'))
+
+    salida = logging.StreamHandler(sys.stdout)
+    salida.setFormatter(JsonFormatter() if formato == 'json' else logging.Formatter(FORMATO_TEXTO))
+
+    # El filtro de muestreo corre antes de encolar: lo descartado no cuesta nada más
+    cola = queue.SimpleQueue()
+    handler = logging.handlers.QueueHandler(cola)
+    handler.addFilter(MuestreoFilter(muestreo))
+
+    raiz = logging.getLogger()
+    raiz.handlers[:] = [handler]
+    raiz.setLevel(nivel)
+    # discord.py es muy verboso en DEBUG; solo sube a DEBUG si se pide explícitamente
+    logging.getLogger('discord').setLevel(max(logging.getLevelName(nivel), logging.INFO))
+
+    if _listener:
+        _listener.stop()
+    _listener = logging.handlers.QueueListener(cola, salida, respect_handler_level=True)
+    _listener.start()
+    atexit.register(detener_logging)
+
+
+def detener_logging():
+    """Vacía la cola de logs pendientes (al apagar)"""
+    global _listener
+    if _listener:
+        _listener.stop()
+        _listener = None
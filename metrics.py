@@ -0,0 +1,206 @@
+"""Métricas en formato Prometheus y servidor HTTP de salud (/ , /health y /metrics).
+
+El servidor corre con aiohttp (ya instalado con discord.py) en el mismo event
+loop del bot; se importa recién al iniciarlo, así el núcleo de ingesta
+(tracker.py) se puede usar sin discord.py ni aiohttp. Las métricas son contadores en memoria: registrarlas cuesta un
+par de operaciones de diccionario y no hace I/O.
+"""
+import asyncio
+import json
+import logging
+import math
+from bisect import bisect_left
+
+log = logging.getLogger('horarios.metrics')
+
+# Buckets (segundos) para latencias de handlers y escrituras
+BUCKETS_LATENCIA = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REGISTRO = []
+
+
+def _par_etiqueta(nombre_etiqueta, valor):
+    valor = str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return f'{nombre_etiqueta}="{valor}"'
+
+
+def _etiqueta(nombre_etiqueta, valor):
+    if nombre_etiqueta is None or valor is None:
+        return ''
+    return f'{{{_par_etiqueta(nombre_etiqueta, valor)}}}'
+
+
+def _numero(valor):
+    if math.isnan(valor):
+        return 'NaN'
+    if math.isinf(valor):
+        return '+Inf' if valor > 0 else '-Inf'
+    return repr(float(valor))
+
+
+class Counter:
+    """Contador monótono, opcionalmente con una etiqueta"""
+
+    tipo = 'counter'
+
+    def __init__(self, nombre, ayuda, etiqueta=None):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiqueta = etiqueta
+        self.valores = {} if etiqueta else {None: 0}
+        REGISTRO.append(self)
+
+    def inc(self, cantidad=1, valor_etiqueta=None):
+        self.valores[valor_etiqueta] = self.valores.get(valor_etiqueta, 0) + cantidad
+
+    def muestras(self):
+        for valor_etiqueta, valor in self.valores.items():
+            yield f'{self.nombre}{_etiqueta(self.etiqueta, valor_etiqueta)} {_numero(valor)}'
+
+
+class Gauge:
+    """Valor instantáneo. Con `funcion` se calcula al momento de exponer (número o {etiqueta: número})"""
+
+    tipo = 'gauge'
+
+    def __init__(self, nombre, ayuda, etiqueta=None, funcion=None):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiqueta = etiqueta
+        self.funcion = funcion
+        self.valores = {}
+        REGISTRO.append(self)
+
+    def set(self, valor, valor_etiqueta=None):
+        self.valores[valor_etiqueta] = valor
+
+    def muestras(self):
+        valores = self.valores
+        if self.funcion:
+            try:
+                resultado = self.funcion()
+            except Exception:
+                log.exception("Error al calcular la métrica %s", self.nombre)
+                return
+            valores = resultado if isinstance(resultado, dict) else {None: resultado}
+        for valor_etiqueta, valor in valores.items():
+            yield f'{self.nombre}{_etiqueta(self.etiqueta, valor_etiqueta)} {_numero(valor)}'
+
+
+class Histogram:
+    """Histograma acumulativo con buckets fijos, opcionalmente con una etiqueta"""
+
+    tipo = 'histogram'
+
+    def __init__(self, nombre, ayuda, buckets=BUCKETS_LATENCIA, etiqueta=None):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.buckets = tuple(buckets)
+        self.etiqueta = etiqueta
+        self.series = {} if etiqueta else {None: self._serie()}  # {valor_etiqueta: [conteos, suma, total]}
+        REGISTRO.append(self)
+
+    def _serie(self):
+        return [[0] * (len(self.buckets) + 1), 0.0, 0]  # El último conteo es +Inf
+
+    def observe(self, valor, valor_etiqueta=None):
+        serie = self.series.get(valor_etiqueta)
+        if serie is None:
+            serie = self.series[valor_etiqueta] = self._serie()
+        serie[0][bisect_left(self.buckets, valor)] += 1
+        serie[1] += valor
+        serie[2] += 1
+
+    def muestras(self):
+        for valor_etiqueta, (conteos, suma, total) in self.series.items():
+            etiqueta = f'{_par_etiqueta(self.etiqueta, valor_etiqueta)},' if self.etiqueta else ''
+            acumulado = 0
+            for limite, conteo in zip(self.buckets, conteos):
+                acumulado += conteo
+                yield f'{self.nombre}_bucket{{{etiqueta}le="{limite}"}} {acumulado}'
+            yield f'{self.nombre}_bucket{{{etiqueta}le="+Inf"}} {total}'
+            yield f'{self.nombre}_sum{_etiqueta(self.etiqueta, valor_etiqueta)} {_numero(suma)}'
+            yield f'{self.nombre}_count{_etiqueta(self.etiqueta, valor_etiqueta)} {total}'
+
+
+def exponer():
+    """Texto en formato de exposición de Prometheus con todas las métricas registradas"""
+    lineas = []
+    for metrica in REGISTRO:
+        lineas.append(f'# HELP {metrica.nombre} {metrica.ayuda}')
+        lineas.append(f'# TYPE {metrica.nombre} {metrica.tipo}')
+        lineas.extend(metrica.muestras())
+    return '\n'.join(lineas) + '\n'
+
+
+# ============ MÉTRICAS DEL BOT ============
+MENSAJES_VISTOS = Counter('horarios_mensajes_vistos_total', 'Mensajes recibidos por on_message')
+MENSAJES_PARSEADOS = Counter(
+    'horarios_mensajes_parseados_total', 'Mensajes de Servicio reconocidos como entrada/salida', 'tipo'
+)
+MENSAJES_RECUPERADOS = Counter(
+    'horarios_mensajes_recuperados_total', 'Mensajes leídos al recuperar un hueco (reinicio o reconexión)'
+)
+EVENTOS_APLICADOS = Counter('horarios_eventos_aplicados_total', 'Entradas/salidas aplicadas al tracker', 'tipo')
+ON_MESSAGE_SEGUNDOS = Histogram('horarios_on_message_segundos', 'Duración del handler on_message')
+INGESTA_LOTE = Histogram(
+    'horarios_ingesta_lote_eventos', 'Eventos aplicados por lote del escritor único',
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+COMANDO_SEGUNDOS = Histogram(
+    'horarios_comando_segundos', 'Duración de cada comando (! o de barra), de punta a punta', etiqueta='comando'
+)
+PERSISTENCIA_SEGUNDOS = Histogram('horarios_persistencia_escritura_segundos', 'Duración de cada escritura a disco')
+PERSISTENCIA_CAMBIOS = Counter(
+    'horarios_persistencia_cambios_agrupados_total', 'Cambios escritos (agrupados en menos escrituras)'
+)
+PERSISTENCIA_ERRORES = Counter('horarios_persistencia_errores_total', 'Escrituras a disco fallidas')
+REPORTES_CACHE = Counter('horarios_reportes_cache_total', 'Reportes servidos desde la caché o rearmados', 'resultado')
+NOTIFICACIONES_ENVIADAS = Counter(
+    'horarios_notificaciones_enviadas_total', 'Mensajes de notificación enviados (evento o resumen)', 'tipo'
+)
+NOTIFICACIONES_ERRORES = Counter('horarios_notificaciones_errores_total', 'Notificaciones descartadas por error')
+NOTIFICACION_LATENCIA = Histogram(
+    'horarios_notificacion_latencia_segundos', 'Tiempo desde que se encola un evento hasta que se envía',
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 30.0, 60.0)
+)
+EVENT_LOOP_LAG = Gauge('horarios_event_loop_lag_segundos', 'Retraso del event loop en la última medición')
+EVENT_LOOP_LAG_HIST = Histogram('horarios_event_loop_lag_hist_segundos', 'Distribución del retraso del event loop')
+
+
+async def medir_lag_event_loop(intervalo=0.5):
+    """Mide cuánto se atrasa un sleep: si el loop está bloqueado, el lag crece"""
+    loop = asyncio.get_running_loop()
+    while True:
+        inicio = loop.time()
+        await asyncio.sleep(intervalo)
+        lag = max(0.0, loop.time() - inicio - intervalo)
+        EVENT_LOOP_LAG.set(lag)
+        EVENT_LOOP_LAG_HIST.observe(lag)
+
+
+async def iniciar_servidor_http(puerto, estado):
+    """Levanta el servidor HTTP en el loop actual. `estado()` devuelve un dict con 'conectado'"""
+    from aiohttp import web
+
+    async def salud(request):
+        data = estado()
+        return web.json_response(
+            data,
+            status=200 if data.get('conectado') else 503,
+            dumps=lambda d: json.dumps(d, ensure_ascii=False)
+        )
+
+    async def metricas(request):
+        return web.Response(text=exponer(), content_type='text/plain', charset='utf-8')
+
+    app = web.Application()
+    app.router.add_get('/', salud)
+    app.router.add_get('/health', salud)
+    app.router.add_get('/metrics', metricas)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, '0.0.0.0', puerto).start()
+    log.info("🌐 Servidor HTTP escuchando en el puerto %s (/health, /metrics)", puerto)
+    return runner
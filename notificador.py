@@ -0,0 +1,195 @@
+"""Cola de notificaciones de entradas y salidas hacia el canal de comandos.
+
+on_message solo encola el evento y sigue: los envíos salen en segundo plano,
+dentro del presupuesto de envíos por canal de Discord, así una ráfaga en el
+cambio de turno no deja a los handlers esperando el backoff de un 429.
+
+Modos (NOTIFY_MODE):
+- 'auto' (por defecto): agrupa lo que llega en la ventana; si son pocos
+  eventos se envía cada uno con su embed, si son más va un resumen
+  ("5 entradas, 3 salidas") con el detalle de cada evento
+- 'evento': un embed por evento, como antes (respetando el presupuesto)
+- 'resumen': siempre resúmenes
+"""
+import asyncio
+import logging
+import time
+from collections import namedtuple
+
+import discord
+
+import metrics
+
+log = logging.getLogger('horarios.notificador')
+
+MODOS = ('auto', 'evento', 'resumen')
+# En modo 'auto', hasta cuántos eventos por ventana se envían de a uno
+MAX_INDIVIDUALES = 2
+CAMPOS_POR_RESUMEN = 25  # Límite de campos de un embed
+
+Notificacion = namedtuple('Notificacion', 'tipo dni nombre entrada salida horas encolada')
+
+
+class Presupuesto:
+    """Token bucket: hasta `capacidad` envíos cada `periodo` segundos (límite por canal de Discord)"""
+
+    def __init__(self, capacidad=5, periodo=5.0):
+        self.capacidad = capacidad
+        self.periodo = periodo
+        self.fichas = float(capacidad)
+        self.ultima = time.monotonic()
+
+    async def esperar(self):
+        while True:
+            ahora = time.monotonic()
+            self.fichas = min(self.capacidad, self.fichas + (ahora - self.ultima) * self.capacidad / self.periodo)
+            self.ultima = ahora
+            if self.fichas >= 1:
+                self.fichas -= 1
+                return
+            await asyncio.sleep((1 - self.fichas) * self.periodo / self.capacidad)
+
+
+def embed_entrada(notificacion):
+    embed = discord.Embed(
+        title="✅ Entrada Registrada",
+        color=discord.Color.green(),
+        timestamp=notificacion.entrada
+    )
+    embed.add_field(name="DNI", value=notificacion.dni, inline=True)
+    embed.add_field(name="Nombre", value=notificacion.nombre, inline=True)
+    embed.add_field(name="Hora", value=notificacion.entrada.strftime('%H:%M:%S'), inline=True)
+    return embed
+
+
+def embed_salida(notificacion):
+    embed = discord.Embed(
+        title="🔴 Salida Registrada",
+        color=discord.Color.red(),
+        timestamp=notificacion.salida
+    )
+    embed.add_field(name="DNI", value=notificacion.dni, inline=True)
+    embed.add_field(name="Nombre", value=notificacion.nombre, inline=True)
+    embed.add_field(name="Entrada", value=notificacion.entrada.strftime('%H:%M:%S'), inline=True)
+    embed.add_field(name="Salida", value=notificacion.salida.strftime('%H:%M:%S'), inline=True)
+    embed.add_field(name="Horas trabajadas", value=f"{notificacion.horas:.2f}h", inline=True)
+    return embed
+
+
+def embeds_resumen(notificaciones):
+    """Un embed cada CAMPOS_POR_RESUMEN eventos, con el conteo en el título"""
+    entradas = sum(1 for n in notificaciones if n.tipo == 'entrada')
+    salidas = len(notificaciones) - entradas
+    titulo = f"🔔 {entradas} entrada{'s' if entradas != 1 else ''}, {salidas} salida{'s' if salidas != 1 else ''}"
+
+    embeds = []
+    for inicio in range(0, len(notificaciones), CAMPOS_POR_RESUMEN):
+        lote = notificaciones[inicio:inicio + CAMPOS_POR_RESUMEN]
+        embed = discord.Embed(
+            title=titulo if inicio == 0 else f"{titulo} (cont.)",
+            color=discord.Color.blurple(),
+            timestamp=lote[-1].salida or lote[-1].entrada
+        )
+        for n in lote:
+            if n.tipo == 'entrada':
+                embed.add_field(
+                    name=f"✅ {n.nombre} [{n.dni}]", value=f"Entrada {n.entrada.strftime('%H:%M:%S')}", inline=False
+                )
+            else:
+                embed.add_field(
+                    name=f"🔴 {n.nombre} [{n.dni}]",
+                    value=f"{n.entrada.strftime('%H:%M:%S')} → {n.salida.strftime('%H:%M:%S')} ({n.horas:.2f}h)",
+                    inline=False
+                )
+        embeds.append(embed)
+    return embeds
+
+
+class Notificador:
+    """Cola de notificaciones de un canal, enviada en segundo plano por una sola tarea"""
+
+    def __init__(self, obtener_canal, modo='auto', ventana=2.0, presupuesto=None):
+        self.obtener_canal = obtener_canal  # Se resuelve al enviar: el canal puede no estar en caché al inicio
+        self.modo = modo if modo in MODOS else 'auto'
+        self.ventana = ventana
+        self.presupuesto = presupuesto or Presupuesto()
+        self.pendientes = []
+        self._hay_pendientes = asyncio.Event()
+        self._cierre = asyncio.Event()
+        self._tarea = None
+
+    def start(self):
+        self._tarea = asyncio.create_task(self._procesar())
+
+    def notificar_entrada(self, dni, nombre, entrada):
+        self._encolar(Notificacion('entrada', dni, nombre, entrada, None, None, time.perf_counter()))
+
+    def notificar_salida(self, dni, nombre, turno):
+        self._encolar(Notificacion(
+            'salida', dni, nombre, turno['entrada'], turno['salida'], turno['horas'], time.perf_counter()
+        ))
+
+    def _encolar(self, notificacion):
+        self.pendientes.append(notificacion)
+        self._hay_pendientes.set()
+
+    async def _procesar(self):
+        while not (self._cierre.is_set() and not self.pendientes):
+            await self._hay_pendientes.wait()
+            if self.modo != 'evento' and not self._cierre.is_set():
+                # Se juntan los eventos de la ventana (en el cambio de turno llegan en ráfaga)
+                try:
+                    await asyncio.wait_for(self._cierre.wait(), self.ventana)
+                except asyncio.TimeoutError:
+                    pass
+            lote, self.pendientes = self.pendientes, []
+            self._hay_pendientes.clear()
+            await self._despachar(lote)
+
+    async def _despachar(self, lote):
+        if not lote:
+            return
+        canal = self.obtener_canal()
+        if canal is None:
+            log.warning("⚠️ No se encontró el canal de comandos: se descartan %d notificaciones", len(lote))
+            metrics.NOTIFICACIONES_ERRORES.inc(len(lote))
+            return
+
+        if self.modo == 'evento' or (self.modo == 'auto' and len(lote) <= MAX_INDIVIDUALES):
+            envios = [
+                ([n], embed_entrada(n) if n.tipo == 'entrada' else embed_salida(n)) for n in lote
+            ]
+            tipo = 'evento'
+        else:
+            envios = [
+                (lote[i * CAMPOS_POR_RESUMEN:(i + 1) * CAMPOS_POR_RESUMEN], embed)
+                for i, embed in enumerate(embeds_resumen(lote))
+            ]
+            tipo = 'resumen'
+
+        for notificaciones, embed in envios:
+            await self.presupuesto.esperar()
+            try:
+                await canal.send(embed=embed)
+            except discord.HTTPException as e:
+                log.error("❌ No se pudo enviar la notificación al canal %s: %s", canal, e)
+                metrics.NOTIFICACIONES_ERRORES.inc(len(notificaciones))
+                continue
+            metrics.NOTIFICACIONES_ENVIADAS.inc(valor_etiqueta=tipo)
+            enviada = time.perf_counter()
+            for n in notificaciones:
+                metrics.NOTIFICACION_LATENCIA.observe(enviada - n.encolada)
+
+    async def close(self, espera=10.0):
+        """Envía lo pendiente sin esperar la ventana y detiene la tarea"""
+        self._cierre.set()
+        self._hay_pendientes.set()
+        if self._tarea is None:
+            lote, self.pendientes = self.pendientes, []
+            await self._despachar(lote)
+            return
+        try:
+            await asyncio.wait_for(self._tarea, espera)
+        except asyncio.TimeoutError:
+            log.warning("⚠️ Se descartan %d notificaciones pendientes al cerrar", len(self.pendientes))
+        self._tarea = None
@@ -0,0 +1,183 @@
+"""Perfilado bajo demanda del bot en producción: CPU, memoria y tiempos por handler.
+
+`!perfil` (o PROFILE_ON_START_SECONDS al arrancar) abre una ventana de N
+segundos con cProfile y tracemalloc prendidos; al cerrarla arma un informe de
+texto con las funciones que más CPU usaron, las líneas que más memoria
+asignaron durante la ventana y lo que registraron los histogramas de
+metrics.py (on_message, cada comando, escrituras a disco, lag del loop).
+
+Fuera de una ventana no queda nada instalado: ni profiler ni trazas de
+memoria, los handlers corren igual que siempre. cProfile mide el hilo del
+event loop (on_message, la cola de ingesta, los reportes, load_data y la
+serialización del snapshot); las escrituras a disco van en el hilo de
+persistencia y se ven en su histograma.
+"""
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import metrics
+
+log = logging.getLogger('horarios.perfil')
+
+MAX_SEGUNDOS = 600
+LINEAS_CPU = 40
+LINEAS_MEMORIA = 25
+# Histogramas cuya actividad durante la ventana entra en el informe
+HISTOGRAMAS = (
+    metrics.ON_MESSAGE_SEGUNDOS,
+    metrics.COMANDO_SEGUNDOS,
+    metrics.PERSISTENCIA_SEGUNDOS,
+    metrics.EVENT_LOOP_LAG_HIST,
+)
+
+_activa = None
+
+
+def en_curso():
+    return _activa is not None
+
+
+def _copiar_histogramas():
+    return {
+        histograma.nombre: {
+            valor_etiqueta: (list(conteos), suma, total)
+            for valor_etiqueta, (conteos, suma, total) in histograma.series.items()
+        }
+        for histograma in HISTOGRAMAS
+    }
+
+
+def _resumen_histogramas(antes, despues):
+    """Líneas con cantidad, promedio y p95 aproximado (límite del bucket) de lo observado en la ventana"""
+    lineas = []
+    for histograma in HISTOGRAMAS:
+        for valor_etiqueta, (conteos, suma, total) in despues[histograma.nombre].items():
+            conteos_antes, suma_antes, total_antes = antes[histograma.nombre].get(
+                valor_etiqueta, ([0] * len(conteos), 0.0, 0)
+            )
+            cantidad = total - total_antes
+            if not cantidad:
+                continue
+            acumulado, p95 = 0, '+Inf'
+            for limite, conteo, conteo_antes in zip(histograma.buckets, conteos, conteos_antes):
+                acumulado += conteo - conteo_antes
+                if acumulado >= cantidad * 0.95:
+                    p95 = f'{limite:g}s'
+                    break
+            nombre = f'{histograma.nombre}{{{valor_etiqueta}}}' if valor_etiqueta else histograma.nombre
+            lineas.append(
+                f'{nombre:<60} {cantidad:>8}  prom {(suma - suma_antes) / cantidad * 1000:>9.2f} ms  p95 <= {p95}'
+            )
+    return lineas or ['(sin actividad)']
+
+
+class SesionPerfil:
+    """Una ventana de perfilado: prende cProfile/tracemalloc al crearse y los apaga en detener()"""
+
+    def __init__(self, cpu=True, memoria=True, motivo='!perfil'):
+        self.motivo = motivo
+        self.desde = datetime.now(timezone.utc)
+        self.inicio = time.perf_counter()
+        self.duracion = None
+        self.histogramas_antes = _copiar_histogramas()
+        self.profiler = None
+        self.snapshots = None
+        self.memoria_trazada = None  # (actual, pico) al cerrar
+        self._apagar_tracemalloc = False
+        if memoria:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._apagar_tracemalloc = True
+            self.snapshots = [tracemalloc.take_snapshot()]
+        if cpu:
+            self.profiler = cProfile.Profile()
+            try:
+                self.profiler.enable()
+            except ValueError:
+                # Python 3.12: otro profiler (un depurador, por ejemplo) ya está activo
+                self.profiler = None
+                self._detener_memoria()
+                raise
+
+    def _detener_memoria(self):
+        if self._apagar_tracemalloc:
+            tracemalloc.stop()
+            self._apagar_tracemalloc = False
+
+    def detener(self):
+        """Apaga el profiler y toma la última foto de memoria (el informe se arma después, fuera del loop)"""
+        if self.profiler:
+            self.profiler.disable()
+        if self.snapshots:
+            self.snapshots.append(tracemalloc.take_snapshot())
+            self.memoria_trazada = tracemalloc.get_traced_memory()
+            self._detener_memoria()
+        self.duracion = time.perf_counter() - self.inicio
+        self.histogramas_despues = _copiar_histogramas()
+
+    def informe(self):
+        """Texto del informe. Puede tardar (ordena estadísticas y compara snapshots): va en un hilo"""
+        salida = io.StringIO()
+        salida.write(f"Perfil {self.motivo} desde {self.desde.isoformat(timespec='seconds')} "
+                     f"durante {self.duracion:.1f}s (pid {os.getpid()})\n\n")
+
+        salida.write("== Tiempos por handler durante la ventana ==\n")
+        salida.write('\n'.join(_resumen_histogramas(self.histogramas_antes, self.histogramas_despues)) + '\n\n')
+
+        if self.profiler:
+            salida.write(f"== CPU (cProfile, hilo del event loop): top {LINEAS_CPU} por tiempo acumulado ==\n")
+            estadisticas = pstats.Stats(self.profiler, stream=salida)
+            estadisticas.strip_dirs().sort_stats(pstats.SortKey.CUMULATIVE).print_stats(LINEAS_CPU)
+            salida.write(f"== CPU: top {LINEAS_CPU} por tiempo propio ==\n")
+            estadisticas.sort_stats(pstats.SortKey.TIME).print_stats(LINEAS_CPU)
+
+        if self.snapshots:
+            antes, despues = self.snapshots
+            salida.write(f"== Memoria (tracemalloc): top {LINEAS_MEMORIA} líneas por memoria asignada en la ventana ==\n")
+            filtros = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, '<frozen *>')]
+            diferencias = despues.filter_traces(filtros).compare_to(antes.filter_traces(filtros), 'lineno')
+            for diferencia in diferencias[:LINEAS_MEMORIA]:
+                salida.write(f"{diferencia}\n")
+            actual, pico = self.memoria_trazada
+            salida.write(f"\nMemoria trazada al cerrar: {actual / 1024 / 1024:.1f} MiB, pico {pico / 1024 / 1024:.1f} MiB\n")
+        return salida.getvalue()
+
+    def guardar(self):
+        """Escribe el informe en un archivo temporal y devuelve la ruta"""
+        path = os.path.join(
+            tempfile.mkdtemp(prefix='perfil_'), f"perfil_{self.desde.strftime('%Y%m%d-%H%M%S')}.txt"
+        )
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.informe())
+        return path
+
+
+def iniciar(cpu=True, memoria=True, motivo='!perfil'):
+    """Abre la ventana de perfilado. RuntimeError si ya hay una en curso (cProfile y tracemalloc son globales)"""
+    global _activa
+    if _activa is not None:
+        raise RuntimeError("ya hay un perfilado en curso")
+    _activa = SesionPerfil(cpu, memoria, motivo)
+    log.info("🔬 Perfilado iniciado (%s: cpu=%s, memoria=%s)", motivo, cpu, memoria)
+    return _activa
+
+
+async def completar(sesion, segundos):
+    """Espera el resto de la ventana, la cierra y escribe el informe. Devuelve la ruta del archivo"""
+    global _activa
+    try:
+        await asyncio.sleep(max(0.0, segundos - (time.perf_counter() - sesion.inicio)))
+    finally:
+        sesion.detener()
+        _activa = None
+    path = await asyncio.to_thread(sesion.guardar)
+    log.info("🔬 Perfilado terminado (%.1fs, informe de %d KiB)", sesion.duracion, os.path.getsize(path) // 1024)
+    return path
@@ -0,0 +1,312 @@
+"""Representación compacta en memoria de los turnos completados.
+
+En lugar de un dict por turno (dos datetime, un float y el nombre repetido),
+cada día guarda cuatro columnas array('q'/'I'): entrada y salida en
+milisegundos desde epoch e índices a las tablas internadas de DNI y nombres.
+Un turno ocupa así 24 bytes. Los objetos Turno (con __slots__) se arman
+recién al consultar un día y se leen como el dict de siempre:
+turno['entrada'], turno['salida'], turno['horas'], turno['nombre'].
+
+Los días que vienen del snapshot binario quedan codificados (DiaFrio) hasta
+que algo los consulta: arrancar no cuesta decodificar meses de historial.
+"""
+import sys
+from array import array
+from datetime import datetime, timedelta, timezone
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+UN_MS = timedelta(milliseconds=1)
+
+
+def a_ms(momento):
+    """datetime con timezone -> milisegundos desde epoch (entero, sin pérdida para Discord)"""
+    return (momento - EPOCH) // UN_MS
+
+
+def desde_ms(ms):
+    return EPOCH + timedelta(milliseconds=ms)
+
+
+class Turno:
+    """Turno completado. Se accede como dict para no cambiar a quienes leen los reportes"""
+
+    __slots__ = ('dni', 'nombre', 'entrada_ms', 'salida_ms')
+
+    def __init__(self, dni, nombre, entrada_ms, salida_ms):
+        self.dni = dni
+        self.nombre = nombre
+        self.entrada_ms = entrada_ms
+        self.salida_ms = salida_ms
+
+    @property
+    def entrada(self):
+        return desde_ms(self.entrada_ms)
+
+    @property
+    def salida(self):
+        return desde_ms(self.salida_ms)
+
+    @property
+    def horas(self):
+        return (self.salida_ms - self.entrada_ms) / 3_600_000
+
+    def __getitem__(self, clave):
+        try:
+            return getattr(self, clave)
+        except AttributeError:
+            raise KeyError(clave) from None
+
+    def get(self, clave, defecto=None):
+        return getattr(self, clave, defecto)
+
+
+class TablaInterna:
+    """Cada string distinto se guarda una sola vez; las columnas guardan su índice"""
+
+    def __init__(self):
+        self.valores = []
+        self.indices = {}
+
+    def indice(self, valor):
+        indice = self.indices.get(valor)
+        if indice is None:
+            indice = self.indices[valor] = len(self.valores)
+            self.valores.append(valor)
+        return indice
+
+    def buscar(self, valor):
+        return self.indices.get(valor)
+
+    def __getitem__(self, indice):
+        return self.valores[indice]
+
+
+class ColumnasDia:
+    """Turnos de un día en columnas paralelas, en orden de llegada"""
+
+    __slots__ = ('dni', 'nombre', 'entrada', 'salida')
+
+    def __init__(self):
+        self.dni = array('I')
+        self.nombre = array('I')
+        self.entrada = array('q')
+        self.salida = array('q')
+
+    def __len__(self):
+        return len(self.dni)
+
+    def copia(self):
+        columnas = ColumnasDia()
+        for origen, destino in zip(self._columnas(), columnas._columnas()):
+            destino.extend(origen)
+        return columnas
+
+    def _columnas(self):
+        return (self.dni, self.nombre, self.entrada, self.salida)
+
+    def a_bytes(self):
+        """Las cuatro columnas seguidas, en little-endian (formato del snapshot binario)"""
+        partes = []
+        for columna in self._columnas():
+            if sys.byteorder == 'big':
+                columna = array(columna.typecode, columna)
+                columna.byteswap()
+            partes.append(columna.tobytes())
+        return b''.join(partes)
+
+    @classmethod
+    def desde_bytes(cls, datos, cantidad):
+        columnas = cls()
+        inicio = 0
+        for columna in columnas._columnas():
+            fin = inicio + columna.itemsize * cantidad
+            columna.frombytes(datos[inicio:fin])
+            if sys.byteorder == 'big':
+                columna.byteswap()
+            inicio = fin
+        return columnas
+
+
+# Bytes por turno en el snapshot binario: dni y nombre (uint32), entrada y salida (int64)
+BYTES_POR_TURNO = sum(columna.itemsize for columna in ColumnasDia()._columnas())
+
+
+class DiaFrio:
+    """Día todavía codificado como en el snapshot binario; se decodifica la primera vez que se usa"""
+
+    __slots__ = ('datos', 'cantidad')
+
+    def __init__(self, datos, cantidad):
+        self.datos = datos
+        self.cantidad = cantidad
+
+    def __len__(self):
+        return self.cantidad
+
+    def decodificar(self):
+        return ColumnasDia.desde_bytes(self.datos, self.cantidad)
+
+
+class HistorialTurnos:
+    """Turnos completados por fecha de entrada ('YYYY-MM-DD'), en columnas por día"""
+
+    def __init__(self, calentar=True):
+        self.dias = {}
+        self.dnis = TablaInterna()
+        self.nombres = TablaInterna()
+        # False en las particiones del archivo: consultar un día no lo deja decodificado en memoria
+        self.calentar = calentar
+
+    @classmethod
+    def desde_bloques(cls, dnis, nombres, bloques, calentar=True):
+        """Historial con todos los días fríos: bloques = {fecha: (bytes, cantidad)}"""
+        historial = cls(calentar)
+        for dni in dnis:
+            historial.dnis.indice(dni)
+        for nombre in nombres:
+            historial.nombres.indice(nombre)
+        historial.dias = {fecha: DiaFrio(datos, cantidad) for fecha, (datos, cantidad) in bloques.items()}
+        return historial
+
+    def _columnas(self, fecha, crear=False):
+        """Columnas de un día, decodificándolo (una sola vez) si está frío"""
+        columnas = self.dias.get(fecha)
+        if isinstance(columnas, DiaFrio):
+            if not (self.calentar or crear):
+                return columnas.decodificar()
+            columnas = self.dias[fecha] = columnas.decodificar()
+        elif columnas is None and crear:
+            columnas = self.dias[fecha] = ColumnasDia()
+        return columnas
+
+    def precargar(self, fechas):
+        """Decodifica de entrada los días que se van a consultar seguido (la semana actual)"""
+        for fecha in fechas:
+            self._columnas(fecha)
+
+    def agregar(self, fecha, dni, nombre, entrada, salida):
+        self.agregar_ms(fecha, dni, nombre, a_ms(entrada), a_ms(salida))
+
+    def agregar_ms(self, fecha, dni, nombre, entrada_ms, salida_ms):
+        columnas = self._columnas(fecha, crear=True)
+        columnas.dni.append(self.dnis.indice(dni))
+        columnas.nombre.append(self.nombres.indice(nombre))
+        columnas.entrada.append(entrada_ms)
+        columnas.salida.append(salida_ms)
+
+    def filas(self, fecha):
+        """(dni, nombre, entrada_ms, salida_ms) de cada turno del día, en orden de llegada"""
+        columnas = self.dias.get(fecha)
+        if columnas is None:
+            return
+        if isinstance(columnas, DiaFrio):
+            columnas = columnas.decodificar()
+        for i, indice_dni in enumerate(columnas.dni):
+            yield self.dnis[indice_dni], self.nombres[columnas.nombre[i]], columnas.entrada[i], columnas.salida[i]
+
+    def separar_por_mes(self, fechas):
+        """Copia de los días indicados agrupada por mes: {'YYYY-MM': HistorialTurnos}"""
+        meses = {}
+        for fecha in fechas:
+            destino = meses.setdefault(fecha[:7], HistorialTurnos())
+            for fila in self.filas(fecha):
+                destino.agregar_ms(fecha, *fila)
+        return meses
+
+    def descartar(self, fecha, cantidad):
+        """Quita los primeros `cantidad` turnos del día (ya archivados)"""
+        columnas = self._columnas(fecha)
+        if columnas is None:
+            return
+        if cantidad >= len(columnas):
+            del self.dias[fecha]
+            return
+        for columna in columnas._columnas():
+            del columna[:cantidad]
+
+    def dia(self, fecha, dni=None):
+        """{dni: [Turno]} de un día (solo el DNI pedido, si se indica)"""
+        columnas = self._columnas(fecha)
+        if columnas is None:
+            return {}
+        filtro = None
+        if dni is not None:
+            filtro = self.dnis.buscar(dni)
+            if filtro is None:
+                return {}
+
+        resultado = {}
+        for i, indice_dni in enumerate(columnas.dni):
+            if filtro is not None and indice_dni != filtro:
+                continue
+            dni_turno = self.dnis[indice_dni]
+            resultado.setdefault(dni_turno, []).append(Turno(
+                dni_turno, self.nombres[columnas.nombre[i]], columnas.entrada[i], columnas.salida[i]
+            ))
+        return resultado
+
+    def fechas(self):
+        return self.dias.keys()
+
+    def items(self):
+        """(fecha, {dni: [Turno]}) de todos los días"""
+        for fecha in self.dias:
+            yield fecha, self.dia(fecha)
+
+    def exportar(self):
+        """{fecha: {dni: [turno serializado]}} con el formato de shift_data.json"""
+        data = {}
+        for fecha, columnas in self.dias.items():
+            if isinstance(columnas, DiaFrio):
+                columnas = columnas.decodificar()  # Sin guardarlo: exportar no calienta el historial
+            registros = data[fecha] = {}
+            for i, indice_dni in enumerate(columnas.dni):
+                registros.setdefault(self.dnis[indice_dni], []).append({
+                    'entrada': desde_ms(columnas.entrada[i]).isoformat(),
+                    'salida': desde_ms(columnas.salida[i]).isoformat(),
+                    'horas': (columnas.salida[i] - columnas.entrada[i]) / 3_600_000,
+                    'nombre': self.nombres[columnas.nombre[i]]
+                })
+        return data
+
+    def cargar(self, data):
+        """Carga turnos serializados por exportar() (o por versiones anteriores del bot)"""
+        for fecha, registros in data.items():
+            for dni, turnos in registros.items():
+                for turno in turnos:
+                    entrada = datetime.fromisoformat(turno['entrada'])
+                    # Los turnos viejos sin salida se reconstruyen con sus horas
+                    salida = (
+                        datetime.fromisoformat(turno['salida']) if turno['salida']
+                        else entrada + timedelta(hours=turno['horas'])
+                    )
+                    self.agregar(fecha, dni, turno.get('nombre', ''), entrada, salida)
+
+    def bloques(self):
+        """(fecha, cantidad, bytes) de cada día; los días fríos se copian tal cual, sin decodificar"""
+        for fecha, columnas in self.dias.items():
+            if isinstance(columnas, DiaFrio):
+                yield fecha, columnas.cantidad, columnas.datos
+            else:
+                yield fecha, len(columnas), columnas.a_bytes()
+
+    def capturar(self):
+        """Copia para escribir en segundo plano: los días fríos son inmutables y se comparten"""
+        copia = HistorialTurnos()
+        copia.dnis.valores = list(self.dnis.valores)
+        copia.dnis.indices = dict(self.dnis.indices)
+        copia.nombres.valores = list(self.nombres.valores)
+        copia.nombres.indices = dict(self.nombres.indices)
+        copia.dias = {
+            fecha: columnas if isinstance(columnas, DiaFrio) else columnas.copia()
+            for fecha, columnas in self.dias.items()
+        }
+        return copia
+
+    def clear(self):
+        self.dias.clear()
+        self.dnis = TablaInterna()
+        self.nombres = TablaInterna()
+
+    def __len__(self):
+        return sum(len(columnas) for columnas in self.dias.values())
@@ -0,0 +1,133 @@
+"""Reportes paginados (!hoy, !semana, !mes, !activos y sus comandos de barra) y su caché.
+
+Cada comando arma una vista ordenada del reporte (Reporte) una sola vez por
+versión del tracker: mientras no se aplique una entrada, una salida o una
+limpieza, las consultas repetidas se sirven de la caché sin recorrer el
+estado. Las páginas se arman recién al mostrarlas, con a lo sumo
+CAMPOS_POR_PAGINA campos, así que nunca se pasa el límite de 25 campos por
+embed de Discord.
+"""
+import math
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import discord
+
+import metrics
+
+CAMPOS_POR_PAGINA = 20
+TIMEOUT_PAGINADOR = 300  # Segundos sin usar los botones hasta quitarlos
+
+
+class Reporte:
+    """Vista ordenada de un reporte: encabezado, filas (name, value) y campos de totales.
+
+    Un `value` puede ser una función `(ahora) -> str` para lo que depende de la
+    hora (turnos en curso): se calcula al armar cada página, no al cachear.
+    """
+
+    def __init__(self, titulo, color, filas, descripcion=None, totales=()):
+        self.titulo = titulo
+        self.color = color
+        self.descripcion = descripcion
+        self.filas = filas
+        self.totales = totales
+        self.paginas = max(1, math.ceil(len(filas) / CAMPOS_POR_PAGINA))
+
+    def pagina(self, numero, ahora=None):
+        """Embed de la página `numero` (desde 0)"""
+        ahora = ahora or datetime.now(timezone.utc)
+        embed = discord.Embed(title=self.titulo, description=self.descripcion, color=self.color)
+        inicio = numero * CAMPOS_POR_PAGINA
+        for nombre, valor in self.filas[inicio:inicio + CAMPOS_POR_PAGINA]:
+            embed.add_field(name=nombre, value=valor(ahora) if callable(valor) else valor, inline=False)
+        for nombre, valor in self.totales:
+            embed.add_field(name=nombre, value=valor, inline=True)
+        if self.paginas > 1:
+            embed.set_footer(text=f"Página {numero + 1}/{self.paginas} · {len(self.filas)} filas")
+        return embed
+
+
+class ReportCache:
+    """LRU de reportes por clave (comando y argumentos); una entrada vale mientras no cambie la versión"""
+
+    def __init__(self, maximo=128):
+        self.maximo = maximo
+        self.entradas = OrderedDict()  # {clave: (version, reporte)}
+
+    async def obtener(self, clave, version, armar):
+        """Devuelve el reporte cacheado o lo arma con `await armar()` (un Reporte o un texto)"""
+        entrada = self.entradas.get(clave)
+        if entrada and entrada[0] == version:
+            self.entradas.move_to_end(clave)
+            metrics.REPORTES_CACHE.inc(valor_etiqueta='acierto')
+            return entrada[1]
+
+        metrics.REPORTES_CACHE.inc(valor_etiqueta='fallo')
+        # Se guarda con la versión de antes de armar: si algo cambió mientras tanto, la próxima vez se rearma
+        reporte = await armar()
+        self.entradas[clave] = (version, reporte)
+        self.entradas.move_to_end(clave)
+        while len(self.entradas) > self.maximo:
+            self.entradas.popitem(last=False)
+        return reporte
+
+
+class Paginador(discord.ui.View):
+    """Botones ◀️ ▶️ para recorrer las páginas de un reporte"""
+
+    def __init__(self, reporte):
+        super().__init__(timeout=TIMEOUT_PAGINADOR)
+        self.reporte = reporte
+        self.numero = 0
+        self.mensaje = None
+        self._actualizar_botones()
+
+    def _actualizar_botones(self):
+        self.anterior.disabled = self.numero == 0
+        self.siguiente.disabled = self.numero >= self.reporte.paginas - 1
+
+    async def _mostrar(self, interaction):
+        self._actualizar_botones()
+        await interaction.response.edit_message(embed=self.reporte.pagina(self.numero), view=self)
+
+    @discord.ui.button(emoji='◀️', style=discord.ButtonStyle.secondary)
+    async def anterior(self, interaction, button):
+        self.numero = max(0, self.numero - 1)
+        await self._mostrar(interaction)
+
+    @discord.ui.button(emoji='▶️', style=discord.ButtonStyle.secondary)
+    async def siguiente(self, interaction, button):
+        self.numero = min(self.reporte.paginas - 1, self.numero + 1)
+        await self._mostrar(interaction)
+
+    async def on_timeout(self):
+        if self.mensaje:
+            try:
+                await self.mensaje.edit(view=None)
+            except discord.HTTPException:
+                pass
+
+
+async def enviar_reporte(ctx, reporte):
+    """Envía un reporte (con botones si tiene más de una página) o un texto"""
+    if isinstance(reporte, str):
+        await ctx.send(reporte)
+        return
+    if reporte.paginas == 1:
+        await ctx.send(embed=reporte.pagina(0))
+        return
+    vista = Paginador(reporte)
+    vista.mensaje = await ctx.send(embed=reporte.pagina(0), view=vista)
+
+
+async def responder_reporte(interaction, reporte):
+    """Como enviar_reporte, para un comando de barra ya diferido: responde con un followup"""
+    if isinstance(reporte, str):
+        await interaction.followup.send(reporte)
+        return
+    if reporte.paginas == 1:
+        await interaction.followup.send(embed=reporte.pagina(0))
+        return
+    vista = Paginador(reporte)
+    vista.mensaje = await interaction.followup.send(embed=reporte.pagina(0), view=vista, wait=True)
@@ -0,0 +1,47 @@
+"""Parser de los mensajes de entrada/salida que publica ServicioAPP"""
+import re
+from collections import namedtuple
+
+ENTRADA = 'entrada'
+SALIDA = 'salida'
+
+# Evento extraído de un mensaje: tipo (ENTRADA/SALIDA), DNI en mayúsculas y nombre
+ServicioEvent = namedtuple('ServicioEvent', ['tipo', 'dni', 'nombre'])
+
+# Formato: **[ABC12345] Nombre Apellido** ha entrado en servicio / ha salido de servicio
+# El ** puede o no estar presente. Un solo patrón resuelve el tipo en la misma pasada.
+PATRON_EVENTO = re.compile(
+    r'\[([A-Z]{3}\d{5})\]\s+([^\*]+?)\*?\*?\s+ha\s+(entrado\s+en|salido\s+de)\s+servicio',
+    re.IGNORECASE
+)
+
+
+def parsear_mensaje(contenido):
+    """Devuelve un ServicioEvent o None si el mensaje no es una entrada/salida"""
+    # Prefiltro barato: la gran mayoría de los mensajes no pasa de acá
+    if '[' not in contenido or 'servicio' not in contenido.lower():
+        return None
+    match = PATRON_EVENTO.search(contenido)
+    if not match:
+        return None
+    dni, nombre, verbo = match.groups()
+    tipo = ENTRADA if verbo[0] in 'eE' else SALIDA
+    return ServicioEvent(tipo, dni.upper(), nombre.strip())
+
+
+def parsear_lote(contenidos):
+    """Parsea una lista de contenidos; devuelve una lista alineada con ServicioEvent o None"""
+    buscar = PATRON_EVENTO.search
+    resultado = []
+    agregar = resultado.append
+    for contenido in contenidos:
+        if '[' not in contenido or 'servicio' not in contenido.lower():
+            agregar(None)
+            continue
+        match = buscar(contenido)
+        if not match:
+            agregar(None)
+            continue
+        dni, nombre, verbo = match.groups()
+        agregar(ServicioEvent(ENTRADA if verbo[0] in 'eE' else SALIDA, dni.upper(), nombre.strip()))
+    return resultado
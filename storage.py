@@ -0,0 +1,858 @@
+"""Persistencia de ShiftTracker.
+
+Backends disponibles:
+- JsonStorage (por defecto): snapshot (binario o JSON) + journal append-only, historial
+  reciente en memoria y días viejos en particiones mensuales (ArchivoMensual)
+- SqliteStorage: turnos en SQLite indexados por (fecha, dni), historial en disco
+
+Uso como script para migrar un shift_data.json existente a SQLite:
+    python storage.py migrar
+"""
+import asyncio
+import json
+import logging
+import mmap
+import os
+import sqlite3
+import struct
+import sys
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import metrics
+from aggregates import clave_dia, clave_mes, clave_semana, periodos_en_curso
+from registros import BYTES_POR_TURNO, HistorialTurnos, a_ms
+
+# Archivos de datos
+SNAPSHOT_FILE = 'shift_data.json'
+SNAPSHOT_BIN_FILE = 'shift_data.snap'
+JOURNAL_FILE = 'shift_data.journal'
+SQLITE_FILE = 'shift_data.db'
+
+log = logging.getLogger('horarios.storage')
+
+
+def leer_snapshot(path=SNAPSHOT_FILE):
+    """Lee el snapshot completo. Devuelve None si todavía no existe"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _a_json(valor):
+    # El historial llega capturado como HistorialTurnos: se serializa acá, fuera del event loop
+    if hasattr(valor, 'exportar'):
+        return valor.exportar()
+    raise TypeError(f'{type(valor).__name__} no es serializable')
+
+
+def _escribir_atomico(path, escribir, modo='w'):
+    """Escribe en un temporal y lo reemplaza con os.replace (atómico)"""
+    tmp = path + '.tmp'
+    with open(tmp, modo, **({} if 'b' in modo else {'encoding': 'utf-8'})) as f:
+        escribir(f)
+        f.flush()
+        os.fsync(f.fileno())
+    # os.replace es atómico: si el proceso cae antes, el snapshot anterior queda intacto
+    os.replace(tmp, path)
+
+
+def escribir_snapshot(data, path=SNAPSHOT_FILE):
+    """Escribe el snapshot completo de forma atómica (archivo temporal + rename)"""
+    _escribir_atomico(path, lambda f: json.dump(data, f, ensure_ascii=False, indent=2, default=_a_json))
+
+
+# Snapshot binario y particiones del archivo:
+#   cabecera  MAGIA, versión (uint16), reservado (uint16), CRC32 del resto (uint32)
+#   meta      largo (uint32) + JSON: tablas de DNI/nombres, la lista de días
+#             [fecha, cantidad] y, en el snapshot, el resto del estado chico
+#             (turnos activos, totales por período, cursor)
+#   mensajes  solo en el snapshot: IDs de mensajes aplicados (int64)
+#   días      por cada día, sus columnas de registros.ColumnasDia
+# Todo en little-endian.
+SNAPSHOT_MAGIA = b'HRSN'
+ARCHIVO_MAGIA = b'HRAR'
+SNAPSHOT_VERSION = 1
+CABECERA = struct.Struct('<4sHHI')
+LARGO = struct.Struct('<I')
+
+
+def _escribir_binario(path, magia, meta, historial, extra=b''):
+    """Escribe cabecera + meta + extra + días de forma atómica"""
+    bloques = list(historial.bloques())
+    meta = dict(meta)
+    meta['dnis'] = historial.dnis.valores
+    meta['nombres'] = historial.nombres.valores
+    meta['dias'] = [[fecha, cantidad] for fecha, cantidad, _ in bloques]
+    meta_bytes = json.dumps(meta, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    partes = [LARGO.pack(len(meta_bytes)), meta_bytes, extra]
+    partes.extend(datos for _, _, datos in bloques)
+    crc = 0
+    for parte in partes:
+        crc = zlib.crc32(parte, crc)
+
+    def escribir(f):
+        f.write(CABECERA.pack(magia, SNAPSHOT_VERSION, 0, crc))
+        for parte in partes:
+            f.write(parte)
+
+    _escribir_atomico(path, escribir, 'wb')
+
+
+def _leer_binario(contenido, path, magia):
+    """Valida la cabecera y el CRC. Devuelve (meta, cuerpo, posición después de la meta)"""
+    if len(contenido) < CABECERA.size:
+        raise ValueError(f'{path} truncado')
+    magia_archivo, version, _, crc = CABECERA.unpack_from(contenido)
+    if magia_archivo != magia:
+        raise ValueError(f'{path} no tiene el formato esperado')
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f'{path}: versión {version} no soportada (se esperaba {SNAPSHOT_VERSION})')
+    cuerpo = memoryview(contenido)[CABECERA.size:]
+    if zlib.crc32(cuerpo) != crc:
+        raise ValueError(f'{path} corrupto (CRC32 no coincide)')
+
+    (largo_meta,) = LARGO.unpack_from(cuerpo)
+    inicio = LARGO.size + largo_meta
+    return json.loads(bytes(cuerpo[LARGO.size:inicio])), cuerpo, inicio
+
+
+def _historial_binario(meta, cuerpo, inicio, calentar=True):
+    """Arma el HistorialTurnos con los días (fríos) que empiezan en `inicio`"""
+    bloques = {}
+    for fecha, cantidad in meta.pop('dias'):
+        fin = inicio + cantidad * BYTES_POR_TURNO
+        bloques[fecha] = (cuerpo[inicio:fin], cantidad)
+        inicio = fin
+    return HistorialTurnos.desde_bloques(meta.pop('dnis'), meta.pop('nombres'), bloques, calentar)
+
+
+def escribir_snapshot_binario(data, path=SNAPSHOT_BIN_FILE):
+    """Escribe el snapshot en formato binario de forma atómica"""
+    historial = data.get('daily_records')
+    if not isinstance(historial, HistorialTurnos):
+        historial = HistorialTurnos()
+        historial.cargar(data.get('daily_records', {}))
+    mensajes = sorted(data.get('mensajes_aplicados', ()))
+    meta = {clave: valor for clave, valor in data.items() if clave not in ('daily_records', 'mensajes_aplicados')}
+    meta['mensajes'] = len(mensajes)
+    _escribir_binario(path, SNAPSHOT_MAGIA, meta, historial, struct.pack(f'<{len(mensajes)}q', *mensajes))
+
+
+def leer_snapshot_binario(path=SNAPSHOT_BIN_FILE):
+    """Lee un snapshot binario: los días quedan fríos en un HistorialTurnos. None si no existe"""
+    try:
+        with open(path, 'rb') as f:
+            contenido = f.read()
+    except FileNotFoundError:
+        return None
+
+    data, cuerpo, inicio = _leer_binario(contenido, path, SNAPSHOT_MAGIA)
+    cantidad_mensajes = data.pop('mensajes')
+    data['mensajes_aplicados'] = struct.unpack_from(f'<{cantidad_mensajes}q', cuerpo, inicio)
+    data['daily_records'] = _historial_binario(data, cuerpo, inicio + 8 * cantidad_mensajes)
+    return data
+
+
+class ArchivoMensual:
+    """Particiones mensuales de turnos viejos: '<carpeta>/YYYY-MM.arch', una por mes.
+
+    Se leen con mmap de solo lectura y los días se decodifican al consultarlos
+    sin quedar en memoria: el archivo puede crecer sin agrandar el proceso.
+    Las lecturas y escrituras corren en el hilo del PersistenceWriter.
+    """
+
+    def __init__(self, carpeta):
+        self.carpeta = carpeta
+        self._abiertos = {}  # {mes: HistorialTurnos sobre el mmap}
+
+    def _path(self, mes):
+        return os.path.join(self.carpeta, f'{mes}.arch')
+
+    def meses(self):
+        try:
+            nombres = os.listdir(self.carpeta)
+        except FileNotFoundError:
+            return []
+        return sorted(nombre[:-5] for nombre in nombres if nombre.endswith('.arch'))
+
+    def leer(self, mes):
+        """HistorialTurnos (solo lectura) de un mes archivado, o None"""
+        if mes in self._abiertos:
+            return self._abiertos[mes]
+        try:
+            f = open(self._path(mes), 'rb')
+        except FileNotFoundError:
+            return None
+        with f:
+            # El mapeo sigue vivo mientras haya días que lo referencian, aunque se cierre el archivo
+            contenido = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        meta, cuerpo, inicio = _leer_binario(contenido, self._path(mes), ARCHIVO_MAGIA)
+        historial = self._abiertos[mes] = _historial_binario(meta, cuerpo, inicio, calentar=False)
+        return historial
+
+    def guardar(self, mes, nuevos):
+        """Une los turnos nuevos con la partición del mes (sin repetir dni + entrada) y la reescribe"""
+        particion = HistorialTurnos()
+        vistos = set()
+        anterior = self.leer(mes)
+        for origen in (anterior, nuevos):
+            if origen is None:
+                continue
+            for fecha in sorted(origen.fechas()):
+                for dni, nombre, entrada_ms, salida_ms in origen.filas(fecha):
+                    if (dni, entrada_ms) not in vistos:
+                        vistos.add((dni, entrada_ms))
+                        particion.agregar_ms(fecha, dni, nombre, entrada_ms, salida_ms)
+        os.makedirs(self.carpeta, exist_ok=True)
+        _escribir_binario(self._path(mes), ARCHIVO_MAGIA, {'mes': mes}, particion)
+        self._abiertos.pop(mes, None)
+
+    def turnos(self, desde, hasta, dni=None):
+        """Turnos archivados entre dos fechas (inclusive), leyendo solo los meses necesarios"""
+        resultado = {}
+        for mes in self.meses():
+            if not desde[:7] <= mes <= hasta[:7]:
+                continue
+            particion = self.leer(mes)
+            for fecha in particion.fechas():
+                if desde <= fecha <= hasta:
+                    registros = particion.dia(fecha, dni)
+                    if registros:
+                        resultado[fecha] = registros
+        return resultado
+
+    def filas(self, desde, hasta, dni=None):
+        """(fecha, dni, nombre, entrada_ms, salida_ms) archivados del rango, en orden de fecha"""
+        for mes in self.meses():
+            if not desde[:7] <= mes <= hasta[:7]:
+                continue
+            particion = self.leer(mes)
+            for fecha in sorted(particion.fechas()):
+                if not desde <= fecha <= hasta:
+                    continue
+                for fila in particion.filas(fecha):
+                    if dni is None or fila[0] == dni:
+                        yield (fecha, *fila)
+
+    def tamano_bytes(self):
+        return sum(os.path.getsize(self._path(mes)) for mes in self.meses())
+
+    def borrar(self):
+        """Elimina todas las particiones (!limpiar_datos)"""
+        for mes in self.meses():
+            os.remove(self._path(mes))
+        self._abiertos.clear()
+
+
+class ShiftJournal:
+    """Journal append-only: una línea JSON por cada entrada/salida registrada.
+
+    Cada registro lleva un número de secuencia creciente. El snapshot guarda
+    el último ``seq`` que ya incluye, así que al arrancar solo se reaplica la
+    cola del journal aunque el truncado posterior a una compactación no haya
+    llegado a ejecutarse.
+    """
+
+    def __init__(self, path=JOURNAL_FILE):
+        self.path = path
+        self.pendientes = 0  # Registros escritos desde la última compactación
+
+    def append(self, record):
+        """Agrega un registro al final del journal (costo constante)"""
+        self.append_many([record])
+
+    def append_many(self, records):
+        """Agrega varios registros con una sola escritura"""
+        lineas = ''.join(
+            json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+            for record in records
+        )
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(lineas)
+        self.pendientes += len(records)
+
+    def replay(self):
+        """Itera los registros del journal en el orden en que se escribieron"""
+        try:
+            f = open(self.path, 'r', encoding='utf-8')
+        except FileNotFoundError:
+            return
+        with f:
+            for linea in f:
+                linea = linea.strip()
+                if not linea:
+                    continue
+                try:
+                    record = json.loads(linea)
+                except json.JSONDecodeError:
+                    # Última línea cortada por una caída a mitad de escritura
+                    break
+                self.pendientes += 1
+                yield record
+
+    def truncate(self):
+        """Vacía el journal (después de escribir un snapshot)"""
+        with open(self.path, 'w', encoding='utf-8'):
+            pass
+        self.pendientes = 0
+
+    def size(self):
+        """Tamaño actual del journal en bytes"""
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+
+class JsonStorage:
+    """Backend por defecto: snapshot + journal opcional. El historial vive en memoria.
+
+    El snapshot se escribe en formato 'binario' (por defecto, '<datos>.snap') o
+    'json' ('<datos>.json'). Al leer se usa el del formato configurado y, si no
+    existe, el otro: cambiar de formato no pierde datos. Después de escribir uno
+    se borra el otro para que nunca quede un snapshot viejo que confunda.
+    """
+
+    historial_en_memoria = True
+    agregados_en_memoria = True
+    usa_snapshot = True
+
+    def __init__(self, journal=None, snapshot_path=SNAPSHOT_FILE, formato='binario'):
+        self.journal = journal  # Sin journal cada evento reescribe el snapshot
+        self.snapshot_path = snapshot_path
+        self.snapshot_bin_path = os.path.splitext(snapshot_path)[0] + '.snap'
+        self.formato = formato
+        # Días más viejos que la retención, fuera del snapshot
+        self.archivo = ArchivoMensual(os.path.splitext(snapshot_path)[0] + '_archivo')
+
+    @property
+    def registra_eventos(self):
+        return self.journal is not None
+
+    def pendientes(self):
+        """Eventos escritos desde la última compactación"""
+        return self.journal.pendientes if self.journal else 0
+
+    def _lectores(self):
+        binario = (leer_snapshot_binario, self.snapshot_bin_path)
+        texto = (leer_snapshot, self.snapshot_path)
+        return (binario, texto) if self.formato == 'binario' else (texto, binario)
+
+    def leer(self, desde_mensaje=None):
+        """Devuelve (snapshot, registros del journal a reaplicar).
+
+        Con `desde_mensaje` solo trae los IDs de mensajes aplicados desde ese ID.
+        """
+        data = None
+        for leer, path in self._lectores():
+            data = leer(path)
+            if data is not None:
+                break
+        if data and desde_mensaje is not None and 'mensajes_aplicados' in data:
+            data['mensajes_aplicados'] = [
+                message_id for message_id in data['mensajes_aplicados'] if message_id >= desde_mensaje
+            ]
+        registros = self.journal.replay() if self.journal else ()
+        return data or {}, registros
+
+    def escribir(self, registros):
+        self.journal.append_many(registros)
+
+    def compactar(self, data):
+        if self.formato == 'binario':
+            escribir_snapshot_binario(data, self.snapshot_bin_path)
+            anterior = self.snapshot_path
+        else:
+            escribir_snapshot(data, self.snapshot_path)
+            anterior = self.snapshot_bin_path
+        if self.journal:
+            self.journal.truncate()
+        try:
+            os.remove(anterior)
+        except FileNotFoundError:
+            pass
+
+    def tamano_bytes(self):
+        """Tamaño en disco del snapshot, el archivo mensual y el journal"""
+        tamano = 0
+        for path in (self.snapshot_path, self.snapshot_bin_path):
+            try:
+                tamano += os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+        tamano += self.archivo.tamano_bytes()
+        return tamano + (self.journal.size() if self.journal else 0)
+
+    def close(self):
+        pass
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS shifts (
+    id INTEGER PRIMARY KEY,
+    fecha TEXT NOT NULL,
+    dni TEXT NOT NULL,
+    nombre TEXT NOT NULL,
+    entrada TEXT NOT NULL,
+    salida TEXT,
+    horas REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_shifts_fecha_dni ON shifts (fecha, dni);
+CREATE INDEX IF NOT EXISTS idx_shifts_dni_fecha ON shifts (dni, fecha);
+CREATE TABLE IF NOT EXISTS active_shifts (
+    dni TEXT PRIMARY KEY,
+    nombre TEXT NOT NULL,
+    entrada TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS mensajes_aplicados (
+    id INTEGER PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS meta (
+    clave TEXT PRIMARY KEY,
+    valor TEXT
+);
+CREATE TABLE IF NOT EXISTS aggregates (
+    bucket TEXT NOT NULL,
+    dni TEXT NOT NULL,
+    horas REAL NOT NULL,
+    entradas INTEGER NOT NULL,
+    PRIMARY KEY (bucket, dni)
+);
+DROP TABLE IF EXISTS weekly_stats;
+"""
+
+
+class SqliteStorage:
+    """Backend SQLite: los turnos quedan en disco y los reportes son consultas indexadas.
+
+    En memoria solo se cargan los turnos activos y los totales de la semana y
+    el mes en curso, así que el consumo no crece con los meses de historial:
+    los totales de otros períodos se leen con leer_agregados cuando un reporte
+    los pide (ver AggregateIndex). La
+    conexión se usa desde el hilo del PersistenceWriter (escrituras y
+    consultas), que es uno solo.
+    """
+
+    historial_en_memoria = False
+    agregados_en_memoria = False
+    usa_snapshot = False
+    registra_eventos = True
+    archivo = None  # El historial ya vive en disco, indexado
+
+    def __init__(self, path=SQLITE_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        nueva_tabla = not self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'aggregates'"
+        ).fetchone()
+        self.conn.executescript(SQLITE_SCHEMA)
+        if nueva_tabla:
+            # Bases anteriores a los totales por período: se arman desde el historial
+            with self.conn:
+                self._reconstruir_agregados()
+
+    def pendientes(self):
+        return 0
+
+    def vacia(self):
+        """True si la base no tiene ningún dato (para la migración inicial)"""
+        for tabla in ('shifts', 'active_shifts', 'aggregates'):
+            if self.conn.execute(f'SELECT 1 FROM {tabla} LIMIT 1').fetchone():
+                return False
+        return True
+
+    def leer(self, desde_mensaje=None):
+        """Devuelve el estado caliente con la forma del snapshot.
+
+        Trae los turnos activos, los totales de la semana y el mes en curso (con
+        sus días) y los IDs de mensajes aplicados desde `desde_mensaje`.
+        """
+        active_shifts = {
+            dni: {'nombre': nombre, 'entrada': entrada}
+            for dni, nombre, entrada in self.conn.execute(
+                'SELECT dni, nombre, entrada FROM active_shifts'
+            )
+        }
+        buckets = self.leer_agregados(periodos_en_curso(datetime.now(timezone.utc)))
+        # Último nombre conocido de cada DNI
+        nombres = {
+            dni: nombre
+            for dni, nombre, _ in self.conn.execute('SELECT dni, nombre, MAX(id) FROM shifts GROUP BY dni')
+        }
+        meta = {clave: json.loads(valor) for clave, valor in self.conn.execute('SELECT clave, valor FROM meta')}
+        mensajes_aplicados = [
+            row[0] for row in self.conn.execute('SELECT id FROM mensajes_aplicados WHERE id >= ?', (desde_mensaje or 0,))
+        ]
+        return {
+            'active_shifts': active_shifts,
+            'aggregates': {'buckets': buckets, 'nombres': nombres},
+            'scan_cursor': meta.get('scan_cursor'),
+            'mensajes_aplicados': mensajes_aplicados,
+            'ultimo_mensaje': meta.get('ultimo_mensaje')
+        }, ()
+
+    def leer_agregados(self, claves):
+        """{bucket: {dni: [horas, entradas]}} de las claves pedidas, también las que no tienen turnos"""
+        claves = list(claves)
+        buckets = {clave: {} for clave in claves}
+        for bucket, dni, horas, entradas in self.conn.execute(
+            f"SELECT bucket, dni, horas, entradas FROM aggregates WHERE bucket IN ({', '.join('?' * len(claves))})",
+            claves
+        ):
+            buckets[bucket][dni] = [horas, entradas]
+        return buckets
+
+    def escribir(self, registros):
+        """Aplica un lote de eventos en una sola transacción"""
+        with self.conn:
+            for record in registros:
+                self._aplicar(record)
+
+    def _aplicar(self, record):
+        tipo = record['tipo']
+        if 'mid' in record:
+            self.conn.execute('INSERT OR IGNORE INTO mensajes_aplicados (id) VALUES (?)', (record['mid'],))
+            self._avanzar_ultimo_mensaje(record['mid'])
+        if tipo == 'entrada':
+            # Una entrada atrasada (más vieja que el turno activo) solo vive en memoria hasta su salida
+            if not record.get('atrasada'):
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO active_shifts (dni, nombre, entrada) VALUES (?, ?, ?)',
+                    (record['dni'], record['nombre'], record['ts'])
+                )
+        elif tipo == 'salida':
+            row = self.conn.execute(
+                'SELECT entrada FROM active_shifts WHERE dni = ?', (record['dni'],)
+            ).fetchone()
+            activa = row[0] if row else None
+            # Los registros traen la entrada del turno que cierran (los anteriores a eso, no)
+            entrada_str = record.get('entrada', activa)
+            if entrada_str is None:
+                return
+            entrada = datetime.fromisoformat(entrada_str)
+            salida = datetime.fromisoformat(record['ts'])
+            horas = (salida - entrada).total_seconds() / 3600
+            fecha = entrada.strftime('%Y-%m-%d')
+            self.conn.execute(
+                'INSERT INTO shifts (fecha, dni, nombre, entrada, salida, horas) VALUES (?, ?, ?, ?, ?, ?)',
+                (fecha, record['dni'], record['nombre'], entrada_str, record['ts'], horas)
+            )
+            self._sumar_agregados(record['dni'], entrada, horas, 1)
+            # Si cerró una entrada atrasada, el turno activo (más nuevo) sigue abierto
+            if activa is not None and datetime.fromisoformat(activa) == entrada:
+                self.conn.execute('DELETE FROM active_shifts WHERE dni = ?', (record['dni'],))
+        elif tipo == 'limpiar':
+            self.conn.execute('DELETE FROM shifts')
+            self.conn.execute('DELETE FROM active_shifts')
+            self.conn.execute('DELETE FROM aggregates')
+            self.conn.execute('DELETE FROM meta')
+            self.conn.execute('DELETE FROM mensajes_aplicados')
+        elif tipo == 'cursor_escaneo':
+            self._guardar_meta('scan_cursor', record['cursor'])
+        elif tipo == 'purgar_mensajes':
+            self.conn.execute('DELETE FROM mensajes_aplicados WHERE id < ?', (record['hasta'],))
+
+    def _sumar_agregados(self, dni, entrada, horas, entradas):
+        """Suma un turno en los buckets de día, semana ISO y mes de su entrada"""
+        self.conn.executemany(
+            'INSERT INTO aggregates (bucket, dni, horas, entradas) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (bucket, dni) DO UPDATE SET '
+            'horas = horas + excluded.horas, entradas = entradas + excluded.entradas',
+            [
+                (clave, dni, horas, entradas)
+                for clave in (clave_dia(entrada), clave_semana(entrada), clave_mes(entrada))
+            ]
+        )
+
+    def _reconstruir_agregados(self):
+        """Rearma la tabla aggregates a partir de todos los turnos guardados"""
+        self.conn.execute('DELETE FROM aggregates')
+        for dni, entrada, horas in self.conn.execute('SELECT dni, entrada, horas FROM shifts').fetchall():
+            self._sumar_agregados(dni, datetime.fromisoformat(entrada), horas, 1)
+
+    def _guardar_meta(self, clave, valor):
+        if valor is None:
+            self.conn.execute('DELETE FROM meta WHERE clave = ?', (clave,))
+        else:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO meta (clave, valor) VALUES (?, ?)',
+                (clave, json.dumps(valor, ensure_ascii=False))
+            )
+
+    def _avanzar_ultimo_mensaje(self, message_id):
+        """Guarda el mayor ID de mensaje aplicado (un escaneo de mensajes viejos no lo hace retroceder)"""
+        self.conn.execute(
+            "INSERT INTO meta (clave, valor) VALUES ('ultimo_mensaje', ?) "
+            "ON CONFLICT (clave) DO UPDATE SET valor = MAX(CAST(valor AS INTEGER), CAST(excluded.valor AS INTEGER))",
+            (str(message_id),)
+        )
+
+    def compactar(self, data):
+        pass  # Cada evento ya queda en su tabla
+
+    def tamano_bytes(self):
+        """Tamaño en disco de la base (incluye el WAL)"""
+        tamano = 0
+        for path in (self.path, self.path + '-wal'):
+            try:
+                tamano += os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+        return tamano
+
+    def turnos(self, desde, hasta, dni=None):
+        """Turnos completados entre dos fechas (inclusive): {fecha: {dni: [turnos]}}"""
+        consulta = 'SELECT fecha, dni, nombre, entrada, salida, horas FROM shifts WHERE fecha BETWEEN ? AND ?'
+        params = [desde, hasta]
+        if dni:
+            consulta += ' AND dni = ?'
+            params.append(dni)
+        consulta += ' ORDER BY fecha, dni, entrada'
+
+        resultado = {}
+        for fecha, dni_turno, nombre, entrada, salida, horas in self.conn.execute(consulta, params):
+            resultado.setdefault(fecha, {}).setdefault(dni_turno, []).append({
+                'entrada': datetime.fromisoformat(entrada),
+                'salida': datetime.fromisoformat(salida) if salida else None,
+                'horas': horas,
+                'nombre': nombre
+            })
+        return resultado
+
+    def filas(self, desde, hasta, dni=None, lote=1000):
+        """(fecha, dni, nombre, entrada_ms, salida_ms) del rango, de a lotes.
+
+        Usa su propia conexión de solo lectura: se puede recorrer desde otro
+        hilo (exportaciones) mientras el writer sigue escribiendo (WAL).
+        """
+        consulta = 'SELECT fecha, dni, nombre, entrada, salida, horas FROM shifts WHERE fecha BETWEEN ? AND ?'
+        params = [desde, hasta]
+        if dni:
+            consulta += ' AND dni = ?'
+            params.append(dni)
+        consulta += ' ORDER BY fecha, entrada'
+
+        conn = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True)
+        try:
+            cursor = conn.execute(consulta, params)
+            while True:
+                filas = cursor.fetchmany(lote)
+                if not filas:
+                    break
+                for fecha, dni_turno, nombre, entrada, salida, horas in filas:
+                    entrada_ms = a_ms(datetime.fromisoformat(entrada))
+                    # Turnos importados de versiones viejas pueden no tener salida: se usa la duración
+                    salida_ms = a_ms(datetime.fromisoformat(salida)) if salida else entrada_ms + round(horas * 3_600_000)
+                    yield fecha, dni_turno, nombre, entrada_ms, salida_ms
+        finally:
+            conn.close()
+
+    def importar_snapshot(self, data):
+        """Carga un snapshot con el formato de shift_data.json (o uno binario ya leído)"""
+        registros_diarios = data.get('daily_records', {})
+        if isinstance(registros_diarios, HistorialTurnos):
+            registros_diarios = registros_diarios.exportar()
+        with self.conn:
+            self._guardar_meta('scan_cursor', data.get('scan_cursor'))
+            if data.get('ultimo_mensaje'):
+                self._avanzar_ultimo_mensaje(data['ultimo_mensaje'])
+            self.conn.executemany(
+                'INSERT OR IGNORE INTO mensajes_aplicados (id) VALUES (?)',
+                [(message_id,) for message_id in data.get('mensajes_aplicados', ())]
+            )
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO active_shifts (dni, nombre, entrada) VALUES (?, ?, ?)',
+                [
+                    (dni, info['nombre'], info['entrada'])
+                    for dni, info in data.get('active_shifts', {}).items()
+                ]
+            )
+            self.conn.executemany(
+                'INSERT INTO shifts (fecha, dni, nombre, entrada, salida, horas) VALUES (?, ?, ?, ?, ?, ?)',
+                [
+                    (fecha, dni, turno.get('nombre', ''), turno['entrada'], turno['salida'], turno['horas'])
+                    for fecha, records in registros_diarios.items()
+                    for dni, turnos in records.items()
+                    for turno in turnos
+                ]
+            )
+            self._reconstruir_agregados()
+
+    def close(self):
+        self.conn.close()
+
+
+def migrar_json_a_sqlite(origen, destino):
+    """Migración única: archivo mensual + snapshot + cola del journal -> SQLite"""
+    # Primero los meses archivados: importar_snapshot pisa el cursor con el del snapshot
+    for mes in origen.archivo.meses():
+        destino.importar_snapshot({'daily_records': origen.archivo.leer(mes)})
+    data, registros = origen.leer()
+    seq = data.get('journal_seq', 0)
+    destino.importar_snapshot(data)
+    destino.escribir([record for record in registros if record['seq'] > seq])
+
+
+class PersistenceWriter:
+    """Escritor de persistencia en segundo plano.
+
+    Los handlers solo encolan cambios (registros del journal o pedidos de
+    snapshot) y vuelven enseguida. Una tarea del event loop espera una ventana
+    corta para agrupar las ráfagas y hace una sola escritura en un hilo aparte,
+    así el disco nunca bloquea el heartbeat del gateway.
+    """
+
+    def __init__(self, storage, capturar, ventana=1.0):
+        self.storage = storage
+        self.capturar = capturar  # Devuelve el estado serializable (se llama en el loop)
+        self.ventana = ventana
+        self._registros = []
+        self._snapshot_pedido = False
+        self._cambios = 0
+        self._hay_cambios = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='persistencia')
+        self._task = None
+        self.stats = {
+            'escrituras': 0,
+            'cambios_agrupados': 0,
+            'errores': 0,
+            'ultima_latencia_ms': 0.0,
+            'max_latencia_ms': 0.0
+        }
+
+    def start(self):
+        """Arranca la tarea de escritura (requiere un event loop corriendo)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def append(self, record):
+        """Encola un evento para el backend de almacenamiento"""
+        self._registros.append(record)
+        self._marcar()
+
+    def extend(self, records):
+        """Encola los eventos de un lote con un solo aviso a la tarea de escritura"""
+        self._registros.extend(records)
+        self._cambios += len(records)
+        self._hay_cambios.set()
+
+    def solicitar_snapshot(self):
+        """Pide un snapshot completo (se agrupa con los demás cambios pendientes)"""
+        self._snapshot_pedido = True
+        self._marcar()
+
+    def _marcar(self):
+        self._cambios += 1
+        self._hay_cambios.set()
+
+    async def _run(self):
+        while True:
+            await self._hay_cambios.wait()
+            # Esperar un momento para juntar todos los eventos de la ráfaga
+            await asyncio.sleep(self.ventana)
+            await self._escribir()
+
+    async def _escribir(self):
+        async with self._lock:
+            await self._escribir_pendientes()
+
+    async def _escribir_pendientes(self, al_tomar=None):
+        """Escribe lo encolado (con el lock tomado). Devuelve False si la escritura falló"""
+        self._hay_cambios.clear()
+        if al_tomar:
+            al_tomar()
+        if not self._registros and not self._snapshot_pedido:
+            return True
+        registros, self._registros = self._registros, []
+        snapshot, self._snapshot_pedido = self._snapshot_pedido, False
+        cambios, self._cambios = self._cambios, 0
+
+        loop = asyncio.get_running_loop()
+        inicio = time.perf_counter()
+        try:
+            if snapshot and self.storage.usa_snapshot:
+                # El estado capturado ya incluye los registros encolados
+                data = self.capturar()
+                await loop.run_in_executor(self._executor, self.storage.compactar, data)
+            elif registros:
+                await loop.run_in_executor(self._executor, self.storage.escribir, registros)
+        except Exception as e:
+            # Reencolar para el próximo intento; no se pierde ningún cambio
+            self._registros = registros + self._registros
+            self._snapshot_pedido = self._snapshot_pedido or snapshot
+            self._cambios += cambios
+            self._hay_cambios.set()
+            self.stats['errores'] += 1
+            metrics.PERSISTENCIA_ERRORES.inc()
+            log.exception("❌ Error al guardar datos: %s", e)
+            return False
+
+        latencia_ms = (time.perf_counter() - inicio) * 1000
+        metrics.PERSISTENCIA_SEGUNDOS.observe(latencia_ms / 1000)
+        metrics.PERSISTENCIA_CAMBIOS.inc(cambios)
+        self.stats['escrituras'] += 1
+        self.stats['cambios_agrupados'] += cambios
+        self.stats['ultima_latencia_ms'] = latencia_ms
+        self.stats['max_latencia_ms'] = max(self.stats['max_latencia_ms'], latencia_ms)
+        tipo = 'snapshot' if snapshot and self.storage.usa_snapshot else 'eventos'
+        log.debug("💾 Guardado (%s) en %.1f ms - %d cambios agrupados", tipo, latencia_ms, cambios,
+                  extra={'campos': {'latencia_ms': round(latencia_ms, 2), 'cambios': cambios}})
+        return True
+
+    async def ejecutar(self, funcion, *args):
+        """Ejecuta una consulta en el hilo de persistencia, después de las escrituras encoladas"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, funcion, *args)
+
+    async def consultar(self, funcion, *args, al_tomar=None):
+        """Escribe lo encolado y ejecuta una consulta que ve exactamente eso.
+
+        `al_tomar` se llama en el loop en el instante en que se toman los
+        pendientes: lo que se encole después ya no está en el resultado.
+        RuntimeError si la escritura falló (la consulta vería datos viejos).
+        """
+        async with self._lock:
+            if not await self._escribir_pendientes(al_tomar):
+                raise RuntimeError("no se pudieron escribir los cambios pendientes")
+            return await asyncio.get_running_loop().run_in_executor(self._executor, funcion, *args)
+
+    async def flush(self):
+        """Escribe inmediatamente todo lo pendiente"""
+        await self._escribir()
+
+    async def close(self):
+        """Detiene la tarea y hace el flush final (llamar al apagar el bot)"""
+        if self._task:
+            # Cancelar solo fuera de una escritura para no perder lo que ya se sacó de la cola
+            async with self._lock:
+                self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        self._executor.shutdown(wait=True)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] != ['migrar']:
+        print("Uso: python storage.py migrar [shift_data.json] [shift_data.db]")
+        sys.exit(1)
+    json_path = sys.argv[2] if len(sys.argv) > 2 else SNAPSHOT_FILE
+    db_path = sys.argv[3] if len(sys.argv) > 3 else SQLITE_FILE
+    destino = SqliteStorage(db_path)
+    if not destino.vacia():
+        print(f"❌ {db_path} ya tiene datos, no se migra")
+        sys.exit(1)
+    migrar_json_a_sqlite(JsonStorage(ShiftJournal(), json_path), destino)
+    destino.close()
+    print(f"✅ Datos migrados de {json_path} a {db_path}")
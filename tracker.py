@@ -0,0 +1,627 @@
+"""Núcleo de ingesta: estado de los turnos, persistencia y totales por período.
+
+No depende de discord.py: on_message, !escanear y benchmarks/replay.py aplican
+los mensajes de Servicio con las mismas funciones (parsear + aplicar_evento).
+En el bot, todas las mutaciones pasan por ColaIngesta, el único escritor.
+"""
+import asyncio
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+from operator import itemgetter
+
+import metrics
+import storage
+from aggregates import AggregateIndex, clave_semana, dias_del_periodo
+from directorio import DirectorioEmpleados
+from registros import HistorialTurnos
+from servicio_parser import ENTRADA
+
+log = logging.getLogger('horarios.tracker')
+
+DISCORD_EPOCH_MS = 1420070400000  # Los IDs de Discord (snowflakes) codifican su timestamp
+
+def _snowflake_desde(momento):
+    """Menor ID de mensaje posible para un instante dado"""
+    return (int(momento.timestamp() * 1000) - DISCORD_EPOCH_MS) << 22
+
+class ShiftTracker:
+    def __init__(self, storage_backend=None, retencion_dedupe_dias=60, retencion_historial_dias=0):
+        self.active_shifts = {}  # {dni: {'nombre': str, 'entrada': datetime}}
+        self.daily_records = HistorialTurnos()  # {fecha: {dni: [turnos]}} en columnas compactas
+        # Totales por día / semana ISO / mes y DNI, actualizados en cada salida
+        self.agregados = AggregateIndex()
+        # Empleados conocidos (DNI y nombre) para el autocompletado y los DNIs parciales
+        self.directorio = DirectorioEmpleados()
+        # Backend de persistencia (JsonStorage o SqliteStorage)
+        self.storage = storage_backend or storage.JsonStorage()
+        self.journal_seq = 0  # Último evento del journal incluido en el estado
+        self.scan_cursor = None  # Escaneo de historial en curso: {'canales', 'ultimo_id', ...}
+        # IDs de los mensajes de Discord ya aplicados: reescaneos y replays del gateway son no-ops
+        self.mensajes_aplicados = set()
+        # ID del último mensaje de Servicio aplicado: al reiniciar o reconectar se recupera desde ahí
+        self.ultimo_mensaje = None
+        self.retencion_dedupe_dias = retencion_dedupe_dias
+        self.retencion_historial_dias = retencion_historial_dias
+        self.writer = None  # PersistenceWriter: si está, las escrituras salen del event loop
+        self.version = 0  # Sube con cada cambio de turnos: invalida los reportes cacheados
+        # Sube solo con turnos cerrados y cambios de datos (no con cada entrada): la usan los
+        # reportes de períodos, que no muestran los turnos activos
+        self.version_turnos = 0
+        # Entradas que llegaron después de una entrada más nueva del mismo DNI (un escaneo
+        # por detrás del tráfico en vivo): esperan acá una salida anterior a esa entrada
+        # ('limite') sin pisar el turno activo
+        self.entradas_atrasadas = {}  # {dni: {'nombre': str, 'entrada': datetime, 'limite': datetime}}
+        self._lote = None  # Registros del lote en curso (ver lote())
+        self._lote_snapshot = False
+        self._cargando_agregados = asyncio.Lock()
+    
+    def snapshot_data(self):
+        """Copia del estado completo para persistir (no comparte objetos mutables con el tracker)"""
+        return {
+            'journal_seq': self.journal_seq,
+            'scan_cursor': dict(self.scan_cursor) if self.scan_cursor else None,
+            'mensajes_aplicados': sorted(self.mensajes_aplicados),
+            'ultimo_mensaje': self.ultimo_mensaje,
+            'active_shifts': {
+                dni: {
+                    'nombre': info['nombre'],
+                    'entrada': info['entrada'].isoformat()
+                } for dni, info in self.active_shifts.items()
+            },
+            'entradas_atrasadas': {
+                dni: {
+                    'nombre': info['nombre'],
+                    'entrada': info['entrada'].isoformat(),
+                    'limite': info['limite'].isoformat()
+                } for dni, info in self.entradas_atrasadas.items()
+            },
+            # Copia columnar (los días fríos se comparten): se serializa en el hilo del writer
+            'daily_records': self.daily_records.capturar(),
+            'aggregates': self.agregados.exportar()
+        }
+    
+    def save_data(self):
+        """Guarda un snapshot completo y compacta el journal"""
+        if self.writer:
+            # Se escribe en segundo plano, agrupado con los demás cambios
+            self.writer.solicitar_snapshot()
+        elif self.storage.usa_snapshot:
+            self.storage.compactar(self.snapshot_data())
+    
+    def load_data(self):
+        """Carga el estado guardado y reaplica los eventos pendientes del journal"""
+        # Los IDs anteriores a la retención no hacen falta: esos mensajes se ignoran igual
+        data, registros = self.storage.leer(desde_mensaje=self.limite_dedupe())
+        self.journal_seq = data.get('journal_seq', 0)
+        self.scan_cursor = data.get('scan_cursor')
+        self.mensajes_aplicados = set(data.get('mensajes_aplicados', ()))
+        # Los snapshots anteriores no lo guardaban: el mayor ID aplicado que se recuerde
+        self.ultimo_mensaje = data.get('ultimo_mensaje') or max(self.mensajes_aplicados, default=None)
+        
+        # Restaurar turnos activos
+        for dni, info in data.get('active_shifts', {}).items():
+            self.active_shifts[dni] = {
+                'nombre': info['nombre'],
+                'entrada': datetime.fromisoformat(info['entrada'])
+            }
+        self.entradas_atrasadas = {
+            dni: {
+                'nombre': info['nombre'],
+                'entrada': datetime.fromisoformat(info['entrada']),
+                'limite': datetime.fromisoformat(info['limite'])
+            } for dni, info in data.get('entradas_atrasadas', {}).items()
+        }
+        
+        # Restaurar registros diarios: del snapshot binario llegan fríos y solo se
+        # decodifica la semana actual; el resto, cuando un reporte lo pida
+        registros_diarios = data.get('daily_records', {})
+        if isinstance(registros_diarios, HistorialTurnos):
+            self.daily_records = registros_diarios
+            self.daily_records.precargar(dias_del_periodo(clave_semana(datetime.now(timezone.utc))))
+        else:
+            self.daily_records.clear()
+            self.daily_records.cargar(registros_diarios)
+        
+        # Restaurar totales por período (los snapshots anteriores se reconstruyen del historial)
+        self.agregados = AggregateIndex()
+        if not self.storage.agregados_en_memoria:
+            # Solo llegaron los períodos en curso: los demás se leen con cargar_agregados
+            self.agregados.parcial = True
+        if 'aggregates' in data:
+            self.agregados.cargar(data['aggregates'])
+        else:
+            for _, records in self.daily_records.items():
+                for dni, turnos in records.items():
+                    for turno in turnos:
+                        self.agregados.agregar(dni, turno['nombre'], turno['entrada'], turno['horas'])
+        
+        # Empleados conocidos: los que tienen totales y los que están en servicio
+        self.directorio.clear()
+        self.directorio.cargar({
+            **self.agregados.nombres, **{dni: info['nombre'] for dni, info in self.active_shifts.items()}
+        })
+        
+        # Reaplicar los eventos posteriores al snapshot
+        for record in registros:
+            if record['seq'] <= self.journal_seq:
+                continue  # Ya incluido en el snapshot
+            self._reaplicar(record)
+            self.journal_seq = record['seq']
+        self.version += 1
+        self.version_turnos += 1
+    
+    def compactar(self):
+        """Purga el índice de mensajes y los totales pasados de más, y escribe un snapshot si hay eventos pendientes"""
+        self.purgar_mensajes_aplicados()
+        self.agregados.descartar_frios()
+        if self.storage.pendientes():
+            self.save_data()
+    
+    def limite_dedupe(self, ahora=None):
+        """Menor ID de mensaje que el índice de duplicados todavía recuerda"""
+        return _snowflake_desde((ahora or datetime.now(timezone.utc)) - timedelta(days=self.retencion_dedupe_dias))
+    
+    def _fuera_de_retencion(self, message_id):
+        """True si el mensaje es más viejo que la retención: ya no se puede saber si se aplicó"""
+        if message_id < self.limite_dedupe():
+            log.debug("⏭️ Mensaje %s anterior a la retención de duplicados (%d días): se ignora",
+                      message_id, self.retencion_dedupe_dias, extra={'muestreo': True})
+            return True
+        return False
+    
+    def purgar_mensajes_aplicados(self, ahora=None):
+        """Olvida los IDs de mensajes más viejos que la retención del índice de duplicados.
+        
+        Desde ahí, registrar_entrada/registrar_salida ignoran esos mensajes: un
+        reescaneo no los vuelve a sumar.
+        """
+        limite = self.limite_dedupe(ahora)
+        viejos = [message_id for message_id in self.mensajes_aplicados if message_id < limite]
+        if viejos:
+            self.mensajes_aplicados.difference_update(viejos)
+            self._persistir_evento('purgar_mensajes', hasta=limite)
+    
+    async def archivar(self, ahora=None):
+        """Mueve los días más viejos que la retención a las particiones mensuales del archivo"""
+        if not self.retencion_historial_dias or not self.storage.archivo:
+            return 0
+        ahora = ahora or datetime.now(timezone.utc)
+        limite = (ahora - timedelta(days=self.retencion_historial_dias)).strftime('%Y-%m-%d')
+        viejos = sorted(fecha for fecha in self.daily_records.fechas() if fecha < limite)
+        if not viejos:
+            return 0
+        
+        cantidades = {fecha: len(self.daily_records.dias[fecha]) for fecha in viejos}
+        for mes, turnos in self.daily_records.separar_por_mes(viejos).items():
+            if self.writer:
+                await self.writer.ejecutar(self.storage.archivo.guardar, mes, turnos)
+            else:
+                self.storage.archivo.guardar(mes, turnos)
+        
+        # Solo se quita lo que se archivó: un escaneo pudo agregar turnos a esos días mientras tanto
+        for fecha, cantidad in cantidades.items():
+            self.daily_records.descartar(fecha, cantidad)
+        # Si se cae antes de este snapshot, esos días quedan en los dos lados y se unen sin repetirse
+        self.save_data()
+        archivados = sum(cantidades.values())
+        log.info("📦 %d turnos de %d días archivados (anteriores a %s)", archivados, len(viejos), limite)
+        return archivados
+    
+    def _reaplicar(self, record):
+        tipo = record['tipo']
+        if 'mid' in record:
+            self._marcar_aplicado(record['mid'])
+        if tipo == 'entrada':
+            self._aplicar_entrada(record['dni'], record['nombre'], datetime.fromisoformat(record['ts']))
+        elif tipo == 'salida':
+            self._reaplicar_salida(record)
+        elif tipo == 'reset_semana':
+            pass  # Journals anteriores a los totales por período: la semana ya no se resetea
+        elif tipo == 'limpiar':
+            self._limpiar_memoria()
+        elif tipo == 'cursor_escaneo':
+            self.scan_cursor = record['cursor']
+        elif tipo == 'purgar_mensajes':
+            self.mensajes_aplicados = {
+                message_id for message_id in self.mensajes_aplicados if message_id >= record['hasta']
+            }
+    
+    def _reaplicar_salida(self, record):
+        """Cierra el turno que cerró el registro: si trae su entrada y no es la del turno activo, era una atrasada"""
+        dni, nombre, salida = record['dni'], record['nombre'], datetime.fromisoformat(record['ts'])
+        activo = self.active_shifts.get(dni)
+        entrada = datetime.fromisoformat(record['entrada']) if 'entrada' in record else None
+        if entrada is None or (activo and activo['entrada'] == entrada):
+            self._aplicar_salida(dni, nombre, salida)
+            return
+        atrasada = self.entradas_atrasadas.get(dni)
+        if atrasada and atrasada['entrada'] == entrada:
+            del self.entradas_atrasadas[dni]
+        self._cerrar_turno(dni, nombre, entrada, salida)
+    
+    def _persistir_evento(self, tipo, dni=None, nombre=None, momento=None, message_id=None, **datos):
+        """Persiste un evento en el backend o, sin journal, el snapshot completo (uno por lote)"""
+        if not self.storage.registra_eventos:
+            if self._lote is not None:
+                self._lote_snapshot = True
+            else:
+                self.save_data()
+            return
+        self.journal_seq += 1
+        record = {'seq': self.journal_seq, 'tipo': tipo, **datos}
+        if dni:
+            record.update(dni=dni, nombre=nombre, ts=momento.isoformat())
+        if message_id is not None:
+            record['mid'] = message_id
+        if self._lote is not None:
+            self._lote.append(record)
+        elif self.writer:
+            self.writer.append(record)
+        else:
+            self.storage.escribir([record])
+    
+    @contextmanager
+    def lote(self):
+        """Agrupa lo que se persiste dentro del bloque en una sola escritura (o un solo snapshot)"""
+        if self._lote is not None:
+            yield
+            return
+        self._lote, self._lote_snapshot = [], False
+        try:
+            yield
+        finally:
+            registros, self._lote = self._lote, None
+            if self._lote_snapshot:
+                self.save_data()
+            elif registros and self.writer:
+                self.writer.extend(registros)
+            elif registros:
+                self.storage.escribir(registros)
+    
+    def _aplicar_entrada(self, dni, nombre, entrada):
+        """Abre el turno activo. Devuelve True si la entrada quedó aparte como atrasada"""
+        if self.directorio.agregar(dni, nombre):
+            self.version_turnos += 1  # Empleado nuevo o renombrado: cambia el ranking con 0h
+        activo = self.active_shifts.get(dni)
+        if activo and activo['entrada'] > entrada:
+            self.entradas_atrasadas[dni] = {'nombre': nombre, 'entrada': entrada, 'limite': activo['entrada']}
+            return True
+        self.active_shifts[dni] = {
+            'nombre': nombre,
+            'entrada': entrada
+        }
+        self.version += 1
+        return False
+    
+    def _aplicar_salida(self, dni, nombre, salida):
+        activo = self.active_shifts.get(dni)
+        if activo is None or salida < activo['entrada']:
+            # Sin turno activo anterior a la salida: solo puede cerrar una entrada atrasada
+            atrasada = self.entradas_atrasadas.get(dni)
+            if atrasada is None or not atrasada['entrada'] <= salida < atrasada['limite']:
+                return None
+            del self.entradas_atrasadas[dni]
+            return self._cerrar_turno(dni, nombre, atrasada['entrada'], salida)
+        
+        turno = self._cerrar_turno(dni, nombre, activo['entrada'], salida)
+        # Remover del turno activo
+        del self.active_shifts[dni]
+        return turno
+    
+    def _cerrar_turno(self, dni, nombre, entrada, salida):
+        horas_trabajadas = (salida - entrada).total_seconds() / 3600
+        
+        # Guardar en registros diarios (con SQLite el turno queda solo en la base)
+        fecha_str = entrada.strftime('%Y-%m-%d')
+        if self.storage.historial_en_memoria:
+            self.daily_records.agregar(fecha_str, dni, nombre, entrada, salida)
+        
+        # Actualizar totales del día, la semana y el mes
+        self.agregados.agregar(dni, nombre, entrada, horas_trabajadas)
+        self.version += 1
+        self.version_turnos += 1
+        
+        return {
+            'entrada': entrada,
+            'salida': salida,
+            'horas': horas_trabajadas
+        }
+    
+    def _limpiar_memoria(self):
+        self.active_shifts.clear()
+        self.entradas_atrasadas.clear()
+        self.directorio.clear()
+        self.daily_records.clear()
+        self.agregados.limpiar()
+        self.scan_cursor = None
+        self.mensajes_aplicados.clear()
+        self.ultimo_mensaje = None
+        self.version += 1
+        self.version_turnos += 1
+    
+    def _marcar_aplicado(self, message_id):
+        self.mensajes_aplicados.add(message_id)
+        if self.ultimo_mensaje is None or message_id > self.ultimo_mensaje:
+            self.ultimo_mensaje = message_id
+    
+    def registrar_entrada(self, dni, nombre, momento=None, message_id=None):
+        """Registra la entrada de un empleado (por defecto, ahora).
+        
+        Devuelve None si el mensaje de origen ya se había aplicado (o es anterior
+        a la retención del índice de duplicados).
+        """
+        if message_id is not None:
+            if message_id in self.mensajes_aplicados or self._fuera_de_retencion(message_id):
+                return None
+            self._marcar_aplicado(message_id)
+        ahora = momento or datetime.now(timezone.utc)
+        # Una entrada atrasada no reemplaza al turno activo: el backend no debe pisarlo
+        datos = {'atrasada': True} if self._aplicar_entrada(dni, nombre, ahora) else {}
+        self._persistir_evento('entrada', dni, nombre, ahora, message_id, **datos)
+        metrics.EVENTOS_APLICADOS.inc(valor_etiqueta='entrada')
+        return ahora
+    
+    def registrar_salida(self, dni, nombre, momento=None, message_id=None):
+        """Registra la salida de un empleado y calcula las horas.
+        
+        Devuelve None si no había turno activo o si el mensaje ya se había aplicado
+        (o es anterior a la retención del índice de duplicados).
+        """
+        if message_id is not None and (message_id in self.mensajes_aplicados or self._fuera_de_retencion(message_id)):
+            return None
+        turno = self._aplicar_salida(dni, nombre, momento or datetime.now(timezone.utc))
+        if turno:
+            if message_id is not None:
+                self._marcar_aplicado(message_id)
+            # Con la entrada del turno cerrado: puede no ser el activo (una entrada atrasada)
+            self._persistir_evento(
+                'salida', dni, nombre, turno['salida'], message_id, entrada=turno['entrada'].isoformat()
+            )
+            metrics.EVENTOS_APLICADOS.inc(valor_etiqueta='salida')
+        return turno
+    
+    def limpiar(self):
+        """Elimina todos los datos (también el archivo mensual)"""
+        self._limpiar_memoria()
+        self._persistir_evento('limpiar')
+        if self.storage.archivo:
+            self.storage.archivo.borrar()
+    
+    def guardar_cursor_escaneo(self, cursor):
+        """Guarda el progreso de !escanear (None al terminar)"""
+        self.scan_cursor = dict(cursor) if cursor else None
+        self._persistir_evento('cursor_escaneo', cursor=self.scan_cursor)
+    
+    async def cargar_agregados(self, claves):
+        """Trae de la base los buckets de `claves` que no están en memoria (SQLite), antes de consultarlos.
+
+        Con el writer la lectura corre en su hilo después de escribir lo
+        encolado; los turnos que cierran mientras tanto se suman al llegar.
+        """
+        async with self._cargando_agregados:
+            faltantes = self.agregados.faltantes(claves)
+            if not faltantes:
+                return
+            try:
+                if self.writer:
+                    buckets = await self.writer.consultar(
+                        self.storage.leer_agregados, faltantes,
+                        al_tomar=lambda: self.agregados.iniciar_carga(faltantes)
+                    )
+                else:
+                    buckets = self.storage.leer_agregados(faltantes)
+                for clave in faltantes:
+                    self.agregados.completar_carga(clave, buckets[clave])
+            finally:
+                # Si la lectura falló o se canceló, los turnos anotados ya están en la base
+                self.agregados.cancelar_carga(faltantes)
+    
+    async def turnos(self, desde, hasta, dni=None):
+        """Turnos completados entre dos fechas 'YYYY-MM-DD' (inclusive): {fecha: {dni: [turnos]}}"""
+        if self.storage.historial_en_memoria:
+            resultado = {}
+            for fecha in self.daily_records.fechas():
+                if desde <= fecha <= hasta:
+                    records = self.daily_records.dia(fecha, dni)
+                    if records:
+                        resultado[fecha] = records
+            archivo = self.storage.archivo
+            if archivo and desde < min(self.daily_records.fechas(), default='9999-99-99'):
+                # Solo se abren las particiones de los meses del rango
+                if self.writer:
+                    archivados = await self.writer.ejecutar(archivo.turnos, desde, hasta, dni)
+                else:
+                    archivados = archivo.turnos(desde, hasta, dni)
+                _unir_turnos(resultado, archivados)
+            return resultado
+        
+        if not self.writer:
+            return self.storage.turnos(desde, hasta, dni)
+        # Consulta indexada fuera del event loop, después de escribir lo encolado
+        await self.writer.flush()
+        return await self.writer.ejecutar(self.storage.turnos, desde, hasta, dni)
+    
+    def filas_exportacion(self, desde, hasta, dni=None):
+        """Iterador de (fecha, dni, nombre, entrada_ms, salida_ms) del rango para recorrer en otro hilo.
+        
+        Los días en memoria se copian acá (son pocos: los acota la retención); el
+        archivo mensual y SQLite se leen recién al iterar, con su propio acceso.
+        """
+        if not self.storage.historial_en_memoria:
+            return self.storage.filas(desde, hasta, dni)
+        memoria = {}
+        for fecha in self.daily_records.fechas():
+            if desde <= fecha <= hasta:
+                memoria[fecha] = sorted(
+                    (fila for fila in self.daily_records.filas(fecha) if dni is None or fila[0] == dni),
+                    key=itemgetter(2)
+                )
+        archivo = storage.ArchivoMensual(self.storage.archivo.carpeta)
+        return _unir_filas(memoria, archivo.filas(desde, hasta, dni))
+    
+    async def turnos_del_dia(self, fecha, dni=None):
+        """Turnos completados de un día: {dni: [turnos]}"""
+        return (await self.turnos(fecha, fecha, dni)).get(fecha, {})
+
+def _unir_turnos(resultado, archivados):
+    """Suma los turnos archivados a los de memoria (un día puede quedar en ambos si se cortó el archivado)"""
+    for fecha, records in archivados.items():
+        destino = resultado.setdefault(fecha, {})
+        for dni, turnos in records.items():
+            actuales = destino.setdefault(dni, [])
+            vistos = {turno.entrada_ms for turno in actuales}
+            actuales.extend(turno for turno in turnos if turno.entrada_ms not in vistos)
+            actuales.sort(key=lambda turno: turno.entrada_ms)
+
+def _unir_filas(memoria, archivadas):
+    """Mezcla por fecha las filas archivadas (ya ordenadas) con los días en memoria, sin repetir turnos"""
+    pendientes = sorted(memoria)
+    for fecha, grupo in groupby(archivadas, key=itemgetter(0)):
+        while pendientes and pendientes[0] < fecha:
+            dia = pendientes.pop(0)
+            yield from ((dia, *fila) for fila in memoria[dia])
+        filas = list(grupo)
+        if pendientes and pendientes[0] == fecha:
+            vistos = {(fila[1], fila[3]) for fila in filas}
+            filas.extend(
+                (fecha, *fila) for fila in memoria[pendientes.pop(0)] if (fila[0], fila[2]) not in vistos
+            )
+        filas.sort(key=itemgetter(3))  # Cada día en orden de entrada
+        yield from filas
+    for dia in pendientes:
+        yield from ((dia, *fila) for fila in memoria[dia])
+
+def aplicar_evento(tracker, evento, momento=None, message_id=None):
+    """Aplica un ServicioEvent al tracker.
+
+    Devuelve el momento de la entrada, el turno cerrado por la salida o None si
+    no cambió nada (mensaje ya aplicado o salida sin turno activo).
+    """
+    metrics.MENSAJES_PARSEADOS.inc(valor_etiqueta=evento.tipo)
+    if evento.tipo == ENTRADA:
+        return tracker.registrar_entrada(evento.dni, evento.nombre, momento, message_id)
+    return tracker.registrar_salida(evento.dni, evento.nombre, momento, message_id)
+
+# Tipos de comando de ColaIngesta
+_EVENTOS = 'eventos'
+_FUNCION = 'funcion'
+
+class ColaIngesta:
+    """Único escritor del tracker: on_message, !escanear y las tareas periódicas encolan acá.
+    
+    Una sola tarea toma lo encolado de a lotes, aplica los eventos ordenados por el
+    momento del mensaje de origen y persiste una vez por lote. Un escaneo y el
+    tráfico en vivo nunca se intercalan a mitad de un cambio, y las ráfagas se
+    aplican con una escritura en lugar de una por evento.
+    """
+    
+    def __init__(self, tracker, max_lote=500):
+        self.tracker = tracker
+        self.max_lote = max_lote
+        self._cola = asyncio.Queue()
+        self._tarea = None
+    
+    def start(self):
+        if self._tarea is None or self._tarea.done():
+            self._tarea = asyncio.get_running_loop().create_task(self._procesar())
+    
+    def __len__(self):
+        return self._cola.qsize()
+    
+    async def aplicar(self, evento, momento, message_id=None):
+        """Aplica un ServicioEvent en su turno; devuelve lo mismo que aplicar_evento"""
+        return (await self.aplicar_lote([(evento, momento, message_id)]))[0]
+    
+    async def aplicar_lote(self, eventos):
+        """Aplica (evento, momento, message_id) en orden de momento; devuelve los resultados en el orden recibido"""
+        ahora = datetime.now(timezone.utc)
+        return await self._encolar(_EVENTOS, [
+            (evento, momento or ahora, message_id) for evento, momento, message_id in eventos
+        ])
+    
+    async def ejecutar(self, funcion, *args):
+        """Ejecuta otra mutación del tracker (limpiar, cursor, archivar...) en su turno; puede ser async"""
+        return await self._encolar(_FUNCION, (funcion, args))
+    
+    async def _encolar(self, tipo, datos):
+        self.start()  # Por si algo llega antes de Servidor.iniciar(): la cola nunca queda sin consumidor
+        futuro = asyncio.get_running_loop().create_future()
+        self._cola.put_nowait((tipo, datos, futuro))
+        return await futuro
+    
+    async def _procesar(self):
+        while True:
+            comandos = [await self._cola.get()]
+            while len(comandos) < self.max_lote and not self._cola.empty():
+                comandos.append(self._cola.get_nowait())
+            try:
+                await self._aplicar(comandos)
+            except Exception as e:
+                # Falló la persistencia del lote: que se enteren quienes esperaban, la cola sigue
+                log.exception("❌ Error en el lote de ingesta: %s", e)
+                for _, _, futuro in comandos:
+                    if not futuro.done():
+                        futuro.set_exception(e)
+    
+    async def _aplicar(self, comandos):
+        # Los eventos entre dos funciones se aplican juntos; las funciones respetan su lugar en la cola
+        eventos = []
+        for tipo, datos, futuro in comandos:
+            if tipo == _EVENTOS:
+                eventos.append((datos, futuro))
+                continue
+            self._aplicar_eventos(eventos)
+            eventos = []
+            funcion, args = datos
+            try:
+                resultado = funcion(*args)
+                if asyncio.iscoroutine(resultado):
+                    resultado = await resultado
+            except Exception as e:
+                if not futuro.done():
+                    futuro.set_exception(e)
+                continue
+            if not futuro.done():
+                futuro.set_result(resultado)
+        self._aplicar_eventos(eventos)
+    
+    def _aplicar_eventos(self, comandos):
+        if not comandos:
+            return
+        resultados = [[None] * len(eventos) for eventos, _ in comandos]
+        orden = sorted(
+            (momento, message_id or 0, i, j, evento)
+            for i, (eventos, _) in enumerate(comandos)
+            for j, (evento, momento, message_id) in enumerate(eventos)
+        )
+        if orden:
+            metrics.INGESTA_LOTE.observe(len(orden))
+        errores = {}
+        with self.tracker.lote():
+            for momento, message_id, i, j, evento in orden:
+                try:
+                    resultados[i][j] = aplicar_evento(self.tracker, evento, momento, message_id or None)
+                except Exception as e:
+                    log.exception("❌ Error al aplicar el evento %s de %s", evento.tipo, evento.dni)
+                    errores.setdefault(i, e)
+        for i, (_, futuro) in enumerate(comandos):
+            if futuro.done():
+                continue  # Quien lo esperaba se canceló
+            if i in errores:
+                futuro.set_exception(errores[i])
+            else:
+                futuro.set_result(resultados[i])
+    
+    async def close(self):
+        """Aplica lo que quedó en la cola y detiene la tarea"""
+        if self._tarea is None:
+            return
+        await self.ejecutar(lambda: None)
+        self._tarea.cancel()
+        try:
+            await self._tarea
+        except asyncio.CancelledError:
+            pass
+        self._tarea = None